@@ -0,0 +1,269 @@
+'''pytez的无界面性能基准
+
+每个用例在一组规模(默认10到100000)下运行，取多次重复的最短时间，结果以JSON输出。
+以bytes_开头的用例记录每个node占用的字节数而不是时间，超过MEMORY_BUDGETS中的上限时以非零状态退出。
+使用 --compare 与保存的基准结果比较，耗时超过 基准 * threshold 的用例会被标记为退化，并以非零状态退出。
+
+    python bench/benchmark.py --save baseline.json
+    python bench/benchmark.py --compare baseline.json --threshold 1.25
+'''
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+
+import matplotlib
+matplotlib.use("Agg")
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","scr"))
+from canvas import Canvas
+from utilities import codes_vects_to_segment,segment_to_CV
+
+
+def _polygon(n):
+    t = np.linspace(0,2*np.pi,max(n,3),endpoint=False)
+    xy = np.stack([np.cos(t),np.sin(t)],axis=1) * (1 + 0.1*np.cos(5*t))[:,None]
+    return np.concatenate([xy,xy[:1]])
+
+# 用例: setup(n) -> 需要计时的无参函数
+def bench_circle(n):
+    cv = Canvas()
+    return lambda : [cv.circle((i,0),radius=0.4) for i in range(n)]
+def bench_arc(n):
+    cv = Canvas()
+    return lambda : [cv.arc((i,0),start=0,delta="120deg",radius=0.4) for i in range(n)]
+def bench_polyline(n):
+    cv = Canvas()
+    return lambda : [cv.line((i,0),(i+0.5,1),(i+1,0)) for i in range(n)]
+def bench_bezier(n):
+    cv = Canvas()
+    return lambda : [cv.bezier((i,0),(i+1,0),(i+0.5,1)) for i in range(n)]
+def bench_circles(n):
+    cv = Canvas()
+    centers = np.stack([np.arange(n),np.zeros(n)],axis=1)
+    return lambda : cv.circles(centers,radii=0.4)
+def bench_place(n):
+    cv = Canvas()
+    with cv.symbol("part") as sym:
+        cv.rect((0,0),(2,1),name="body")
+        cv.line((-1,0.5),(0,0.5))
+        cv.circle((1,0.5),radius=0.3)
+    return lambda : [cv.place(sym,(i,0)) for i in range(n)]
+def bench_connect(n):
+    cv = Canvas()
+    side = int(np.ceil(np.sqrt(n)))
+    for i in range(n):
+        cv.rect((3*(i % side),3*(i // side)),(3*(i % side) + 1,3*(i // side) + 1),name=f"n{i}")
+    cv.get_router()
+    return lambda : [cv.connect(f"n{i}",f"n{(i*7 + side + 1) % n}") for i in range(n)]
+def bench_intersections(n):
+    cv = Canvas()
+    x = np.linspace(0,n/6,n + 1)
+    cv.line(*np.stack([x,np.sin(x)],axis=1),name="a")
+    cv.line(*np.stack([x,np.cos(x)],axis=1),name="b")
+    return lambda : cv.intersections("a","b")
+def bench_decorate(n):
+    cv = Canvas()
+    x = np.linspace(0,n/10,1001)
+    cv.line(*np.stack([x,np.sin(x)],axis=1),name="a")
+    return lambda : cv.decorate("a","|",count=n)
+def bench_text(n):
+    cv = Canvas()
+    labels = [f"L{i}" for i in range(100)]
+    return lambda : [cv.text((i,0),labels[i % 100]) for i in range(n)]
+def bench_plot(n):
+    cv = Canvas()
+    return lambda : cv.plot(lambda x : np.sin(x) * np.exp(-x / n),(0,n),samples=max(n // 10,8))
+def bench_styleclass(n):
+    cv = Canvas(stylesheet=os.path.join(os.path.dirname(os.path.abspath(__file__)),"..",".pytez_style.json"))
+    return lambda : [cv.circle((i,0),radius=0.4,styleclass="highlight") for i in range(n)]
+def bench_mark(n):
+    cv = Canvas()
+    return lambda : [cv.mark((i,0),(i+1,0),symbol=">") for i in range(n)]
+
+def _anchor_node():
+    cv = Canvas()
+    return cv.rect((0,0),(10,10),name="rect")
+def bench_anchor_percent(n):
+    node = _anchor_node()
+    return lambda : [node.calculate_anchors("20%") for i in range(n)]
+def bench_anchor_length(n):
+    node = _anchor_node()
+    return lambda : [node.calculate_anchors(15) for i in range(n)]
+def bench_anchor_angle(n):
+    node = _anchor_node()
+    return lambda : [node.calculate_anchors("30deg") for i in range(n)]
+
+def bench_codes_vects_to_segment(n):
+    vects = _polygon(n)
+    codes = [1] + [2] * (len(vects) - 1)
+    return lambda : codes_vects_to_segment(list(codes),vects)
+def bench_segment_to_CV(n):
+    segment = [("line",*_polygon(n))]
+    return lambda : segment_to_CV(segment)
+def bench_get_point_by_rad(n):
+    cv = Canvas()
+    node = cv.line(*_polygon(n))
+    return lambda : node.get_point_by_rad(np.radians(30))
+
+def bench_nodes_at(n):
+    cv = Canvas()
+    for i in range(100):
+        cv.circle((i % 10,i // 10),radius=0.4)
+    points = np.random.default_rng(0).uniform(-0.5,9.5,(n,2))
+    return lambda : cv.nodes_at(points)
+
+def bench_render(n):
+    cv = Canvas()
+    side = int(np.ceil(np.sqrt(n)))
+    for i in range(n):
+        cv.circle((i % side,i // side),radius=0.4)
+    cv.autoscale()
+    return lambda : cv.ax.get_figure().canvas.draw()
+
+CASES = {
+    "circle":bench_circle,
+    "arc":bench_arc,
+    "polyline":bench_polyline,
+    "bezier":bench_bezier,
+    "circles":bench_circles,
+    "place":bench_place,
+    "connect":bench_connect,
+    "intersections":bench_intersections,
+    "decorate":bench_decorate,
+    "text":bench_text,
+    "plot":bench_plot,
+    "styleclass":bench_styleclass,
+    "mark":bench_mark,
+    "anchor_percent":bench_anchor_percent,
+    "anchor_length":bench_anchor_length,
+    "anchor_angle":bench_anchor_angle,
+    "codes_vects_to_segment":bench_codes_vects_to_segment,
+    "segment_to_CV":bench_segment_to_CV,
+    "get_point_by_rad":bench_get_point_by_rad,
+    "nodes_at":bench_nodes_at,
+    "render":bench_render,
+}
+
+# 内存用例: measure(n) -> 每个node的字节数
+def bytes_node(n):
+    cv = Canvas()
+    try:
+        tracemalloc.start()
+        nodes = [cv.get_path_node_in_abspos([("line",(i,0),(i+1,0),(i+1,1),(i,0))]) for i in range(n)]
+        current,_ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return current / len(nodes)
+
+MEMORY_CASES = {
+    "bytes_node":bytes_node,
+}
+# 每个node字节数的上限，超出时以非零状态退出。只检查n >= 1000的规模，较小的规模中固定开销占比过大
+MEMORY_BUDGETS = {
+    "bytes_node":5120, # n=1000时实测约4700(使用__slots__之前约6266)
+}
+
+def run_case(setup,n,repeat):
+    '''返回repeat次运行中最短的时间,每次重新setup'''
+    best = float("inf")
+    for _ in range(repeat):
+        func = setup(n)
+        t = time.perf_counter()
+        func()
+        best = min(best,time.perf_counter() - t)
+        plt.close("all")
+    return best
+
+def run(cases,sizes,repeat=3,budget=30.0):
+    '''运行基准，预计耗时超过budget秒的规模会被跳过'''
+    results = {}
+    for name in cases:
+        results[name] = {}
+        last = None
+        if name in MEMORY_CASES:
+            for n in sizes:
+                if n > 10000: continue # 内存占用按单个node计，更大的规模没有意义
+                results[name][str(n)] = b = MEMORY_CASES[name](n)
+                plt.close("all")
+                print(f"{name:>24} n={n:<7} {b:10.1f} B/node",file=sys.stderr)
+            continue
+        for n in sizes:
+            if last is not None and last[1] * n / last[0] * repeat > budget:
+                print(f"{name:>24} n={n:<7} skipped (budget)",file=sys.stderr)
+                continue
+            t = run_case(CASES[name],n,repeat)
+            results[name][str(n)] = t
+            last = (n,t)
+            print(f"{name:>24} n={n:<7} {t*1e3:10.3f} ms",file=sys.stderr)
+    return {
+        "meta":{
+            "python":platform.python_version(),
+            "numpy":np.__version__,
+            "matplotlib":matplotlib.__version__,
+            "platform":platform.platform(),
+            "repeat":repeat,
+        },
+        "results":results,
+    }
+
+def compare(results,baseline,threshold=1.25):
+    '''返回退化的用例 [(case,size,value,baseline_value)]'''
+    regressions = []
+    for name,times in results["results"].items():
+        base = baseline["results"].get(name,{})
+        for n,t in times.items():
+            if n in base and t > base[n] * threshold:
+                regressions.append((name,n,t,base[n]))
+    return regressions
+
+def check_memory(results):
+    '''返回超出MEMORY_BUDGETS的内存用例 [(case,size,value,budget)]'''
+    over = []
+    for name,budget in MEMORY_BUDGETS.items():
+        for n,b in results["results"].get(name,{}).items():
+            if int(n) >= 1000 and b > budget: over.append((name,n,b,budget))
+    return over
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__,formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases",default=",".join([*CASES,*MEMORY_CASES]),help="逗号分隔的用例名")
+    parser.add_argument("--sizes",default="10,100,1000,10000,100000",help="逗号分隔的规模")
+    parser.add_argument("--repeat",type=int,default=3)
+    parser.add_argument("--budget",type=float,default=30.0,help="单个规模预计耗时(秒)的上限")
+    parser.add_argument("--save",help="将结果保存为JSON文件")
+    parser.add_argument("--compare",help="与之比较的基准JSON文件")
+    parser.add_argument("--threshold",type=float,default=1.25,help="超过基准耗时的该倍数视为退化")
+    args = parser.parse_args(argv)
+
+    cases = [c for c in args.cases.split(",") if c]
+    for c in cases:
+        if c not in CASES and c not in MEMORY_CASES: parser.error(f"{c}不是已有的用例,已有用例:{(*CASES,*MEMORY_CASES)}")
+    sizes = [int(n) for n in args.sizes.split(",") if n]
+    results = run(cases,sizes,repeat=args.repeat,budget=args.budget)
+    if args.save:
+        with open(args.save,"w") as f:
+            json.dump(results,f,indent=2)
+    else:
+        json.dump(results,sys.stdout,indent=2)
+        print()
+    status = 0
+    for name,n,b,budget in check_memory(results):
+        print(f"OVER BUDGET {name} n={n}: {b:.1f} > {budget} B/node",file=sys.stderr)
+        status = 1
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(results,baseline,args.threshold)
+        for name,n,t,b in regressions:
+            print(f"REGRESSION {name} n={n}: {t:.6g} > {b:.6g} x {args.threshold}",file=sys.stderr)
+        if regressions: status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -35,20 +35,80 @@ def ctrls_to_coef(*ctrls):
         case _:
             raise ValueError(f"长度为{len(ctrls)}的控制点序列暂不支持，只支持2,4")
     
+def ctrls_to_coefs(P):
+    '''ctrls_to_coef的批量版本，P:(M,2,2)的直线或(M,4,2)的三次曲线控制点，返回(M,2,4)'''
+    P = np.asarray(P,dtype=float)
+    coefs = np.zeros((len(P),2,4))
+    match P.shape[1]:
+        case 2:
+            coefs[:,:,0],coefs[:,:,1] = P[:,0],P[:,1] - P[:,0]
+        case 4:
+            A = np.array([[1,-3,3,-1],
+                          [0,3,-6,3],
+                          [0,0,3,-3],
+                          [0,0,0, 1]])
+            coefs[:] = np.einsum("mjd,jk->mdk",P,A)
+        case _:
+            raise ValueError(f"长度为{P.shape[1]}的控制点序列暂不支持，只支持2,4")
+    return coefs
+
 def segment_to_coefs(segment):
     '''将segment转为控制点序列的序列,(N,2,4)'''
+    coeficients = []
+    cubics = [] # 连续的cubic一次求出
     for seg in segment:
-        coeficients = []
-        for seg in segment:
-            match seg[0]:
-                case "line":
-                    for i in range(1,len(seg)-1):
-                        coeficients.append(ctrls_to_coef(*seg[i:i+2]))
-                case "cubic":
-                    coeficients.append(ctrls_to_coef(*seg[1:]))
-                case _:
-                    raise ValueError(f"{seg[0]}不是支持的segment类型")
-        return np.array(coeficients,dtype=float)
+        match seg[0]:
+            case "line": # 折线的各段一次求出
+                if cubics: coeficients.append(ctrls_to_coefs(cubics)); cubics = []
+                P = np.array(seg[1:],dtype=float).reshape(-1,2)
+                coef = np.zeros((len(P)-1,2,4))
+                coef[:,:,0],coef[:,:,1] = P[:-1],P[1:] - P[:-1]
+                coeficients.append(coef)
+            case "cubic":
+                if len(seg) != 5: raise ValueError("cubic类型路径有且仅有四个顶点")
+                cubics.append(seg[1:])
+            case _:
+                raise ValueError(f"{seg[0]}不是支持的segment类型")
+    if cubics: coeficients.append(ctrls_to_coefs(cubics))
+    if not coeficients: return np.zeros((0,2,4))
+    return np.concatenate(coeficients,axis=0).astype(float)
+
+def coefs_to_bboxes(coefs):
+    '''返回每段曲线精确的边框(N,2,2)，[:,0]为(xmin,ymin)，[:,1]为(xmax,ymax)
+
+    极值点为导数 c1 + 2c2 t + 3c3 t^2 在(0,1)内的根，所有段的根在一次向量化计算中求出。
+    '''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    a,b,c = 3*coefs[...,3],2*coefs[...,2],coefs[...,1] # (N,2)
+    delta = b**2 - 4*a*c
+    sqrt_delta = np.sqrt(np.where(delta > 0,delta,0))
+    quadratic = ~np.isclose(a,0,atol=1e-12 * (np.abs(b) + np.abs(c) + 1))
+    with np.errstate(divide="ignore",invalid="ignore"):
+        r1 = np.where(quadratic,(-b + sqrt_delta)/(2*a),-c/b)
+        r2 = np.where(quadratic,(-b - sqrt_delta)/(2*a),np.nan)
+    r1 = np.where(quadratic & (delta < 0),np.nan,r1)
+    r2 = np.where(quadratic & (delta < 0),np.nan,r2)
+    ts = np.stack([np.zeros_like(a),np.ones_like(a),r1,r2],axis=-1) # (N,2,4)
+    ts = np.where((ts >= 0) & (ts <= 1),ts,0) # 无效的根以端点代替
+    values = coefs[...,0,None] + ts*(coefs[...,1,None] + ts*(coefs[...,2,None] + ts*coefs[...,3,None]))
+    return np.stack([values.min(axis=2),values.max(axis=2)],axis=1)
+
+def coefs_to_bbox(coefs):
+    '''返回曲线精确的边框((xmin,ymin),(xmax,ymax))，coefs:(N,2,4)'''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    if len(coefs) == 0: raise ValueError("空的coefs没有边框")
+    bboxes = coefs_to_bboxes(coefs)
+    vmin,vmax = bboxes[:,0].min(axis=0),bboxes[:,1].max(axis=0)
+    return (vmin[0],vmin[1]),(vmax[0],vmax[1])
+
+def transform_coefs(coefs,mat):
+    '''对(N,2,4)的系数施加仿射变换mat(3,3)，多项式系数对仿射变换是线性的'''
+    coefs = np.asarray(coefs,dtype=float)
+    if len(coefs) == 0: return coefs
+    mat = np.asarray(mat,dtype=float)
+    coefs = np.einsum("ij,njk->nik",mat[:2,:2],coefs)
+    coefs[:,:,0] += mat[:2,2]
+    return coefs
 
 def coefs_to_area(coefs):
     area = 0
@@ -80,14 +140,103 @@ def coefs_to_length_and_nodeweight(coefs):
         r = quad(lambda t : np.sqrt((dx_t(t) ** 2 + dy_t(t) ** 2)),0,1)
         error += r[1]
         lengths.append(r[0])
-    lengths = np.array(lengths)
+    lengths = np.array(lengths,dtype=float)
     L = lengths.sum()
-    nodeweights = []
-    for i in range(1,len(lengths)+1):
-        nodeweights.append(lengths[:i].sum())
-    nodeweights = [nw/L for nw in nodeweights]
+    nodeweights = np.cumsum(lengths) / L
     return L , nodeweights,error
 
+def get_flatten_counts(coefs,tolerance):
+    '''返回每一段展开为折线所需的等分数，保证折线与曲线的距离不超过tolerance
+
+    二阶导数 2c2 + 6c3 t 对t是线性的，其模在[0,1]上的最大值M在端点取得，n等分的弦高误差不超过 M/(8n^2)。
+    '''
+    if tolerance <= 0: raise ValueError(f"{tolerance}不是合法的tolerance值,必需为正数")
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    d0 = 2*coefs[...,2]
+    d1 = d0 + 6*coefs[...,3]
+    M = np.maximum(np.hypot(*d0.T),np.hypot(*d1.T))
+    return np.maximum(np.ceil(np.sqrt(M/(8*tolerance))),1).astype(int)
+
+def flatten_coefs(coefs,tolerance,return_t=False):
+    '''将(N,2,4)的曲线展开为折线，所有采样点在一次广播中求值。
+
+    返回 (vertices,offsets)：第i段的采样点为 vertices[offsets[i]:offsets[i+1]]，包含两个端点。
+    return_t为True时额外返回各采样点在所在段内的参数t。
+    '''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    counts = get_flatten_counts(coefs,tolerance) + 1 # 每段的采样点数
+    offsets = np.concatenate([[0],np.cumsum(counts)])
+    index = np.repeat(np.arange(len(coefs)),counts)
+    t = (np.arange(offsets[-1]) - offsets[index]) / (counts[index] - 1)
+    c = coefs[index] # (K,2,4)
+    vertices = c[...,0] + t[:,None]*(c[...,1] + t[:,None]*(c[...,2] + t[:,None]*c[...,3]))
+    if return_t: return vertices,offsets,t
+    return vertices,offsets
+
+def flatten_to_polylines(coefs,tolerance):
+    '''将曲线展开为折线的列表，首尾相接的段合并为同一条折线'''
+    vertices,offsets = flatten_coefs(coefs,tolerance)
+    if len(vertices) == 0: return []
+    starts,ends = vertices[offsets[:-1]],vertices[offsets[1:] - 1]
+    breaks = np.nonzero(~np.all(np.isclose(starts[1:],ends[:-1]),axis=1))[0] + 1 # 不相接的段
+    keep = np.ones(len(vertices),dtype=bool)
+    joined = np.setdiff1d(np.arange(1,len(offsets) - 1),breaks)
+    keep[offsets[joined]] = False # 去掉相接处重复的起点
+    bounds = np.concatenate([[0],np.cumsum(keep)[offsets[breaks] - 1],[keep.sum()]])
+    vertices = vertices[keep]
+    return [vertices[bounds[i]:bounds[i+1]] for i in range(len(bounds) - 1)]
+
+def points_in_edges(points,starts,ends):
+    '''按偶奇规则判断points(...,2)是否在由边starts,ends(...,E,2)围成的多边形内，前面的维度广播
+
+    从点向+x方向作射线，与奇数条边相交时在内部。多个环的边合在一起即得到带洞的区域。
+    '''
+    py = points[...,None,1]
+    ay,by = starts[...,1],ends[...,1]
+    cross = (ay > py) != (by > py)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        x = starts[...,0] + (py - ay)*(ends[...,0] - starts[...,0])/(by - ay)
+    return (cross & (points[...,None,0] < x)).sum(axis=-1) % 2 == 1
+
+def _eval(coefs,t):
+    return coefs[...,0] + t[:,None]*(coefs[...,1] + t[:,None]*(coefs[...,2] + t[:,None]*coefs[...,3]))
+def _deriv(coefs,t):
+    return coefs[...,1] + t[:,None]*(2*coefs[...,2] + 3*t[:,None]*coefs[...,3])
+
+def coefs_arc_length_table(coefs,tolerance):
+    '''返回弧长表 (lengths,index,t)：曲线展开为折线后各顶点处的累计弧长，所在的段和段内参数，均为(K,)
+
+    不同段之间的连接(包括不相接的段之间的跳跃)不计长度。
+    '''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    vertices,offsets,t = flatten_coefs(coefs,tolerance,return_t=True)
+    index = np.repeat(np.arange(len(coefs)),np.diff(offsets))
+    pieces = np.hypot(*np.diff(vertices,axis=0).T)
+    pieces[index[1:] != index[:-1]] = 0
+    return np.concatenate([[0],np.cumsum(pieces)]),index,t
+
+def coefs_points_at_lengths(coefs,table,lengths):
+    '''由弧长表批量求弧长lengths(M,)处的点(M,2)和单位切向量(M,2)，弧长超出范围时取端点'''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    cum,index,t = table
+    lengths = np.clip(np.asarray(lengths,dtype=float).reshape(-1),0,cum[-1])
+    k = np.clip(np.searchsorted(cum,lengths,side="right") - 1,0,len(cum) - 2)
+    piece = cum[k + 1] - cum[k]
+    with np.errstate(divide="ignore",invalid="ignore"):
+        frac = np.where(piece > 0,(lengths - cum[k]) / piece,1.0)
+    cross = index[k] != index[k + 1] # 段之间的连接，取下一段的起点
+    seg = np.where(cross,index[k + 1],index[k])
+    tt = np.where(cross,t[k + 1],t[k] + frac*(t[k + 1] - t[k]))
+    c = coefs[seg]
+    points = _eval(c,tt)
+    tangents = _deriv(c,tt)
+    norm = np.hypot(*tangents.T)
+    degenerate = norm == 0 # 导数为0时(如控制点重合的端点)用弦的方向代替
+    if degenerate.any():
+        tangents[degenerate] = _eval(c[degenerate],np.minimum(tt[degenerate] + 1e-3,1)) - _eval(c[degenerate],np.maximum(tt[degenerate] - 1e-3,0))
+        norm = np.hypot(*tangents.T)
+    return points,tangents / np.where(norm > 0,norm,1)[:,None]
+
 def get_bezier_point(coef,t):
     assert 0 <= t <= 1
     x_t,y_t = np.polynomial.Polynomial(coef=coef[0]),np.polynomial.Polynomial(coef=coef[1])
@@ -149,10 +298,153 @@ def bezier_line_intersection(bezier_coef,line_point,line_vect):
     x_t,y_t = np.polynomial.Polynomial(bezier_coef[0]),np.polynomial.Polynomial(bezier_coef[1])
     points = [(x_t(t),y_t(t)) for t in result]
     return np.array(points,dtype=float)
-#!
-def bezier_bezier_intersection():
-    pass 
+def cubic_roots_in_unit(A,bisections=8,newtons=8):
+    '''批量求三次多项式在[0,1]内的实根，A:(M,4)为幂基系数，返回(M,3)，不存在的根为nan
+
+    导数的根将[0,1]分为至多3个单调区间，在有变号的区间内同时进行若干次二分，再以限制在区间内的牛顿迭代收敛。
+    '''
+    A = np.asarray(A,dtype=float).reshape(-1,4)
+    a,b,c = 3*A[:,3],2*A[:,2],A[:,1]
+    disc = b*b - 4*a*c
+    sq = np.sqrt(np.maximum(disc,0))
+    quad_ = np.abs(a) > 1e-12 * (np.abs(b) + np.abs(c) + 1e-300)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        r1 = np.where(quad_,(-b - sq)/(2*a),-c/b)
+        r2 = np.where(quad_,(-b + sq)/(2*a),np.nan)
+    r1[quad_ & (disc < 0)] = r2[quad_ & (disc < 0)] = np.nan
+    crit = np.sort(np.stack([r1,r2],axis=1),axis=1)
+    crit = np.where((crit > 0) & (crit < 1),crit,1.0)
+    crit.sort(axis=1)
+    knots = np.concatenate([np.zeros((len(A),1)),crit,np.ones((len(A),1))],axis=1)
+    lo,hi = knots[:,:3].copy(),knots[:,1:].copy()
+    def f(t):
+        return A[:,None,0] + t*(A[:,None,1] + t*(A[:,None,2] + t*A[:,None,3]))
+    flo,fhi = f(lo),f(hi)
+    eps = 1e-12 * np.abs(A).sum(axis=1)[:,None] # 端点处的数值误差
+    flo[np.abs(flo) <= eps] = 0
+    fhi[np.abs(fhi) <= eps] = 0
+    has_root = (flo * fhi <= 0) & (hi >= lo)
+    for _ in range(bisections):
+        mid = (lo + hi)/2
+        fmid = f(mid)
+        left = (flo * fmid <= 0)
+        hi,lo = np.where(left,mid,hi),np.where(left,lo,mid)
+        flo = np.where(left,flo,fmid)
+    t = (lo + hi)/2
+    with np.errstate(divide="ignore",invalid="ignore"):
+        for _ in range(newtons):
+            df = A[:,None,1] + t*(2*A[:,None,2] + t*3*A[:,None,3])
+            t = np.clip(t - np.where(df != 0,f(t)/df,0),lo,hi)
+    roots = np.where(flo == 0,lo,t)
+    return np.where(has_root,roots,np.nan)
+
+def coefs_ray_intersections(coefs,origin,rads):
+    '''批量求以origin为起点，方向角为rads(K,)的射线与曲线(N,2,4)的交点
+
+    返回长度为K的列表，每项为去重后的交点数组(m,2)
+    '''
+    coefs = np.asarray(coefs,dtype=float).reshape(-1,2,4)
+    origin = to_xy(origin)
+    rads = np.asarray(rads,dtype=float).reshape(-1)
+    dirs = np.stack([np.cos(rads),np.sin(rads)],axis=1) # (K,2)
+    rel = coefs.copy()
+    rel[:,:,0] -= origin
+    # 射线方向的法向分量为0: dy*X(t) - dx*Y(t) = 0
+    An = dirs[:,None,1,None] * rel[None,:,0,:] - dirs[:,None,0,None] * rel[None,:,1,:] # (K,N,4)
+    t = cubic_roots_in_unit(An.reshape(-1,4)).reshape(len(rads),len(coefs),3)
+    c = coefs[None,:,None] # (1,N,1,2,4)
+    tt = t[...,None]
+    points = c[...,0] + tt*(c[...,1] + tt*(c[...,2] + tt*c[...,3])) # (K,N,3,2)
+    result = []
+    scale = max(np.abs(coefs[:,:,0]).max(initial=0),1.0)
+    for k in range(len(rads)):
+        p = points[k].reshape(-1,2)
+        p = p[~np.isnan(p[:,0])]
+        p = p[(p - origin) @ dirs[k] > 1e-12 * scale]
+        unique = []
+        for q in p:
+            if not any(np.allclose(q,u) for u in unique): unique.append(q)
+        result.append(np.array(unique,dtype=float).reshape(-1,2))
+    return result
+
+def _bbox_pairs(boxes_a,boxes_b,pad=0):
+    '''返回边框(N,2,2)与(M,2,2)相交的下标对(i,j)，按a分块广播'''
+    i_list,j_list = [],[]
+    chunk = max(1,2**22 // max(len(boxes_b),1))
+    for k in range(0,len(boxes_a),chunk):
+        a = boxes_a[k:k + chunk,None]
+        hit = np.all((a[...,0,:] - pad <= boxes_b[None,:,1,:]) & (boxes_b[None,:,0,:] - pad <= a[...,1,:]),axis=-1)
+        i,j = np.nonzero(hit)
+        i_list.append(i + k)
+        j_list.append(j)
+    if not i_list: return np.zeros(0,dtype=int),np.zeros(0,dtype=int)
+    return np.concatenate(i_list),np.concatenate(j_list)
+
+def _subsegments(coefs,tolerance):
+    '''将曲线展开为折线，返回各小段的 (所在曲线,起点,终点,起点参数,终点参数)'''
+    vertices,offsets,t = flatten_coefs(coefs,tolerance,return_t=True)
+    starts = np.setdiff1d(np.arange(len(vertices) - 1),offsets[1:] - 1) # 不跨越曲线的小段
+    index = np.searchsorted(offsets,starts,side="right") - 1
+    return index,vertices[starts],vertices[starts + 1],t[starts],t[starts + 1]
+
+def coefs_intersections(coefs_a,coefs_b,tolerance=1e-3,newtons=8):
+    '''求两条曲线(N,2,4)与(M,2,4)的交点，返回 (points(K,2),ta(K,),tb(K,))，按在a上的位置排序
 
+    ta,tb为交点所在的段号加段内参数。
+    1. 各段以精确边框两两剪枝；
+    2. 边框相交的段展开为折线(误差不超过tolerance)，小段之间以边框剪枝后批量求直线交点；
+    3. 交点的参数作为初值，对 A(s) = B(r) 进行向量化的牛顿迭代，最后合并距离小于tolerance的交点。
+    相切和重合的部分可能遗漏或只得到近似的交点。
+    '''
+    coefs_a = np.asarray(coefs_a,dtype=float).reshape(-1,2,4)
+    coefs_b = np.asarray(coefs_b,dtype=float).reshape(-1,2,4)
+    empty = np.zeros((0,2)),np.zeros(0),np.zeros(0)
+    if len(coefs_a) == 0 or len(coefs_b) == 0: return empty
+    # 曲线段剪枝
+    ia,ib = _bbox_pairs(coefs_to_bboxes(coefs_a),coefs_to_bboxes(coefs_b),tolerance)
+    if len(ia) == 0: return empty
+    ua,ub = np.unique(ia),np.unique(ib)
+    sa,sb = _subsegments(coefs_a[ua],tolerance),_subsegments(coefs_b[ub],tolerance)
+    sa,sb = (ua[sa[0]],*sa[1:]),(ub[sb[0]],*sb[1:])
+    # 小段剪枝，只保留所在曲线段相交的小段对
+    box = lambda p0,p1: np.stack([np.minimum(p0,p1),np.maximum(p0,p1)],axis=1)
+    i,j = _bbox_pairs(box(sa[1],sa[2]),box(sb[1],sb[2]),tolerance)
+    keep = np.isin(sa[0][i]*len(coefs_b) + sb[0][j],ia*len(coefs_b) + ib)
+    i,j = i[keep],j[keep]
+    # 直线交点
+    p,r = sa[1][i],sa[2][i] - sa[1][i]
+    q,s = sb[1][j],sb[2][j] - sb[1][j]
+    den = r[:,0]*s[:,1] - r[:,1]*s[:,0]
+    qp = q - p
+    with np.errstate(divide="ignore",invalid="ignore"):
+        t = (qp[:,0]*s[:,1] - qp[:,1]*s[:,0]) / den
+        u = (qp[:,0]*r[:,1] - qp[:,1]*r[:,0]) / den
+    eps = 1e-9
+    hit = (den != 0) & (t >= -eps) & (t <= 1 + eps) & (u >= -eps) & (u <= 1 + eps)
+    i,j,t,u = i[hit],j[hit],t[hit],u[hit]
+    seg_a,seg_b = sa[0][i],sb[0][j]
+    ta = sa[3][i] + t*(sa[4][i] - sa[3][i])
+    tb = sb[3][j] + u*(sb[4][j] - sb[3][j])
+    # 牛顿迭代 A(ta) - B(tb) = 0
+    ca,cb = coefs_a[seg_a],coefs_b[seg_b]
+    for _ in range(newtons):
+        f = _eval(ca,ta) - _eval(cb,tb)
+        da,db = _deriv(ca,ta),-_deriv(cb,tb)
+        det = da[:,0]*db[:,1] - da[:,1]*db[:,0]
+        ok = np.abs(det) > 1e-14
+        det = np.where(ok,det,1)
+        ta = np.clip(ta - np.where(ok,(f[:,0]*db[:,1] - f[:,1]*db[:,0]) / det,0),0,1)
+        tb = np.clip(tb - np.where(ok,(da[:,0]*f[:,1] - da[:,1]*f[:,0]) / det,0),0,1)
+    points = (_eval(ca,ta) + _eval(cb,tb)) / 2
+    valid = np.hypot(*(_eval(ca,ta) - _eval(cb,tb)).T) <= tolerance
+    points,ta,tb = points[valid],(seg_a + ta)[valid],(seg_b + tb)[valid]
+    # 排序并合并重复的交点(小段端点和曲线段的连接处会重复求出)
+    order = np.argsort(ta,kind="stable")
+    points,ta,tb = points[order],ta[order],tb[order]
+    keep = []
+    for k in range(len(points)):
+        if not keep or not (np.hypot(*(points[keep] - points[k]).T) <= tolerance).any(): keep.append(k)
+    return points[keep],ta[keep],tb[keep]
 
 
 if __name__ == '__main__':
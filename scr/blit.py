@@ -0,0 +1,106 @@
+'''此模块提供CanvasAxes的局部重绘(blitting)。
+
+交互工具(拖动node，悬停高亮等)每次改变都会触发整个figure的重绘，node很多时无法流畅交互。
+BlitManager缓存静态node的背景，只将改变过的node设为animated，重绘时恢复背景后只绘制这些node。
+
+BlitManager通过Canvas的注册表回调自动追踪node：新注册的node和几何、样式改变过的node会被标记为脏node，
+删除静态node和坐标范围的改变(例如注册node时的自动放缩)会使背景失效。交互结束后可以调用settle将脏node合并回静态背景。
+'''
+
+
+class BlitManager():
+    '''管理Canvas的局部重绘，一般通过Canvas.get_blit_manager()获取'''
+    def __init__(self,canvas) -> None:
+        self._canvas = canvas
+        self._background = None
+        self._lims = None # 获取背景时的坐标范围
+        self._dirty = {} # id(node) -> node, 保持标记顺序
+        self._node_cids = {}
+        for node in canvas.iter_nodes():
+            self._watch(node)
+        self._registry_cid = canvas.add_callback(self._on_registry)
+        self._draw_cid = self.figcanvas.mpl_connect("draw_event",self._on_draw)
+        self._lim_cids = [canvas.ax.callbacks.connect(event,self._on_lims_changed) for event in ("xlim_changed","ylim_changed")]
+
+    @property
+    def figcanvas(self):
+        return self._canvas.ax.get_figure().canvas
+    @property
+    def dirty_nodes(self):
+        return list(self._dirty.values())
+
+    # 追踪node
+    def _watch(self,node):
+        self._node_cids[id(node)] = node.add_callback(self._on_node_changed)
+    def _unwatch(self,node):
+        cid = self._node_cids.pop(id(node),None)
+        if cid is not None: node.remove_callback(cid)
+    def _on_registry(self,event,node):
+        match event:
+            case "register":
+                self._watch(node)
+                self.mark_dirty(node,in_background=False)
+            case "remove":
+                self._unwatch(node)
+                if self._dirty.pop(id(node),None) is None:
+                    self._background = None # 静态node被删除，背景失效
+    def _on_node_changed(self,node,event):
+        self.mark_dirty(node)
+    def _on_lims_changed(self,ax):
+        if self._lims is not None and self._lims != (ax.get_xlim(),ax.get_ylim()):
+            self._background = None # 背景中的静态node位置已经改变
+
+    def mark_dirty(self,node,in_background=True):
+        '''将node设为animated，之后的draw_idle只重绘脏node。
+
+        in_background为True表示node已经画在缓存的背景中，此时背景需要重新获取一次。
+        '''
+        if id(node) in self._dirty: return
+        for a in node.iter_artists():
+            a.set_animated(True)
+        self._dirty[id(node)] = node
+        if in_background: self._background = None
+
+    # 绘图
+    def _on_draw(self,event):
+        fc = self.figcanvas
+        if event is not None and event.canvas is not fc: return
+        if not hasattr(fc,"copy_from_bbox"): return
+        self._background = fc.copy_from_bbox(fc.figure.bbox)
+        ax = self._canvas.ax
+        self._lims = (ax.get_xlim(),ax.get_ylim())
+        self._draw_animated()
+    def _draw_animated(self):
+        ax = self._canvas.ax
+        for node in self._dirty.values():
+            for a in node.iter_artists():
+                ax.draw_artist(a)
+    def draw_idle(self):
+        '''恢复缓存的背景并只重绘脏node，背景失效时进行一次完整重绘'''
+        fc = self.figcanvas
+        if self._background is None:
+            fc.draw() # draw_event中获取背景并绘制脏node
+        else:
+            fc.restore_region(self._background)
+            self._draw_animated()
+        fc.blit(fc.figure.bbox)
+        fc.flush_events()
+
+    def settle(self):
+        '''交互结束后将脏node合并回静态背景'''
+        for node in self._dirty.values():
+            for a in node.iter_artists():
+                a.set_animated(False)
+        self._dirty = {}
+        self._background = None
+        self.figcanvas.draw_idle()
+
+    def disconnect(self):
+        '''断开所有回调，并将脏node合并回静态背景'''
+        self.settle()
+        for node in self._canvas.iter_nodes():
+            self._unwatch(node)
+        self._canvas.remove_callback(self._registry_cid)
+        self.figcanvas.mpl_disconnect(self._draw_cid)
+        for cid in self._lim_cids:
+            self._canvas.ax.callbacks.disconnect(cid)
@@ -0,0 +1,148 @@
+'''此模块提供渲染结果的磁盘缓存。
+
+缓存以场景内容哈希为键，哈希由Canvas中各node的几何数据、样式以及输出参数计算得到，
+内容相同的场景直接复用已渲染的文件。缓存目录的总大小有上限，超出时按最近使用时间(LRU)淘汰，
+写入使用临时文件加 os.replace 保证原子性，多个进程同时写入同一目录也不会读到残缺的文件。
+'''
+import os
+import hashlib
+import tempfile
+import threading
+
+import numpy as np
+
+
+def _hash_update(h,obj):
+    '''将obj以确定的方式写入哈希对象h, 支持 None,bool,数值,str,数组,序列和字典'''
+    match obj:
+        case None:
+            h.update(b"N")
+        case bool():
+            h.update(b"T" if obj else b"F")
+        case int() | float() | np.integer() | np.floating():
+            h.update(b"f" + repr(float(obj)).encode())
+        case str():
+            h.update(b"s%d:" % len(obj) + obj.encode())
+        case np.ndarray():
+            arr = np.ascontiguousarray(obj,dtype=float)
+            h.update(b"a" + repr(arr.shape).encode() + arr.tobytes())
+        case dict():
+            h.update(b"d%d" % len(obj))
+            for k in sorted(obj,key=str):
+                _hash_update(h,str(k))
+                _hash_update(h,obj[k])
+        case list() | tuple():
+            h.update(b"l%d" % len(obj))
+            for v in obj:
+                _hash_update(h,v)
+        case _:
+            raise TypeError(f"{type(obj)}不是支持计算内容哈希的类型")
+
+def hash_scene(nodes,**options):
+    '''根据nodes的几何、样式以及输出参数options计算场景的内容哈希(十六进制字符串)'''
+    h = hashlib.sha256()
+    for node in nodes:
+        for d in node.drawables:
+            _hash_update(h,d.get_description_dict())
+    _hash_update(h,options)
+    return h.hexdigest()
+
+
+class RenderCache():
+    '''渲染结果的磁盘缓存
+
+    - directory : 缓存目录，不存在时自动创建
+    - maxsize : 缓存目录的最大字节数，超出时按LRU淘汰最久未使用的文件
+    '''
+    def __init__(self,directory,maxsize=256 * 2**20) -> None:
+        if int(maxsize) <= 0: raise ValueError(f"{maxsize}不是合法的maxsize值,必需为正整数")
+        self._directory = os.path.abspath(directory)
+        self._maxsize = int(maxsize)
+        self._lock = threading.Lock()
+        self._stats = {"hits":0,"misses":0,"evictions":0}
+        os.makedirs(self._directory,exist_ok=True)
+
+    @property
+    def directory(self):
+        return self._directory
+    @property
+    def maxsize(self):
+        return self._maxsize
+    @property
+    def stats(self):
+        '''命中统计: hits,misses,evictions,hit_rate'''
+        with self._lock:
+            stats = dict(self._stats)
+        total = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / total if total else 0.0
+        return stats
+
+    def _get_path(self,key,fmt):
+        return os.path.join(self._directory,f"{key}.{fmt}")
+    def _count(self,name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self,key,fmt):
+        '''返回以二进制只读打开的缓存文件，未命中时返回None。命中会刷新文件的使用时间
+
+        文件在get中打开，之后即使被并发的淘汰或clear删除也可以继续读取，使用后需要关闭。
+        '''
+        path = self._get_path(key,fmt)
+        try:
+            f = open(path,"rb")
+        except FileNotFoundError:
+            self._count("misses")
+            return None
+        try:
+            os.utime(f.fileno() if os.utime in os.supports_fd else path) # 刷新LRU顺序
+        except FileNotFoundError:
+            pass # 打开后被删除，已打开的文件仍然可读
+        self._count("hits")
+        return f
+
+    def put(self,key,fmt,data:bytes):
+        '''原子地写入缓存文件并返回其路径，写入后按需淘汰'''
+        path = self._get_path(key,fmt)
+        fd,tmp = tempfile.mkstemp(dir=self._directory,prefix=".tmp-")
+        try:
+            with os.fdopen(fd,"wb") as f:
+                f.write(data)
+            os.replace(tmp,path)
+        except BaseException:
+            if os.path.exists(tmp): os.remove(tmp)
+            raise
+        self._evict(keep=path)
+        return path
+
+    def _evict(self,keep=None):
+        '''删除最久未使用的文件直到总大小不超过maxsize,keep指定的文件不会被删除'''
+        entries = []
+        for entry in os.scandir(self._directory):
+            if not entry.is_file() or entry.name.startswith(".tmp-"): continue
+            try:
+                st = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime,st.st_size,entry.path))
+        total = sum(e[1] for e in entries)
+        for _,size,path in sorted(entries):
+            if total <= self._maxsize: break
+            if path == keep: continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            self._count("evictions")
+
+    def clear(self):
+        '''清空缓存目录与统计，正在写入的临时文件不会被删除'''
+        for entry in os.scandir(self._directory):
+            if not entry.is_file() or entry.name.startswith(".tmp-"): continue
+            try:
+                os.remove(entry.path)
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._stats = {"hits":0,"misses":0,"evictions":0}
@@ -1,15 +1,83 @@
 from matplotlib.axes import Axes
 from matplotlib.projections import register_projection
 import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.path import Path
 import numpy as np 
 import re 
+import os 
+import threading
+import functools
+import io 
+import tempfile 
+from contextlib import contextmanager
 
-from node import Node,_tg_style,_tg_style_check,get_drawable,MarkDrawable
+from node import Node,NodeGroup,GeometryTemplate,TextNode,TextDrawable,get_registry,use_registry,get_drawable,get_text_anchor,MarkDrawable,get_line_mark_frames
 from matrix import *
 
-from utilities import to_xy,to_rad,codes_vects_to_segment,getUnitArc_CV,getUnitCircle_CV
+from utilities import to_xy,to_rad,codes_vects_to_segment,getUnitArc_CV,getUnitCircle_CV,parse_anchor
+from cache import hash_scene
+from blit import BlitManager
+from tiles import render_tiles
+from lod import LevelOfDetail
+from profiler import Profiler,register_lru_cache
+from clip import node_to_rings,boolean_rings,rings_to_segment
+from depgraph import DependencyGraph
+from symbol import Symbol,SymbolInstance
+from route import GridRouter,trim_to_outline
+from bezier import coefs_intersections
+from plot import sample_function,split_finite,catmull_rom_to_cubic
+from stylesheet import StyleSheet,StyleRecord,load_stylesheet,merge_style
 
 RE_find_anchor = r"[a-z|_][a-z|_|\d|-]*(\.[a-z|_|\d|-]+)?" # 命名与python变量命名一致
+PAT_find_anchor = re.compile(RE_find_anchor)
+
+@functools.lru_cache(maxsize=4096)
+def parse_anchor_ref(pos):
+    '''将"name.anchor"形式的锚点字符串解析为(name,anchor)，结果会被缓存'''
+    if not PAT_find_anchor.fullmatch(pos): raise ValueError(f"{pos}不是支持的锚点值，锚点格式错误")
+    name,_,anchor = pos.partition(".")
+    return name,anchor or None
+
+_tg_pos_keys = {"x":1,"y":1,"rel":2,"angle":3,"radius":3,"update":0,"to":0,"name":4,"anchor":4} #通过数字映射完成冲突管理
+@functools.lru_cache(maxsize=256)
+def get_pos_kind(keys):
+    '''由坐标字典的键(frozenset)返回坐标的表示法: 1直角坐标,2相对坐标,3极坐标,4锚点，0表示只有update,to键'''
+    conflict_num = 0
+    for k in keys:
+        if k not in _tg_pos_keys: raise ValueError(f"{k}不是支持的坐标键,支持的键为{tuple(_tg_pos_keys)}")
+        if conflict_num != _tg_pos_keys[k]:
+            if conflict_num * _tg_pos_keys[k] != 0 :
+                raise ValueError(f"{set(keys)}含有互斥的键")
+            else : conflict_num = conflict_num + _tg_pos_keys[k]
+    return conflict_num
+
+@functools.lru_cache(maxsize=None)
+def get_circle_template():
+    '''单位圆的GeometryTemplate，所有圆由其仿射变换得到'''
+    codes,vects = getUnitCircle_CV()
+    return GeometryTemplate(codes_vects_to_segment(codes,vects))
+@functools.lru_cache(maxsize=1024)
+def get_arc_template(start,delta,mode):
+    '''圆心于原点的单位圆弧的GeometryTemplate，mode为open,close,pie'''
+    codes,vects = getUnitArc_CV(start=start,delta=delta)
+    match mode:
+        case "open": pass
+        case "close":
+            codes.append(2)
+            vects.append(np.array(vects[0]))
+        case "pie":
+            codes.extend([2,2])
+            vects.extend([np.zeros(2),vects[0]])
+        case _:
+            raise ValueError("%s is not supported mode" %mode)
+    return GeometryTemplate(codes_vects_to_segment(codes,np.array(vects)))
+
+register_lru_cache("get_arc_template",get_arc_template)
+register_lru_cache("parse_anchor",parse_anchor)
+register_lru_cache("parse_anchor_ref",parse_anchor_ref)
+register_lru_cache("get_pos_kind",get_pos_kind)
 
 ####################################################################################
 ###         Axes interface                                                       ###
@@ -39,6 +107,14 @@ class CanvasAxes(Axes):
         self.canvas = Canvas(self)
     def get_canvas(self):
         return self.canvas
+    def draw(self,renderer):
+        lod = self.canvas.lod
+        if lod is None: return super().draw(renderer)
+        lod.apply(self,self.canvas.iter_nodes())
+        try:
+            super().draw(renderer)
+        finally:
+            lod.restore()
     
 register_projection(CanvasAxes)
 
@@ -50,6 +126,7 @@ class CTX():
     ''' a helper class for Canvas
     
     储存Canvas状态的类''' 
+    __slots__ = ("_prev","_datalim","_padding","_transform","_nodes","_unnammed_nodes","_style")
     def __init__(self,*,prev,style:dict,datalim,padding,transform,nodes,unnamed_nodes) -> None:
         self._prev = prev
         self._datalim = datalim
@@ -57,13 +134,10 @@ class CTX():
         self._transform = transform
         self._nodes = nodes
         self._unnammed_nodes = unnamed_nodes
-        self._supported_style = set()
         if "total" not in style: raise ValueError("ctx style 缺少必要的字典: total style")
-        self._style = {"total":style["total"]}
+        self._style = {"total":dict(style["total"])}
         for st in style:
             self._style |= {st:style[st] | self._style["total"]}
-        for style_type in _tg_style:
-            self._supported_style |= set(_tg_style[style_type])
 
     @property
     def prev(self):
@@ -97,39 +171,49 @@ class CTX():
         return self._unnammed_nodes
     @property
     def supported_style(self):
-        return self._supported_style
+        return frozenset().union(*(default.keys() for default in get_registry().style.values()))
+    def copy(self):
+        '''返回状态的副本，style按类型复制，nodes与原状态共享'''
+        ctx = CTX.__new__(CTX)
+        ctx._prev,ctx._padding,ctx._transform = self._prev,self._padding,self._transform
+        ctx._datalim = [list(lim) for lim in self._datalim]
+        ctx._nodes,ctx._unnammed_nodes = self._nodes,self._unnammed_nodes
+        ctx._style = {st:dict(v) for st,v in self._style.items()}
+        return ctx
 
     def check_style(self,**style):
         '''check ctx style的合法性，注意ctx style支持在非total style中添加total style的值'''
+        registry = get_registry()
         def _check_style_with_total(style_check,**style):
             # 添加对total值的检查
-            if style_check is _tg_style_check["total"] : return style_check(**style)
+            if style_check is registry.style_check["total"] : return style_check(**style)
             _total_style = self.style["total"]
             total_style_dct = {}
             for k in list(style.keys()):
                 if k in _total_style: 
                     total_style_dct[k] = style.pop(k)
             style = style_check(**style)
-            total_style_dct = _tg_style_check["total"](**total_style_dct)
+            total_style_dct = registry.style_check["total"](**total_style_dct)
             return style | total_style_dct
         
          # 图像的共有参数: alpha,zorder,hidden,clipon
-        _style_types = _tg_style_check.keys()
+        _style_types = registry.style_check.keys()
         style_dct = {}
         for ktype,v in style.items(): # k = "total","path",etc.
-            if ktype not in _style_types: raise TypeError("%s 不是合法的style值")
-            v = _check_style_with_total(_tg_style_check[ktype],**v) 
+            if ktype not in _style_types: raise TypeError("%s 不是合法的style值" % ktype)
+            v = _check_style_with_total(registry.style_check[ktype],**v) 
             style_dct.update({ktype:v})
         return style_dct
 
     def set_style(self,style_type=None,**style):
-        _style_types = _tg_style.keys()
+        registry = get_registry()
+        _style_types = registry.style.keys()
         if style_type is None:
             style_dct = { ktype:{} for ktype in _style_types}
             for k in style: # 开始设置
                 k_types = [] # 获取k所在的所有类型
                 for st in _style_types:
-                    if k in _tg_style[st]: 
+                    if k in registry.style[st]: 
                         k_types.append(st)
                 for k_type in k_types:
                     style_dct[k_type].update({k:style[k]})
@@ -150,8 +234,10 @@ class CTX():
             nd = self.unnamed_nodes[nodename]
             self.unnamed_nodes.remove(nd)
         if isinstance(nodename,slice):
-            nd = self.unnamed_nodes[nodename]
+            nds = self.unnamed_nodes[nodename]
             self.unnamed_nodes[nodename] = []
+            for nd in nds: nd.remove_artists()
+            return nds
         if isinstance(nodename,str):
             nd = self.nodes.pop(nodename,None)
         if isinstance(nodename,Node):
@@ -161,6 +247,7 @@ class CTX():
         if nd is None : return 
         else :
             nd.remove_artists()
+        return nd
 
     def update_datalim(self,x,y):
         x,y = to_xy((x,y))
@@ -201,24 +288,57 @@ class CTX():
         except :
             raise ValueError(f"datalim参数错误")
 
+def _with_registry(func):
+    '''Canvas创建Drawable或检查样式的方法，在Canvas绑定的注册表快照下执行，快照已经是当前快照时直接调用'''
+    @functools.wraps(func)
+    def wrapper(self,*args,**kwargs):
+        if get_registry() is self._registry: return func(self,*args,**kwargs)
+        with use_registry(self._registry):
+            return func(self,*args,**kwargs)
+    return wrapper
+
 class Canvas():
     '''绘图的主要接口'''
+    PRIMITIVES = ("circle","circle_through","arc","arc_through","mark","marker","line","bezier","bezier_through","rect","boolean","lines","circles","rects","place","connect","intersections","decorate","text","plot") # 绘图函数，用于Profiler分类统计
+
+    def __init__(self,ax=None,stylesheet=None) -> None:
+        '''stylesheet : None，True(查找.pytez_style.json)，样式表的路径或StyleSheet，参见load_stylesheet
 
-    def __init__(self,ax=None) -> None:
+        Canvas绑定创建时的注册表快照(参见node.get_registry)。ax为None时在主线程中由pyplot创建，
+        在其他线程中创建不经过pyplot的Figure(Agg)，可以保存但不能show，从而可以在线程池中同时构建多个Canvas。
+        '''
         if ax is None: 
-            fig,ax = plt.subplots(subplot_kw={"projection":"canvas"})
+            if threading.current_thread() is threading.main_thread():
+                fig,ax = plt.subplots(subplot_kw={"projection":"canvas"})
+            else:
+                fig = Figure()
+                FigureCanvasAgg(fig)
+                ax = fig.add_subplot(projection="canvas")
+            ax.canvas = self # 替换CanvasAxes自带的canvas，使绘制时使用的是同一个Canvas
         self.ax = ax
+        self._registry = get_registry()
         self._ctx = CTX(
             prev=(0,0),
-            style = _tg_style,
+            style = self._registry.style,
             datalim = [[0,1],[0,1]],
             padding={"top":1,"bottom":1,"left":1,"right":1},
             transform= np.eye(3,dtype=float),
             nodes={},
             unnamed_nodes=[])
+        self._callbacks = {}
+        self._blit_manager = None
+        self._router = None
+        self._lod = None
+        self._depgraph = None
+        self._group_items = {} # NodeGroup中各项的名字 -> NodeGroup
+        self._symbols = {}
+        self._recording_symbol = None # 正在定义的Symbol
+        self._stylesheet = None
+        if stylesheet is not None: self.load_stylesheet(None if stylesheet is True else stylesheet)
         self._autoscale()
 
     # POS
+    @_with_registry
     def to_abs_pos(self,pos,_update=True):
         '''根据状态返回坐标值,并更新prev状态,
         1. update,to 用于指定是否更新当前位置，坐标参照位置
@@ -229,19 +349,11 @@ class Canvas():
         _has_transform = True
         to = self.ctx.prev
         if isinstance(pos,str): #锚点字符串
-            if not re.fullmatch(RE_find_anchor,pos): raise ValueError(f"{pos}不是支持的锚点值，锚点格式错误")
-            if "." in pos :
-                name,anchor = pos.split(".")
-            else:
-                name = pos
-                anchor = None
-            return self.to_abs_pos({
-                "name":name,
-                "anchor":anchor
-            })
-        if np.array(pos).shape == (0,):
+            name,anchor = parse_anchor_ref(pos)
+            pos = {"name":name,"anchor":anchor}
+        if not isinstance(pos,dict) and np.shape(pos) == (0,):
             return self.ctx.prev
-        if not isinstance(pos,dict) and np.array(pos).shape == (2,):
+        if not isinstance(pos,dict) and np.shape(pos) == (2,):
             if isinstance(pos[0],str):
                 angle = to_rad(pos[0])
                 try:
@@ -255,13 +367,7 @@ class Canvas():
             xy =  to_xy(pos) # (x,y)
         if isinstance(pos,dict):
             # 保证键参数正确
-            conflict_dct = {"x":1,"y":1,"rel":2,"angle":3,"radius":3,"update":0,"to":0,"name":4,"anchor":4} #通过数字映射完成冲突管理
-            conflict_num = 0
-            for k in pos.keys():
-                if conflict_num != conflict_dct[k]:
-                    if  conflict_num * conflict_dct[k] != 0 :
-                        raise ValueError(f"{pos}含有互斥的键")
-                    else : conflict_num = conflict_num + conflict_dct[k]          
+            conflict_num = get_pos_kind(frozenset(pos))
             if "update" in pos:
                 if not isinstance(pos["update"],bool):
                     raise ValueError(f"{pos}不是支持的update键，必须为bool类型")
@@ -285,9 +391,9 @@ class Canvas():
                 case 4 :
                     if "name" not in pos.keys() : raise ValueError("在使用anchor表示法时，必需指定命名")
                     name = pos["name"]
-                    if name not in self.ctx.nodes.keys() : raise ValueError(f"Anchor:{name}未找到：尚未注册")
+                    node = self.get_node(name)
                     anchor = None if "anchor" not in pos.keys() else pos["anchor"]
-                    xy =  self.ctx.nodes[name].calculate_anchors(anchor)
+                    xy =  node.calculate_anchors(anchor)
                     _has_transform = False
         if _has_transform:
             xy = get_xy_by_transform(self.ctx.transform,xy)
@@ -308,11 +414,56 @@ class Canvas():
     @property 
     def ctx(self):
         return self._ctx
+    @_with_registry
     def load_style(self,style_dct,name="total"):
-        return self.ctx.load_style(style_dct,name)
+        '''使用CTX的样式补全style_dct，styleclass为样式表中的类名或StyleRecord时使用其预编译的完整样式'''
+        styleclass = style_dct.pop("styleclass",None)
+        if styleclass is None:
+            style_dct = self.ctx.load_style(style_dct,name)
+            if self._stylesheet is not None: style_dct["styleclass"] = self._stylesheet.defaults # 未被修改的默认值不再检查
+            return style_dct
+        record = styleclass if isinstance(styleclass,StyleRecord) else self.get_styleclass(styleclass)
+        if name not in record.styles: raise ValueError("%s 不是合法的style type" %name)
+        style_dct = merge_style(record.get_style(name),style_dct)
+        style_dct["styleclass"] = record
+        return style_dct
+    @_with_registry
+    def load_stylesheet(self,stylesheet=None):
+        '''加载样式表，其默认样式替换CTX的样式，之后绘图函数可以使用styleclass=类名，返回StyleSheet
+
+        - stylesheet : 样式表的路径，StyleSheet，或None(查找.pytez_style.json)
+        样式表只在第一次加载时检查和编译，参见stylesheet模块。
+        '''
+        if not isinstance(stylesheet,StyleSheet): stylesheet = load_stylesheet(stylesheet)
+        self._stylesheet = stylesheet
+        for st in stylesheet.defaults.styles:
+            self.ctx.style[st] = stylesheet.defaults.get_style(st) # 副本，修改CTX不会影响共享的样式表
+        return stylesheet
+    @property
+    def stylesheet(self):
+        return self._stylesheet
+    def get_styleclass(self,name):
+        if self._stylesheet is None: raise ValueError(f"没有加载样式表，无法使用样式类{name}")
+        return self._stylesheet.get(name)
+    @_with_registry
     def set_style(self,style_type = None,**style):
         '''更新默认字典的内容,如果style_type被指定，则只会修改对应的样式'''
         return self.ctx.set_style(style_type,**style)
+    # registry
+    @property
+    def registry(self):
+        '''此Canvas绑定的注册表快照'''
+        return self._registry
+    def register_style(self,name,default_style,style_check):
+        '''只在此Canvas中注册样式，参见node.register_style'''
+        self._registry = self._registry.with_style(name,default_style,style_check)
+        self.ctx.style[name] = dict(self._registry.style[name]) | self.ctx.style["total"]
+    def register_drawable(self,drawable_cls):
+        '''只在此Canvas中注册drawable类，之后可以通过get_drawable使用'''
+        self._registry = self._registry.with_drawable(drawable_cls)
+    def set_precompute_compass(self,enabled=True):
+        '''只对此Canvas设置是否在第一次查询方位锚点时批量预计算全部方位锚点，参见node.set_precompute_compass'''
+        self._registry = self._registry.with_options(precompute_compass=bool(enabled))
     def _update_prev(self,xy):
         self.ctx.prev = xy
     def moveto(self,pos):
@@ -339,18 +490,112 @@ class Canvas():
     
     def register_node(self,node:Node):
         '''注册node，在创建node时使用一次'''
+        if self._depgraph is not None and self._depgraph.replaying: return node # 依赖图重新解析时不注册
+        if self._recording_symbol is not None: return self._recording_symbol.add(node) # 符号定义中的node不加入Axes
         for a in node.iter_artists():
             self.ax.add_artist(a)
-        for xy in node.get_datalim():
-            self._update_datalim(*xy)
-        self._autoscale()
+        if node.drawables: # 只有锚点的node不影响画布范围
+            for xy in node.get_datalim():
+                self._update_datalim(*xy)
+            self._autoscale()
         name = node.name 
         if name is not None: self.ctx.nodes[name] = node
         else: self.ctx.unnamed_nodes.append(node)
+        if isinstance(node,NodeGroup):
+            for item in node.item_names: self._group_items[item] = node
+        self._notify("register",node)
+        return node
+    def get_node(self,name):
+        '''返回注册的node，也可以是NodeGroup中具有名字的项(在第一次使用时生成)，定义符号时只能引用符号中的node'''
+        if self._recording_symbol is not None:
+            node = self._recording_symbol.get_part(name)
+            if node is None: raise ValueError(f"Anchor:{name}未找到：符号{self._recording_symbol.name}中没有该node")
+        elif name in self.ctx.nodes: node = self.ctx.nodes[name]
+        elif name in self._group_items: node = self._group_items[name].get_item(name)
+        else: raise ValueError(f"Anchor:{name}未找到：尚未注册")
+        if self._depgraph is not None: self._depgraph.add_reference(name,node)
         return node
+    def _as_node(self,node):
+        '''绘图函数的node参数可以是Node或注册的node名，两者都作为依赖图的引用记录'''
+        if isinstance(node,str): return self.get_node(node)
+        if self._depgraph is not None: self._depgraph.add_reference(node.name,node)
+        return node
+    def iter_nodes(self):
+        '''按注册顺序遍历所有命名和未命名的node'''
+        yield from self.ctx.nodes.values()
+        yield from self.ctx.unnamed_nodes
+    def nodes_at(self,points,tolerance=1e-3):
+        '''返回包含各点的node列表的列表，points为绝对数据坐标下的(M,2)数组
+
+        points按x排序后，每个node只用二分查找得到边框内的候选点，再调用Node.contains。
+        '''
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        result = [[] for _ in range(len(points))]
+        order = np.argsort(points[:,0],kind="stable")
+        xs = points[order,0]
+        for node in self.iter_nodes():
+            if not node.drawables: continue
+            (xmin,ymin),(xmax,ymax) = node.get_datalim()
+            lo,hi = np.searchsorted(xs,xmin,"left"),np.searchsorted(xs,xmax,"right")
+            if lo == hi: continue
+            idx = order[lo:hi]
+            idx = idx[(points[idx,1] >= ymin) & (points[idx,1] <= ymax)]
+            if len(idx) == 0: continue
+            for i in idx[node.contains(points[idx],tolerance)]:
+                result[i].append(node)
+        return result
     def remove(self,name):
         '''可以使用name字符串来remove注册的node，也可以使用int和slice来remove未注册的node，也可以传入Node来删除其artist'''
-        return self.ctx.remove_node(name)
+        nd = self.ctx.remove_node(name)
+        for n in (nd if isinstance(nd,list) else [nd] if nd is not None else []):
+            if isinstance(n,NodeGroup):
+                for item in n.item_names:
+                    if self._group_items.get(item) is n: del self._group_items[item]
+            self._notify("remove",n)
+        return nd
+    # 注册表回调
+    def add_callback(self,func):
+        '''添加在node注册或删除后调用的函数 func(event,node)，event为"register"或"remove"，返回用于删除的id'''
+        cid = max(self._callbacks,default=-1) + 1
+        self._callbacks[cid] = func
+        return cid
+    def remove_callback(self,cid):
+        self._callbacks.pop(cid,None)
+    def _notify(self,event,node):
+        for func in list(self._callbacks.values()):
+            func(event,node)
+    @property
+    def lod(self):
+        return self._lod
+    def set_lod(self,enabled=True,tolerance=0.5,min_size=1.0):
+        '''开启或关闭绘制时的路径简化，tolerance和min_size以像素为单位，参见lod.LevelOfDetail'''
+        self._lod = LevelOfDetail(tolerance=tolerance,min_size=min_size) if enabled else None
+        self.ax.stale = True
+    def profile(self):
+        '''返回分阶段计时的上下文管理器，参见profiler.Profiler'''
+        return Profiler(caches={"lod":lambda: self._lod.stats if self._lod is not None else {"hits":0,"misses":0}})
+    @property
+    def depgraph(self):
+        return self._depgraph
+    def set_lazy_anchors(self,enabled=True):
+        '''开启或关闭锚点依赖图，开启后node的几何改变时引用它的node会被重新解析，参见depgraph.DependencyGraph'''
+        if enabled and self._depgraph is None:
+            self._depgraph = DependencyGraph(self)
+        elif not enabled and self._depgraph is not None:
+            self._depgraph.disconnect()
+            self._depgraph = None
+        return self._depgraph
+    def get_router(self,cell=None,bend_penalty=2.0,margin=8):
+        '''返回连线使用的路由器，第一次调用时创建，指定参数时按参数重新创建，参见route.GridRouter'''
+        if self._router is None or cell is not None or (bend_penalty,margin) != (self._router.bend_penalty,self._router.margin):
+            if self._router is not None: self._router.disconnect()
+            self._router = GridRouter(self,cell=cell,bend_penalty=bend_penalty,margin=margin)
+        return self._router
+    def get_blit_manager(self):
+        '''返回用于交互重绘的BlitManager，第一次调用时创建'''
+        if self._blit_manager is None:
+            self._blit_manager = BlitManager(self)
+        return self._blit_manager
 
     def _update_datalim(self,x=None,y=None):
         '''根据坐标更新ctx.datalim值'''
@@ -369,15 +614,60 @@ class Canvas():
         '''自动放缩，以适应画面'''
         self.ctx.datalim[0] = [0,1]
         self.ctx.datalim[1] = [0,1]
-        nodes = list(self.ctx.nodes.values())
-        nodes.extend(self.ctx.unnamed_nodes)
-        for n in nodes:
+        for n in self.iter_nodes():
             _lim = n.get_datalim() 
             self._update_datalim(*_lim[0])
             self._update_datalim(*_lim[1])
         self._autoscale(scalex=scalex,scaley=scaley)
     
     
+    # output
+    def get_content_hash(self,**options):
+        '''返回由node几何、样式，画面范围，LOD设置以及输出参数options(Figure.savefig的参数)确定的内容哈希'''
+        fig = self.ax.get_figure()
+        dpi = options.get("dpi","figure")
+        return hash_scene(self.iter_nodes(),
+            xlim=self.ax.get_xlim(),ylim=self.ax.get_ylim(),
+            figsize=tuple(fig.get_size_inches()),dpi=fig.dpi if dpi == "figure" else dpi, # 指定的dpi优先于Figure的dpi
+            lod=None if self._lod is None else self._lod.params,
+            savefig=options)
+    def save(self,fname=None,*,cache=None,**kwargs):
+        '''保存图像，kwargs传递给Figure.savefig
+
+        - cache : RenderCache, 给定时先以内容哈希查找缓存，命中则不再渲染。
+        - fname : 输出文件名，使用cache时可以为None，此时返回图像数据(bytes)。
+        '''
+        fig = self.ax.get_figure()
+        if cache is None:
+            if fname is None: raise ValueError("不使用cache时必需指定fname")
+            fig.savefig(fname,**kwargs)
+            return fname
+        fmt = kwargs.get("format")
+        if fmt is None:
+            fmt = os.path.splitext(fname)[1][1:] if fname is not None else ""
+            fmt = fmt or plt.rcParams["savefig.format"]
+        kwargs["format"] = fmt
+        key = self.get_content_hash(**kwargs)
+        f = cache.get(key,fmt)
+        if f is None:
+            buf = io.BytesIO()
+            fig.savefig(buf,**kwargs)
+            data = buf.getvalue()
+            cache.put(key,fmt,data)
+        else:
+            with f: data = f.read()
+        if fname is None: return data
+        # 原子地写入目标位置
+        fd,tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(fname)),prefix=".tmp-")
+        with os.fdopen(fd,"wb") as out:
+            out.write(data)
+        os.replace(tmp,fname)
+        return fname
+
+    def render_tiles(self,outdir,zoom_levels,tile_px=256,**kwargs):
+        '''以进程池并行渲染 outdir/z/x/y 结构的瓦片金字塔，参见tiles.render_tiles'''
+        return render_tiles(self,outdir,zoom_levels,tile_px,**kwargs)
+
     # draw
         
     ## 
@@ -391,6 +681,7 @@ class Canvas():
         return getUnitArc_CV(start=start,delta=delta,n=n)
 
     ## basic drawing api
+    @_with_registry
     def get_path_node(self,*segments,name=None,**style):
         _segments = [[] for i in range(len(segments))]
         for i,seg in enumerate(segments):
@@ -399,98 +690,85 @@ class Canvas():
                 _cmd.extend(map(self.to_abs_pos,cmd[1:]))
                 _segments[i].append(_cmd)
         return self.get_path_node_in_abspos(*_segments,name=name,**style)
-    def get_path_node_in_abspos(self,*segments,name=None,**style):
-        '''支持 line style 的node生成器'''
+    @_with_registry
+    def get_path_node_in_abspos(self,*segments,name=None,template=None,**style):
+        '''支持 line style 的node生成器，template为锚点segment对应的(GeometryTemplate,变换)'''
         style = self.load_style(style,name="line")
-        mark_style = style.pop("mark",{"symbol":None})
+        mark_style = dict(style.pop("mark",{"symbol":None})) # 复制，不修改CTX中的mark字典
         drawables = [get_drawable("path",segment=seg,**style) for seg in segments] # 先获取 path drawable
         if mark_style["symbol"] is not None:
             start,end = mark_style.pop("start",True) , mark_style.pop("end",False) # start,end 是 mark style 不支持的键，需要pop
             stroke = mark_style.pop("stroke",None)
             if stroke is None: mark_style["stroke"] = style.get("stroke",None)
             for seg in segments:
+                (end_xy,end_angle),(start_xy,start_angle) = get_line_mark_frames(seg)
                 if start:
-                    mark_style["poses"] = [seg[-1][-1]]
-                    xy = np.array(seg[-1][-1]) - seg[-1][-2]
-                    angle,_ = xy_to_angle_radius(xy)
-                    mark_style["angle"] = angle
+                    mark_style["poses"],mark_style["angle"] = [end_xy],end_angle
                     drawables.append(get_drawable("mark",segment=[],**mark_style))
                 # 如果bothside为true，则添加前端
                 if end:
-                    mark_style["poses"] = [seg[0][1]]
-                    x,y = np.array(seg[0][1]) - seg[0][2]
-                    angle,_ = xy_to_angle_radius(xy)
-                    mark_style["angle"] = angle
+                    mark_style["poses"],mark_style["angle"] = [start_xy],start_angle
                     drawables.append(get_drawable("mark",segment=[],**mark_style))
 
-        node = Node(drawables=drawables,name=name,)
+        node = Node(drawables=drawables,name=name,template=template)
         return node 
     ###############################################################
     ###                          绘图api                         ###
     ###############################################################
 
+    def _get_template_matrix(self,center,radius):
+        '''返回将单位图形放缩为radius并平移至用户坐标center的绝对变换'''
+        rx,ry = np.broadcast_to(np.asarray(radius,dtype=float),(2,))
+        return self.ctx.transform @ np.array([[rx,0,center[0]],[0,ry,center[1]],[0,0,1]],dtype=float)
+    @_with_registry
     def circle(self,center,name=None,anchor=None,**style):
+        '''绘制圆(椭圆)，几何由单位圆模板的变换推导，参见node.GeometryTemplate'''
         style = self.load_style(style_dct=style,name="circle")
         radius = style.pop("radius",(1,1))
         center = self.to_user_poses(center)[0]
-        codes,vects = self.UnitCircle_CV()
-        vects = vects * radius + center
-        vects = self.to_abs_poses(*vects)
-        segment = codes_vects_to_segment(codes=codes,vects=vects)
-        node = Node(name=name,drawables=[get_drawable(drawtype="path",segment=segment,**style)])
+        template,mat = get_circle_template(),self._get_template_matrix(center,radius)
+        node = Node(name=name,drawables=[get_drawable(drawtype="path",segment=template.get_segment(mat),**style)],template=(template,mat))
         if anchor is not None:
             _center = center
             center = node.calculate_anchors(anchor=anchor)
-            vects = vects + center - _center 
-            segment = codes_vects_to_segment(codes=codes,vects=vects)
-            node = Node(name = name,drawables=[get_drawable(drawtype="path",segment=segment,**style)])
+            mat = mat.copy()
+            mat[:2,2] += center - _center
+            node = Node(name=name,drawables=[get_drawable(drawtype="path",segment=template.get_segment(mat),**style)],template=(template,mat))
         self.moveto_by_xy(center)
         return self.register_node(node)
     
+    @_with_registry
     def circle_through(self,a,b,c,name=None,anchor=None,**style):
         a,b,c = self.to_user_poses(a,b,c)
         center,radius = get_circle_center_and_radius_by_3point(a,b,c)
         style["radius"] = radius
         return self.circle(center=center,name=name,anchor=anchor,**style)
 
+    @_with_registry
     def arc(self,center,start,delta,name=None,anchor=None,**style):
         '''绘制一段圆弧
 
         - mode 是圆弧的形态，支持open，close，pie三种形态
         - start,delta ： angle 参数，确定圆弧的起始角和旋转角
         - center,radius,... 
+        几何由按(start,delta,mode)缓存的单位圆弧模板的变换推导。
         '''
-        _codes,_vects = self.UnitArc_CV(start=start,delta=delta)
         center = self.to_user_poses(center)[0]
         style = self.load_style(style,name="arc")
         radius = style.pop("radius",1)
         mode = style.pop("mode","open")
-
-        _vects = np.array(_vects) * radius + center #np.array
-        _vects = list(_vects)
-        match mode:
-            case "open":
-                pass
-            case "close":
-                _codes.append(2)
-                _vects.append(np.array(_vects[0]))
-            case "pie":
-                _codes.extend([2,2])
-                _vects.extend([center,_vects[0]])
-            case _:
-                raise ValueError("%s is not supported mode" %mode)
-        _vects = self.to_abs_poses(*_vects)
-        _segment = codes_vects_to_segment(_codes,_vects)
-        node =  self.get_path_node_in_abspos(_segment,name=name,**style)
+        template,mat = get_arc_template(start,delta,mode),self._get_template_matrix(center,radius)
+        node =  self.get_path_node_in_abspos(template.get_segment(mat),name=name,template=(template,mat),**style)
         if anchor is not None:
             _center = center
             center = node.calculate_anchors(anchor=anchor)
-            _vects = np.array(_vects) + center - _center 
-            _segment = codes_vects_to_segment(_codes,_vects)
-            node = self.get_path_node(_segment,name=name,**style)
+            mat = mat.copy()
+            mat[:2,2] += center - _center
+            node = self.get_path_node_in_abspos(template.get_segment(mat),name=name,template=(template,mat),**style)
         self.moveto_by_xy(center)
         return self.register_node(node)
 
+    @_with_registry
     def arc_through(self,a,b,c,name=None,anchor=None,**style):
         '''三点确定圆弧，style为arc'''
         a,b,c = self.to_abs_poses(a,b,c)
@@ -501,6 +779,7 @@ class Canvas():
         style["radius"] = radius
         return self.arc(center=center,start=start,delta=delta,name=name,anchor=anchor,**style)
 
+    @_with_registry
     def mark(self,start,to,name=None,**style):
         '''使用start,to确定mark的位置，支持除 poses,angle之外的mark symbol'''
 
@@ -514,6 +793,7 @@ class Canvas():
         node = Node(drawables=[drawable],name=name)
         return self.register_node(node)
         
+    @_with_registry
     def marker(self,*pos,symbol=">",name=None,**style):
         '''在pos处添加symbol样式的标记,这里的symbol可以是mark style中允许的symbol值，同时可以输入segment，来表示symbol'''
         poses = self.to_abs_poses(*pos)
@@ -525,6 +805,7 @@ class Canvas():
         return self.register_node(node)
 
     
+    @_with_registry
     def line(self,*pos,name=None,**style):
         '''根据输入坐标绘制折线，支持line style,包括line style中的mark'''
         node = self.get_path_node([("line",*pos)],name=name,**style) 
@@ -532,6 +813,7 @@ class Canvas():
         return node
     
 
+    @_with_registry
     def bezier(self,start,end,*ctrl,name = None,**style):
         '''三阶及以下的贝塞尔曲线'''
         start,end = self.to_user_poses(start,end)
@@ -552,23 +834,244 @@ class Canvas():
         self.register_node(node)
         return node
 
+    @_with_registry
     def bezier_through(self,start,pass_through,end,name=None,**style):
         start,pass_through,end = self.to_user_poses(start,pass_through,end)
         ctrl = (4 * np.array(pass_through) - start - end ) / 2
         return self.bezier(start,end,ctrl,name=name,**style)
 
+    @_with_registry
     def rect(self,a,b,name=None,**style):
         a,b = self.to_user_poses(a,b)
         node =  self.get_path_node([
             ("line",a,(b[0],a[1]),b,(a[0],b[1]),a),
         ],name=name,**style)
         return self.register_node(node)
-    
-    
-    
-    
-        
-        
 
+    @_with_registry
+    def text(self,pos,text,name=None,anchor="center",**style):
+        '''在pos处放置文字，anchor为文字node中与pos重合的锚点，返回TextNode
 
+        - anchor : 文字锚点(center,north,south-east,base,base-west等，为边框上的点)或任意锚点
+        - style : text style，size为字号(数据单位下的em高度)
+        字形路径和边框按(text,font,size)缓存(参见node.get_text_glyphs)，相同文字的node共享字形路径，只保存自身的变换。
+        '''
+        style = self.load_style(style,"text")
+        style["text"] = text
+        xy = self.to_user_poses(pos)[0]
+        mat = self.ctx.transform @ np.array([[1,0,xy[0]],[0,1,xy[1]],[0,0,1]],dtype=float)
+        drawable = TextDrawable(matrix=mat,**style)
+        offset = get_text_anchor(drawable.box,anchor)
+        if offset is not None:
+            drawable.set_matrix(mat @ np.array([[1,0,-offset[0]],[0,1,-offset[1]],[0,0,1]],dtype=float))
+            node = TextNode(drawable,name=name)
+        else:
+            node = TextNode(drawable,name=name)
+            x,y = get_xys_by_transform(mat,[(0,0)])[0] - node.calculate_anchors(anchor)
+            node.apply_transform([[1,0,x],[0,1,y],[0,0,1]])
+        self.moveto_by_xy(xy)
+        return self.register_node(node)
+
+    @_with_registry
+    def plot(self,f,domain,samples=64,tolerance=None,name=None,smooth=True,max_depth=8,**style):
+        '''绘制函数图像，f以NumPy数组调用，返回y(y=f(x))或(x,y)(参数曲线)，支持line style
+
+        - domain : (a,b)，自变量(参数)的范围
+        - samples,tolerance,max_depth : 自适应采样的参数，参见plot.sample_function，tolerance为用户坐标下的距离
+        - smooth : 为True时采样点转换为三阶贝塞尔曲线，否则为折线
+        采样结果按(f,domain,samples,tolerance,max_depth)缓存，f的值不是有限数处路径断开。
+        '''
+        t,xy = sample_function(f,tuple(map(float,domain)),int(samples),None if tolerance is None else float(tolerance),int(max_depth))
+        segment = []
+        for t,xy in split_finite(t,xy):
+            xy = get_xys_by_transform(self.ctx.transform,xy)
+            if smooth:
+                segment.extend(("cubic",*ctrls) for ctrls in zip(*catmull_rom_to_cubic(t,xy)))
+            else:
+                segment.append(("line",*xy))
+        if not segment: raise ValueError(f"f在{domain}上没有连续的有限值")
+        node = self.get_path_node_in_abspos(segment,name=name,**style)
+        self.moveto_by_xy(segment[-1][-1])
+        return self.register_node(node)
 
+    ## 批量绘图api
+    def _to_abs_array(self,xys):
+        '''将(...,2)的用户坐标数组变换为绝对坐标'''
+        xys = np.asarray(xys,dtype=float)
+        if xys.shape[-1] != 2: raise ValueError(f"坐标数组的最后一维必需为2,你的形状为{xys.shape}")
+        return get_xys_by_transform(self.ctx.transform,xys.reshape(-1,2)).reshape(xys.shape)
+    def _register_group(self,item_vertices,item_codes,item_kinds,item_index,name,names,style):
+        mark = style.pop("mark",None)
+        if mark is not None and mark.get("symbol") is not None: raise ValueError("批量绘图不支持mark")
+        node = NodeGroup(item_vertices,item_codes,item_kinds,item_index,name=name,names=names,**style)
+        return self.register_node(node)
+    @_with_registry
+    def lines(self,pos,name=None,names=None,**style):
+        '''批量绘制折线，pos为(M,K,2)的用户坐标数组，所有折线共用一个样式，注册为一个NodeGroup
+
+        - names : 可选的M个名字，可以像注册的node一样用于锚点，如 "name.end"
+        批量绘图只支持数组坐标，不改变prev。
+        '''
+        pos = np.asarray(pos,dtype=float)
+        if pos.ndim != 3 or pos.shape[1] < 2: raise ValueError(f"pos必需为(M,K,2)的数组且K>=2,你的形状为{pos.shape}")
+        style = self.load_style(style,name="line")
+        k = pos.shape[1]
+        codes = [Path.MOVETO] + [Path.LINETO]*(k - 1)
+        return self._register_group(self._to_abs_array(pos),codes,(("line",k),),np.arange(k),name,names,style)
+    @_with_registry
+    def circles(self,centers,radii=1,name=None,names=None,**style):
+        '''批量绘制圆，centers为(N,2)，radii可以是标量，(N,)或者(N,2)(椭圆)，参见lines'''
+        centers = np.asarray(centers,dtype=float).reshape(-1,2)
+        radii = np.asarray(radii,dtype=float)
+        if radii.ndim == 1 and len(radii) == len(centers): radii = radii[:,None] # 每项一个半径
+        radii = np.broadcast_to(radii,(len(centers),2))
+        style = self.load_style(style,name="circle")
+        style.pop("radius",None)
+        codes,vects = self.UnitCircle_CV()
+        vertices = vects[None] * radii[:,None] + centers[:,None]
+        n = (len(vects) - 1) // 3
+        index = np.array([[3*i,3*i + 1,3*i + 2,3*i + 3] for i in range(n)]).ravel() # 每段三次曲线的4个控制点
+        return self._register_group(self._to_abs_array(vertices),codes,(("cubic",4),)*n,index,name,names,style)
+    @_with_registry
+    def rects(self,a,b,name=None,names=None,**style):
+        '''批量绘制矩形，a,b为(N,2)的对角顶点，参见lines'''
+        a,b = np.broadcast_arrays(np.asarray(a,dtype=float).reshape(-1,2),np.asarray(b,dtype=float).reshape(-1,2))
+        corners = np.stack([a,np.stack([b[:,0],a[:,1]],axis=1),b,np.stack([a[:,0],b[:,1]],axis=1),a],axis=1)
+        return self.lines(corners,name=name,names=names,**style)
+
+    @_with_registry
+    def boolean(self,op,*nodes,name=None,tolerance=1e-3,remove=False,**style):
+        '''闭合node之间的布尔运算，返回由结果多边形生成的新node，结果为空时返回None
+
+        - op : "union","intersection","difference"(第一个减去其余所有),"xor"
+        - nodes : Node或注册的node名
+        - tolerance : 曲线展开为折线的容差，结果不重新拟合曲线
+        - remove : 为True时删除参与运算的node，用于将大量图形合并为少量路径
+        - style : line style
+        '''
+        nodes = [self._as_node(n) for n in nodes]
+        if not nodes: raise ValueError("布尔运算至少需要一个node")
+        rings = boolean_rings([node_to_rings(n,tolerance) for n in nodes],op,tolerance)
+        if remove:
+            for n in nodes: self.remove(n)
+        if not rings: return None
+        node = self.get_path_node_in_abspos(rings_to_segment(rings),name=name,**style)
+        return self.register_node(node)
+    @_with_registry
+    def union(self,*nodes,name=None,**kwargs):
+        return self.boolean("union",*nodes,name=name,**kwargs)
+    @_with_registry
+    def intersection(self,*nodes,name=None,**kwargs):
+        return self.boolean("intersection",*nodes,name=name,**kwargs)
+    @_with_registry
+    def difference(self,*nodes,name=None,**kwargs):
+        return self.boolean("difference",*nodes,name=name,**kwargs)
+
+    @_with_registry
+    def connect(self,a,b,name=None,router="orthogonal",**style):
+        '''绘制由a到b的连线，绕开注册的闭合node和组，返回连线的node
+
+        - a,b : node名(或Node)，此时连线由node的中心出发并裁剪到node的轮廓；也可以是其他坐标，此时不裁剪
+        - router : "orthogonal"(正交路由，参见route.GridRouter) 或 "straight"
+        - style : line style，可以使用mark绘制箭头
+        '''
+        ends = []
+        for pos in (a,b):
+            if isinstance(pos,Node): node,xy = self._as_node(pos),pos.calculate_anchors()
+            elif isinstance(pos,str) and "." not in pos: node,xy = self.get_node(pos),self.to_abs_pos(pos,_update=False)
+            else: node,xy = None,self.to_abs_pos(pos,_update=False)
+            ends.append((node,np.asarray(xy,dtype=float)))
+        (na,xa),(nb,xb) = ends
+        points = self.get_router().route(xa,xb,router=router,ignore=[n for n in (na,nb) if n is not None])
+        for node,i in ((na,slice(None)),(nb,slice(None,None,-1))):
+            if node is not None and node._can_get_intersection and node.contains(points[i][:1])[0]:
+                points = trim_to_outline(points[i],node)[i]
+        node = self.get_path_node_in_abspos([("line",*points)],name=name,**style)
+        self.moveto_by_xy(points[-1])
+        return self.register_node(node)
+
+    @_with_registry
+    def decorate(self,node,symbol=">",spacing=None,count=None,offset=None,name=None,tolerance=1e-3,**style):
+        '''沿node的锚点路径每隔spacing长度，或均匀地放置count个symbol，symbol的方向为路径的切向，返回装饰的node
+
+        - node : Node或注册的node名
+        - offset : 第一个symbol的弧长位置，默认spacing模式为0，count模式为间隔的一半
+        - style : mark style，angle为相对切向的角度，scale,reverse与mark相同
+        所有位置和切向由弧长表一次求出(参见Node.get_points_at_lengths)，并绘制为少量的复合路径。
+        '''
+        node = self._as_node(node)
+        if (spacing is None) == (count is None): raise ValueError("spacing和count必需且只能指定一个")
+        if count is not None and int(count) <= 0: raise ValueError(f"{count}不是合法的count值,必需为正整数")
+        if spacing is not None and not spacing > 0: raise ValueError(f"{spacing}不是合法的spacing值,必需为正数")
+        length = node.get_arc_length(tolerance)
+        if not length > 0: return None # 长度为0的路径没有切向，也就没有间隔
+        if count is not None:
+            spacing = length / int(count)
+            lengths = (0.5 * spacing if offset is None else offset) + spacing * np.arange(int(count))
+        else:
+            lengths = np.arange(0 if offset is None else offset,length + spacing*1e-9,spacing)
+        lengths = lengths[(lengths >= 0) & (lengths <= length * (1 + 1e-9))]
+        if len(lengths) == 0: return None
+        points,tangents = node.get_points_at_lengths(lengths,tolerance)
+        style = self.load_style(style,"mark")
+        style.pop("poses",None)
+        style["symbol"] = symbol
+        drawables = MarkDrawable.getMarksbyTangents(poses=points,tangents=tangents,**style)
+        return self.register_node(Node(drawables=drawables,name=name))
+
+    @_with_registry
+    def intersections(self,a,b,name=None,tolerance=1e-3):
+        '''注册一个只有锚点的node，其锚点"0","1",...为a,b锚点路径的交点，按在a上的位置排序，参见bezier.coefs_intersections
+
+        - a,b : Node或注册的node名，不连续的node使用其各段路径而不是边框
+        - 没有交点时注册的node没有锚点
+        '''
+        a,b = self._as_node(a),self._as_node(b)
+        points,_,_ = coefs_intersections(a.get_anchor_coefs(),b.get_anchor_coefs(),tolerance)
+        node = Node([],name=name)
+        for i,xy in enumerate(points):
+            node.add_anchor(str(i),xy)
+        return self.register_node(node)
+
+    ## 符号
+    @contextmanager
+    def symbol(self,name):
+        '''在with块中记录符号定义，块中的绘图函数生成的node不加入Axes，返回Symbol
+
+        定义使用独立的坐标系(单位变换，prev为原点)和当前样式的副本，块中的样式和变换改变不影响块外。
+        块中只能通过名字引用定义中的node。
+        '''
+        if self._recording_symbol is not None: raise ValueError("符号定义不能嵌套，可以在定义中place已有的符号")
+        sym = Symbol(name)
+        _ctx = self._ctx
+        self._ctx = _ctx.copy()
+        self._ctx.transform = np.eye(3,dtype=float)
+        self._ctx.prev = (0,0)
+        self._recording_symbol = sym
+        try:
+            yield sym
+        finally:
+            self._recording_symbol = None
+            self._ctx = _ctx
+        self._symbols[name] = sym
+    def get_symbol(self,name):
+        if name not in self._symbols: raise ValueError(f"符号{name}尚未定义")
+        return self._symbols[name]
+    @_with_registry
+    def place(self,symbol,transform=None,name=None,**style):
+        '''放置符号的实例，实例共享定义的路径和锚点缓存，返回SymbolInstance
+
+        - symbol : Symbol或已定义的符号名
+        - transform : None(只使用当前变换)，位置(符号原点放置于该点，例如"a.east")或者(3,3)的变换矩阵(在当前变换之前施加)
+        - style : 实例自身的样式，只复制被修改的实例的样式
+        '''
+        if isinstance(symbol,str): symbol = self.get_symbol(symbol)
+        mat = self.ctx.transform
+        if transform is not None and np.shape(transform) == (3,3):
+            mat = mat @ check_transform(transform)
+        elif transform is not None:
+            mat = mat.copy()
+            mat[:2,2] = self.to_abs_pos(transform)
+        node = SymbolInstance(symbol,mat,name=name)
+        if style: node.set(**style)
+        return self.register_node(node)
@@ -0,0 +1,197 @@
+'''此模块提供闭合路径之间的布尔运算(并，交，差，异或)。
+
+每个运算对象的路径先以容差展开为多边形(可以包含多个环)，然后:
+
+1. 所有边登记到均匀网格中，只在同一格子内边框相交的边之间求交点(包括共线重叠的端点)，并在交点处切分边；
+2. 对每条切分后的边，在其中点左右两侧各取一点，统计包含该点的运算对象，
+   两侧运算结果不同的边才是结果的边界，并使结果的内部总在边的左侧；
+3. 将边界边首尾相接为环，外环为逆时针，内环(孔)为顺时针。
+
+结果为多边形，不重新拟合曲线。点的包含测试使用matplotlib的Path.contains_points，并先以边框过滤。
+'''
+import numpy as np
+from matplotlib.path import Path
+
+from bezier import flatten_to_polylines
+
+
+def _cross(a,b):
+    return a[...,0]*b[...,1] - a[...,1]*b[...,0]
+
+def _dot(a,b):
+    return a[...,0]*b[...,0] + a[...,1]*b[...,1]
+
+def node_to_rings(node,tolerance):
+    '''将node的锚点路径展开为环的列表，每个环为(N,2)数组且不重复起点。路径不闭合时报错'''
+    rings = []
+    for poly in flatten_to_polylines(node.get_anchor_coefs(),tolerance):
+        if not np.allclose(poly[0],poly[-1]): raise ValueError(f"{node}的路径不闭合,不能进行布尔运算")
+        poly = poly[:-1]
+        poly = poly[np.any(poly != np.roll(poly,1,axis=0),axis=1)] # 去掉重复的点
+        if len(poly) >= 3: rings.append(poly)
+    return rings
+
+def rings_to_path(rings):
+    '''由环的列表生成闭合的复合Path'''
+    if not rings: return Path(np.zeros((0,2)))
+    return Path.make_compound_path(*[Path(np.concatenate([r,r[:1]]),closed=True) for r in rings])
+
+def rings_to_segment(rings):
+    '''由环的列表生成segment，每个环为一条首尾相接的line'''
+    return [("line",*r,r[0]) for r in rings]
+
+
+def _candidate_pairs(p0,p1):
+    '''返回边框相交的边对(i,j)，i < j
+
+    边按边框登记到均匀网格中(格子边长为边长中位数的两倍)，只比较同一格子中的边。
+    '''
+    lo,hi = np.minimum(p0,p1),np.maximum(p0,p1)
+    size = 2 * np.median(np.max(hi - lo,axis=1))
+    if not size > 0: size = max(np.ptp(np.concatenate([lo,hi]),axis=0).max(),1.0)
+    c0,c1 = np.floor(lo / size).astype(np.int64),np.floor(hi / size).astype(np.int64)
+    nx,ny = c1[:,0] - c0[:,0] + 1,c1[:,1] - c0[:,1] + 1
+    counts = nx * ny
+    edges = np.repeat(np.arange(len(p0)),counts)
+    k = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts,counts)
+    cx,cy = c0[edges,0] + k % nx[edges],c0[edges,1] + k // nx[edges]
+    order = np.lexsort((cy,cx))
+    edges,cx,cy = edges[order],cx[order],cy[order]
+    # 同一格子中的边两两配对
+    new_cell = np.concatenate([[True],(cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])])
+    cell_end = np.append(np.nonzero(new_cell)[0][1:],len(edges))[np.cumsum(new_cell) - 1]
+    n = cell_end - np.arange(len(edges)) - 1
+    a = np.repeat(np.arange(len(edges)),n)
+    b = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n,n) + a + 1
+    i,j = np.minimum(edges[a],edges[b]),np.maximum(edges[a],edges[b])
+    pairs = np.unique(i * len(p0) + j)
+    i,j = pairs // len(p0),pairs % len(p0)
+    keep = (i != j) & (lo[i,0] <= hi[j,0]) & (lo[j,0] <= hi[i,0]) & (lo[i,1] <= hi[j,1]) & (lo[j,1] <= hi[i,1])
+    return i[keep],j[keep]
+
+def _split_points(p0,p1,snap):
+    '''返回切分点 (edge,t,xy)，包括每条边的两个端点'''
+    i,j = _candidate_pairs(p0,p1)
+    a,r = p0[i],p1[i] - p0[i]
+    c,s = p0[j],p1[j] - p0[j]
+    qp = c - a
+    den = _cross(r,s)
+    rr,ss = _dot(r,r),_dot(s,s)
+    eps = 1e-9
+    edges,ts,xys = [np.arange(len(p0))]*2,[np.zeros(len(p0)),np.ones(len(p0))],[p0,p1]
+    def _add(e,t,xy,mask):
+        edges.append(e[mask]); ts.append(t[mask]); xys.append(xy[mask])
+    # 不平行的边
+    crossing = np.abs(den) > eps * np.sqrt(rr * ss)
+    with np.errstate(divide="ignore",invalid="ignore"):
+        t = np.where(crossing,_cross(qp,s) / den,-1.0)
+        u = np.where(crossing,_cross(qp,r) / den,-1.0)
+    hit = crossing & (t >= -eps) & (t <= 1 + eps) & (u >= -eps) & (u <= 1 + eps)
+    t_inner,u_inner = (t > eps) & (t < 1 - eps),(u > eps) & (u < 1 - eps)
+    xy = a + np.clip(t,0,1)[:,None] * r
+    # 交于端点时使用端点的原值，保证切分点与端点完全相同
+    xy = np.where((~t_inner & (t < 0.5))[:,None],a,np.where((~t_inner & (t >= 0.5))[:,None],p1[i],xy))
+    xy = np.where((~u_inner & (u < 0.5))[:,None],c,np.where((~u_inner & (u >= 0.5))[:,None],p1[j],xy))
+    _add(i,t,xy,hit & t_inner)
+    _add(j,u,xy,hit & u_inner)
+    # 共线重叠的边，在对方的端点处切分
+    collinear = ~crossing & (np.abs(_cross(qp,r)) <= snap * np.sqrt(rr))
+    for e,o,start,vect,length in ((i,j,a,r,rr),(j,i,c,s,ss)):
+        for end in (p0[o],p1[o]):
+            t = _dot(end - start,vect) / length
+            _add(e,t,end,collinear & (t > eps) & (t < 1 - eps))
+    return np.concatenate(edges),np.concatenate(ts),np.concatenate(xys)
+
+def _count_inside(points,paths,bboxes):
+    '''返回包含各点的运算对象数量，以及是否被第一个运算对象包含'''
+    count = np.zeros(len(points),dtype=int)
+    first = np.zeros(len(points),dtype=bool)
+    order = np.argsort(points[:,0],kind="stable")
+    xs = points[order,0]
+    for k,(path,(xmin,ymin,xmax,ymax)) in enumerate(zip(paths,bboxes)):
+        idx = order[np.searchsorted(xs,xmin,"left"):np.searchsorted(xs,xmax,"right")]
+        idx = idx[(points[idx,1] >= ymin) & (points[idx,1] <= ymax)]
+        if len(idx) == 0: continue
+        idx = idx[path.contains_points(points[idx])]
+        count[idx] += 1
+        if k == 0: first[idx] = True
+    return count,first
+
+_tg_boolean_ops = {
+    "union":lambda count,first,n: count > 0,
+    "intersection":lambda count,first,n: count == n,
+    "difference":lambda count,first,n: first & (count == 1),
+    "xor":lambda count,first,n: count % 2 == 1,
+}
+
+def boolean_rings(operands,op,tolerance=1e-3):
+    '''对多个运算对象(每个为环的列表)进行布尔运算，返回结果环的列表
+
+    - op : "union","intersection","difference"(第一个减去其余所有),"xor"
+    - tolerance : 展开曲线时使用的容差，切分点的合并距离和两侧取点的距离由其决定
+    '''
+    if op not in _tg_boolean_ops: raise ValueError(f"{op}不是支持的布尔运算,支持的运算为{tuple(_tg_boolean_ops)}")
+    operands = [list(rings) for rings in operands]
+    snap,offset = tolerance * 1e-4,tolerance * 1e-2
+    p0 = [r for rings in operands for r in rings]
+    if not p0: return []
+    p0 = np.concatenate(p0)
+    p1 = np.concatenate([np.roll(r,-1,axis=0) for rings in operands for r in rings])
+    # 切分
+    edges,ts,xys = _split_points(p0,p1,snap)
+    order = np.lexsort((ts,edges))
+    edges,xys = edges[order],xys[order]
+    keys = np.round(xys / snap).astype(np.int64)
+    _,first_index,ids = np.unique(keys,axis=0,return_index=True,return_inverse=True)
+    ids = ids.ravel()
+    coords = xys[first_index]
+    same = (edges[:-1] == edges[1:]) & (ids[:-1] != ids[1:])
+    s,e = ids[:-1][same],ids[1:][same]
+    # 分类
+    a,b = coords[s],coords[e]
+    d = b - a
+    normal = np.stack([-d[:,1],d[:,0]],axis=1) / np.hypot(d[:,0],d[:,1])[:,None]
+    mid = (a + b) / 2
+    paths = [rings_to_path(rings) for rings in operands]
+    bboxes = [(*np.concatenate(rings).min(axis=0),*np.concatenate(rings).max(axis=0)) if rings else (np.inf,np.inf,-np.inf,-np.inf) for rings in operands]
+    count,first = _count_inside(np.concatenate([mid + offset*normal,mid - offset*normal]),paths,bboxes)
+    inside = _tg_boolean_ops[op](count,first,len(operands))
+    left,right = inside[:len(s)],inside[len(s):]
+    boundary = left != right
+    s,e = np.where(left,s,e)[boundary],np.where(left,e,s)[boundary] # 内部在左侧
+    if len(s) == 0: return []
+    s,e = np.unique(np.stack([s,e],axis=1),axis=0).T # 重合的边只保留一条
+    return _stitch(s,e,coords,snap)
+
+def _stitch(s,e,coords,snap):
+    '''将有向边首尾相接为环'''
+    outgoing = {}
+    for k,v in enumerate(s.tolist()):
+        outgoing.setdefault(v,[]).append(k)
+    used = np.zeros(len(s),dtype=bool)
+    e_list = e.tolist()
+    rings = []
+    for k0 in range(len(s)):
+        if used[k0]: continue
+        used[k0] = True
+        ring,k = [s[k0]],k0
+        while e_list[k] != ring[0]:
+            cand = outgoing.get(e_list[k],[])
+            while cand and used[cand[-1]]: cand.pop()
+            if not cand: # 无法闭合，丢弃
+                ring = None
+                break
+            k = cand.pop()
+            used[k] = True
+            ring.append(s[k])
+        if ring is None or len(ring) < 3: continue
+        ring = _drop_collinear(coords[ring],snap)
+        if len(ring) >= 3: rings.append(ring)
+    return rings
+
+def _drop_collinear(ring,snap):
+    '''去掉与相邻两点共线的点'''
+    prev,nxt = np.roll(ring,1,axis=0),np.roll(ring,-1,axis=0)
+    chord = nxt - prev
+    dist = np.abs(_cross(ring - prev,chord)) / np.maximum(np.hypot(chord[:,0],chord[:,1]),snap)
+    return ring[dist > snap]
@@ -0,0 +1,176 @@
+'''此模块提供锚点引用的依赖图，用于node改变后增量地重新解析依赖它的node。
+
+开启后，Canvas的绘图函数(Canvas.PRIMITIVES)在调用时记录其参数和调用前的状态(prev,transform,style)，
+并记录通过名字(Canvas.get_node，例如to_abs_pos中的"rect.north",{"name":"c","anchor":"20%"}，boolean等的node参数)或直接传入的Node作为依赖边。
+某个node的几何改变(Node.update_geometry,Node.apply_transform或依赖图自身的更新)后，
+只有它传递依赖的node会按拓扑顺序用记录的参数和状态重新调用绘图函数，得到的路径原地更新到原node上。
+
+只有显式引用的node会被记录，prev等隐式的位置关系不会形成依赖。
+'''
+import functools
+from contextlib import contextmanager
+
+from node import Node,PathDrawable
+
+
+class DependencyGraph():
+    '''Canvas的锚点依赖图，一般通过Canvas.set_lazy_anchors()创建'''
+    def __init__(self,canvas) -> None:
+        self._canvas = canvas
+        self._recipes = {} # node -> (绘图函数名,args,kwargs,ctx)
+        self._sources = {} # node -> 被引用的node列表
+        self._dependents = {} # node -> 引用它的node列表
+        self._node_cids = {}
+        self._recording = None # 正在记录的 (调用前的prev,{name:node},[ctx])
+        self._replaying = False
+        self._pending = None # batch中改变过的node
+        for name in canvas.PRIMITIVES:
+            setattr(canvas,name,self._wrap_primitive(name))
+        self._registry_cid = canvas.add_callback(self._on_registry)
+
+    @property
+    def replaying(self):
+        return self._replaying
+    def get_dependents(self,node):
+        '''返回直接引用node的node列表'''
+        return list(self._dependents.get(node,[]))
+    def get_sources(self,node):
+        '''返回node直接引用的node列表'''
+        return list(self._sources.get(node,[]))
+
+    # 记录
+    def _wrap_primitive(self,name):
+        cv = self._canvas
+        @functools.wraps(getattr(type(cv),name))
+        def wrapper(*args,**kwargs):
+            func = getattr(type(cv),name) # 调用时获取，与Profiler的替换兼容
+            if self._recording is not None or self._replaying: return func(cv,*args,**kwargs) # 只记录最外层
+            self._recording = (cv.ctx.prev,{},[])
+            try:
+                node = func(cv,*args,**kwargs)
+                _,refs,ctx = self._recording
+            finally:
+                self._recording = None
+            if refs and isinstance(node,Node): self._record(node,(name,args,kwargs,ctx[0]),refs)
+            return node
+        return wrapper
+    def add_reference(self,name,node):
+        '''由Canvas.get_node调用，记录当前绘图函数对node的引用'''
+        if self._recording is None or self._replaying: return
+        prev,refs,ctx = self._recording
+        if not ctx: # 第一次引用时保存调用前的状态，style在绘图函数中不会改变
+            ctx.append(self._canvas.ctx.copy())
+            ctx[0].prev = prev
+        refs[name] = node
+    def _record(self,node,recipe,refs):
+        self._forget(node)
+        self._recipes[node] = recipe
+        self._sources[node] = sources = [n for n in dict.fromkeys(refs.values()) if n is not node]
+        for src in sources:
+            self._dependents.setdefault(src,[]).append(node)
+            if src not in self._node_cids:
+                self._node_cids[src] = src.add_callback(self._on_node_changed)
+
+    def _forget(self,node):
+        self._recipes.pop(node,None)
+        for src in self._sources.pop(node,[]):
+            deps = self._dependents.get(src,[])
+            if node in deps: deps.remove(node)
+    def _on_registry(self,event,node):
+        if event != "remove": return
+        self._forget(node)
+        self._dependents.pop(node,None)
+        cid = self._node_cids.pop(node,None)
+        if cid is not None: node.remove_callback(cid)
+    def _on_node_changed(self,node,event):
+        if event != "geometry" or self._replaying: return
+        if self._pending is not None:
+            self._pending[node] = None
+        else:
+            self.update(node)
+
+    # 更新
+    @contextmanager
+    def batch(self):
+        '''在with块中改变的node在退出时一起更新，共同的依赖只重新解析一次'''
+        if self._pending is not None:
+            yield self
+            return
+        self._pending = {}
+        try:
+            yield self
+            changed = list(self._pending)
+        finally:
+            self._pending = None
+        if changed: self.update(*changed)
+
+    def get_update_order(self,*nodes):
+        '''返回nodes的所有传递依赖，按拓扑顺序排列，不包括nodes本身'''
+        affected,stack = {},list(nodes)
+        while stack:
+            for dep in self._dependents.get(stack.pop(),[]):
+                if dep not in affected:
+                    affected[dep] = None
+                    stack.append(dep)
+        indegree = {n:sum(src in affected for src in self._sources.get(n,[])) for n in affected}
+        order = [n for n in affected if indegree[n] == 0]
+        for n in order:
+            for dep in self._dependents.get(n,[]):
+                indegree[dep] -= 1
+                if indegree[dep] == 0: order.append(dep)
+        return order
+
+    def update(self,*nodes):
+        '''重新解析nodes的所有传递依赖，返回更新过的node列表'''
+        order = self.get_update_order(*nodes)
+        if not order: return []
+        cv = self._canvas
+        self._replaying = True
+        try:
+            for node in order:
+                self._adopt(node,self._replay(node))
+        finally:
+            self._replaying = False
+        for node in order:
+            for xy in node.get_datalim():
+                cv._update_datalim(*xy)
+        cv._autoscale()
+        return order
+
+    def _replay(self,node):
+        '''在记录的状态下重新调用绘图函数，返回未注册的新node'''
+        name,args,kwargs,ctx = self._recipes[node]
+        cv = self._canvas
+        _ctx,cv._ctx = cv._ctx,ctx.copy()
+        try:
+            return getattr(type(cv),name)(cv,*args,**kwargs)
+        finally:
+            cv._ctx = _ctx
+    def _adopt(self,node,new):
+        '''将new的几何更新到node上，路径drawable一一对应时复用原有的artist和样式
+
+        自定义锚点和锚点缓存整体替换为new的，不保留上一次解析的结果。
+        '''
+        node._anchor_dct = node._anchor_cache = None
+        if len(node.drawables) == len(new.drawables) and all(type(d) is PathDrawable and type(n) is PathDrawable for d,n in zip(node.drawables,new.drawables)):
+            node.update_geometry(*[d._segment for d in new.drawables],anchors=new._anchor_dct)
+            return
+        node.remove_artists()
+        node.drawables = new.drawables
+        for a in node.iter_artists():
+            self._canvas.ax.add_artist(a)
+        for anchor,xy in (new._anchor_dct or {}).items():
+            node.add_anchor(anchor,xy)
+        node._template = new._template
+        node._build_geometry()
+        node._notify("geometry")
+
+    def disconnect(self):
+        '''恢复Canvas的绘图函数并断开所有回调'''
+        cv = self._canvas
+        for name in cv.PRIMITIVES:
+            cv.__dict__.pop(name,None)
+        for node,cid in self._node_cids.items():
+            node.remove_callback(cid)
+        self._node_cids = {}
+        cv.remove_callback(self._registry_cid)
@@ -0,0 +1,128 @@
+'''此模块提供绘制时的细节层次(LOD)简化。
+
+绘制前根据当前数据坐标到像素的放缩，将每个node的路径以bezier.flatten_coefs展开为折线并用Ramer–Douglas–Peucker算法在像素容差下简化，
+边框小于min_size像素的node的路径直接以边框矩形代替。简化结果按node和放缩的级别(以2为底的对数取整)缓存，
+同一级别内缩放不需要重新简化，也不需要重新遍历node的drawable。绘制结束后恢复原始路径，其他读取artist路径的功能不受影响。
+'''
+from weakref import WeakKeyDictionary
+
+import numpy as np
+from matplotlib.path import Path
+
+from bezier import segment_to_coefs,flatten_to_polylines
+from node import TextDrawable
+
+
+def rdp(points,tolerance):
+    '''Ramer–Douglas–Peucker折线简化，返回保留点的布尔掩码，points:(N,2)'''
+    points = np.asarray(points,dtype=float)
+    n = len(points)
+    keep = np.zeros(n,dtype=bool)
+    if n == 0: return keep
+    keep[0] = keep[-1] = True
+    stack = [(0,n-1)]
+    while stack:
+        i,j = stack.pop()
+        if j - i < 2: continue
+        a,b = points[i],points[j]
+        seg = points[i+1:j] - a
+        ab = b - a
+        norm = np.hypot(*ab)
+        if norm == 0:
+            dist = np.hypot(seg[:,0],seg[:,1])
+        else:
+            dist = np.abs(seg[:,0]*ab[1] - seg[:,1]*ab[0]) / norm
+        k = int(np.argmax(dist))
+        if dist[k] > tolerance:
+            k = i + 1 + k
+            keep[k] = True
+            stack.append((i,k))
+            stack.append((k,j))
+    return keep
+
+def simplify_segment(segment,tolerance):
+    '''将segment展开为折线并以tolerance简化，返回新的Path。展开和简化各占一半的容差'''
+    vertices,codes = [],[]
+    for poly in flatten_to_polylines(segment_to_coefs(segment),tolerance/2):
+        poly = poly[rdp(poly,tolerance/2)]
+        vertices.append(poly)
+        codes.append(np.full(len(poly),Path.LINETO,dtype=Path.code_type))
+        codes[-1][0] = Path.MOVETO
+    return Path(np.concatenate(vertices),np.concatenate(codes))
+
+def get_box_path(path):
+    '''返回path边框的矩形路径'''
+    (xmin,ymin),(xmax,ymax) = path.vertices.min(axis=0),path.vertices.max(axis=0)
+    return Path([(xmin,ymin),(xmax,ymin),(xmax,ymax),(xmin,ymax),(xmin,ymin)],closed=True)
+
+
+def _get_instance_scale(artist):
+    '''artist路径坐标到数据坐标的最大放缩(符号实例的变换在patch transform中)'''
+    A = artist.get_patch_transform().get_matrix()[:2,:2]
+    return np.linalg.norm(A,2)
+
+
+class LevelOfDetail():
+    '''绘制时的路径简化
+
+    - tolerance : 简化的像素容差
+    - min_size : 边框小于该像素尺寸的node的各路径以其边框矩形代替
+    '''
+    def __init__(self,tolerance=0.5,min_size=1.0) -> None:
+        self.tolerance = float(tolerance)
+        self.min_size = float(min_size)
+        self._cache = WeakKeyDictionary() # node -> (node的边框,{bucket:[(artist,原始路径,简化路径)]})
+        self._applied = []
+        self._stats = {"hits":0,"misses":0}
+    @property
+    def stats(self):
+        return dict(self._stats)
+    @property
+    def params(self):
+        '''影响绘制结果的参数，用于内容哈希'''
+        return {"tolerance":self.tolerance,"min_size":self.min_size}
+
+    def _get_lod_paths(self,node,bbox,bucket,scale):
+        '''返回node在bucket级别下需要替换的 [(artist,原始路径,简化路径)]'''
+        (xmin,ymin),(xmax,ymax) = bbox
+        small = max(xmax - xmin,ymax - ymin) * scale < self.min_size # node的边框已包含符号实例的变换
+        lods = []
+        for d in node.drawables:
+            artist = d.get_artist()
+            if not hasattr(artist,"set_path"): continue
+            path = artist.get_path()
+            if len(path.vertices) == 0: continue
+            if small:
+                lod = get_box_path(path)
+            elif isinstance(getattr(d,"_source",d),TextDrawable): # 字形路径不简化，_segment为文字的边框
+                continue
+            else: # 路径坐标下的容差
+                lod = simplify_segment(d._segment,self.tolerance / (scale * _get_instance_scale(artist)))
+            lods.append((artist,path,lod))
+        return lods
+
+    def apply(self,ax,nodes):
+        '''以ax当前的放缩替换nodes中artist的路径，需要与restore成对调用'''
+        (x0,y0),(x1,y1) = ax.transData.transform([(0,0),(1,1)])
+        scale = max(abs(x1 - x0),abs(y1 - y0)) # 每单位数据长度的像素数
+        if scale == 0: return
+        bucket = int(np.floor(np.log2(scale)))
+        scale = 2.0 ** (bucket + 1) # 取级别的上界，保证误差不超过容差
+        for node in nodes:
+            if not node.drawables: continue
+            bbox = node.get_datalim() # node缓存的边框，几何改变时重新生成
+            entry = self._cache.get(node)
+            if entry is None or entry[0] is not bbox: # 几何改变过，缓存失效
+                entry = self._cache[node] = (bbox,{})
+            lods = entry[1]
+            self._stats["hits" if bucket in lods else "misses"] += 1
+            if bucket not in lods: lods[bucket] = self._get_lod_paths(node,bbox,bucket,scale)
+            for a,path,lod in lods[bucket]:
+                a.set_path(lod)
+                self._applied.append((a,path))
+
+    def restore(self):
+        '''恢复被替换的原始路径'''
+        for a,path in self._applied:
+            a.set_path(path)
+        self._applied = []
@@ -1,5 +1,7 @@
 from canvas import Canvas
 import matplotlib.pyplot as plt
+import numpy as np
+import os
 
 def _test_style():
     _style_dct = dict(stroke="p:r,t:2",fill="red",alpha=0.5)
@@ -120,6 +122,51 @@ def test_bezier_through():
     
     cv.line(a, "b.ctrl-0", "b.ctrl-1", c, stroke="p:gray")
     plt.show()
+def test_boolean():
+    cv = Canvas()
+    cv.circle((0,0),radius=1,name="a")
+    cv.rect((0,-0.5),(2,0.5),name="b")
+    cv.union("a","b",remove=True,fill="gray")
+    cv.translate((0,-3))
+    a = cv.circle((0,0),radius=1)
+    b = cv.circle((1,0),radius=1)
+    cv.difference(a,b,remove=True,fill="red")
+    plt.show()
+def test_text():
+    cv = Canvas()
+    cv.rect((0,0),(3,1),name="a")
+    cv.text("a.center","pytez",size=0.5)
+    cv.text("a.south","label",anchor="north",size=0.3)
+    cv.text("a.east","$x^2$",anchor="west",size=0.3,fill="red")
+    plt.show()
+def test_plot():
+    cv = Canvas()
+    cv.plot(lambda x : np.sin(1/x),(0.05,2),stroke="p:blue")
+    cv.plot(lambda t : (np.cos(t),np.sin(2*t)),(0,2*np.pi),smooth=False,mark={"symbol":">"})
+    plt.show()
+def test_threads():
+    from concurrent.futures import ThreadPoolExecutor
+    def build(i):
+        cv = Canvas() # 非主线程中不经过pyplot
+        for j in range(10): cv.circle((j,0),radius=0.4,fill=plt.cm.viridis(i / 4))
+        cv.text((4.5,1),f"thread {i}",size=0.5)
+        cv.autoscale()
+        return cv.get_content_hash()
+    with ThreadPoolExecutor(4) as ex:
+        hashes = list(ex.map(build,range(4)))
+    assert hashes == [build(i) for i in range(4)]
+def test_cache():
+    import tempfile
+    from cache import RenderCache
+    cache = RenderCache(tempfile.mkdtemp())
+    cv = Canvas()
+    cv.circle((0,0),radius=1)
+    with tempfile.TemporaryDirectory() as d:
+        low = cv.save(os.path.join(d,"low.png"),cache=cache,dpi=50)
+        cv.save(os.path.join(d,"low.png"),cache=cache,dpi=50)
+        cv.save(os.path.join(d,"high.png"),cache=cache,dpi=100)
+        assert os.path.getsize(low) < os.path.getsize(os.path.join(d,"high.png"))
+    assert cache.stats["hits"] == 1 and cache.stats["misses"] == 2
 
 if __name__ == '__main__':
     test_bezier_through()
\ No newline at end of file
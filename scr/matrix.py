@@ -23,6 +23,18 @@ def get_xy_by_transform(t,xy):
     t = check_transform(t)
     x,y,_ = np.dot(t,xy)
     return x[0],y[0]
+def get_xys_by_transform(t,xys):
+    '''get_xy_by_transform的批量版本,xys:(N,2)'''
+    xys = np.asarray(xys,dtype=float).reshape(-1,2)
+    t = check_transform(t)
+    return xys @ t[:2,:2].T + t[:2,2]
+def get_scale_by_transform(t):
+    '''若t为相似变换(旋转,平移,均匀放缩,镜像)返回其放缩系数，否则返回None'''
+    t = check_transform(t)
+    A = t[:2,:2]
+    s = np.sqrt(abs(np.linalg.det(A)))
+    if np.allclose(A @ A.T,np.eye(2) * s**2): return s
+    return None
 # 获取变换矩阵
 def get_transform_by_rad(mat,rad):
     mat = check_transform(mat)
@@ -35,20 +35,36 @@ _style_to_mpl_kwargs(用于在设置Drawable样式时将样式参数转换为mpl
 3. check函数如何设置
 
     check函数接收预定的样式，且返回预定样式完整的值。
+
+4. 注册表与线程
+
+   注册的样式和Drawable保存在只读的Registry快照中，register_style,register_drawable以写时复制替换全局快照，只影响之后创建的Canvas。
+   每个Canvas绑定创建时的快照，Canvas.register_style,Canvas.register_drawable只修改该Canvas的快照，不会影响其他Canvas。
+   set_precompute_compass等选项同样保存在快照中。
+   Canvas的绘图函数在执行时通过use_registry激活自己的快照(按线程隔离)，因此可以在多个线程中同时构建不同的Canvas。
 '''
 
 
 import matplotlib.patches as mpatch
 from matplotlib.path import Path
+from matplotlib.transforms import Affine2D
+from matplotlib.textpath import TextPath,text_to_path
+from matplotlib.font_manager import FontProperties
+from matplotlib import cbook
+import functools
 import re 
 import numpy as np 
 from matplotlib.colors import to_rgba
 from abc import abstractmethod,ABC
-from types import FunctionType
+from types import FunctionType,MappingProxyType
+from contextlib import contextmanager
+import threading
+import contextvars
 
-from utilities import segment_to_CV,to_xy,to_rad,codes_vects_to_segment,check_segment,getUnitCircle_CV
-from bezier import segment_to_coefs,coefs_to_center,coefs_to_area,coefs_to_length_and_nodeweight,get_bezier_point,bezier_line_intersection
-from matrix import get_transform_by_rad,get_transform_by_reverse,get_xy_by_transform
+from utilities import segment_to_CV,to_xy,to_rad,codes_vects_to_segment,check_segment,getUnitCircle_CV,parse_anchor,RE_float
+from bezier import segment_to_coefs,ctrls_to_coefs,coefs_to_bbox,flatten_coefs,coefs_to_center,coefs_to_area,coefs_to_length_and_nodeweight,get_bezier_point,transform_coefs,coefs_ray_intersections,coefs_arc_length_table,coefs_points_at_lengths,flatten_to_polylines,points_in_edges,get_flatten_counts
+from matrix import get_transform_by_rad,get_transform_by_translate,get_transform_by_reverse,get_xy_by_transform,xy_to_angle_radius,get_xys_by_transform,get_scale_by_transform,check_transform
+from profiler import register_lru_cache
 
 ##############################################################################
 ###             Drawable: 与artist的接口类                                  ###
@@ -58,10 +74,10 @@ from matrix import get_transform_by_rad,get_transform_by_reverse,get_xy_by_trans
 ## 设置对样式的支持和检查函数,支持扩展
 ## style检查函数会同时在drawable 以及 canvas使用
 
-RE_float = r"-?(\d+(\.\d+)?|\.\d+)"
 RE_node_name= RE_anchor_name = r"[a-z|_|\d][a-z|_|\d|-]*"
+PAT_node_name = PAT_anchor_name = re.compile(RE_node_name)
 
-_tg_style = {
+_tg_builtin_style = {
     "total" : {
         "hidden" : False,
         "alpha" : 1,
@@ -166,33 +182,116 @@ def check_path(**style):
         style[k] = v
     return style
 
-_tg_style_check = {
-    "total" : check_total,
-    "path" : check_path,
-}
+class Registry():
+    '''样式与Drawable注册表的只读快照
+
+    - style : {样式类型:默认样式}
+    - style_check : {样式类型:检查函数}
+    - drawables : {drawtype:Drawable类}
+    - precompute_compass : 为True时第一次查询方位锚点会一次求出全部方位锚点，参见Node.precompute_compass
+    with_style,with_drawable,with_options返回修改后的新快照(写时复制)，已有的快照不会改变，因此可以在线程之间共享。
+    '''
+    __slots__ = ("style","style_check","drawables","precompute_compass","_supported_style")
+    def __init__(self,style,style_check,drawables,precompute_compass=False) -> None:
+        _set = super().__setattr__
+        _set("style",MappingProxyType({st:MappingProxyType(dict(default)) for st,default in style.items()}))
+        _set("style_check",MappingProxyType(dict(style_check)))
+        _set("drawables",MappingProxyType(dict(drawables)))
+        _set("precompute_compass",bool(precompute_compass))
+        _set("_supported_style",{}) # drawable类 -> 支持的样式键，同一个类的实例共享
+    def __setattr__(self,name,value):
+        raise AttributeError("Registry是只读的，使用with_style,with_drawable获得新的快照")
+    def __repr__(self):
+        return f"Registry(style={tuple(self.style)},drawables={tuple(self.drawables)})"
+    def with_style(self,name,default_style,style_check):
+        if name in ("total","path") or not isinstance(name,str) : raise ValueError("%s 不是合法的name参数" % name)
+        if not isinstance(default_style,dict):
+            raise TypeError("default_style 必需为 dict 类型")
+        if not isinstance(style_check,FunctionType):
+            raise TypeError("style_check 必需为函数")
+        return Registry(self.style | {name:default_style},self.style_check | {name:style_check},self.drawables,self.precompute_compass)
+    def with_drawable(self,drawable_cls):
+        if not isinstance(drawable_cls,type) or not issubclass(drawable_cls,Drawable):
+            raise ValueError("%s Not a subclass from %s" % (drawable_cls,Drawable))
+        type_ = getattr(drawable_cls,"drawtype",None)
+        if type_ is None: raise ValueError("%s not has the type attribute" % (drawable_cls))
+        return Registry(self.style,self.style_check,self.drawables | {type_:drawable_cls},self.precompute_compass)
+    def with_options(self,precompute_compass=None):
+        '''返回修改了选项的新快照，None表示不修改'''
+        return Registry(self.style,self.style_check,self.drawables,
+                        self.precompute_compass if precompute_compass is None else precompute_compass)
+    def supported_style(self,drawable_cls):
+        supported_style = self._supported_style.get(drawable_cls)
+        if supported_style is None:
+            supported_style = frozenset().union(*(self.style[k].keys() for k in ("total",*drawable_cls.style_types)))
+            self._supported_style[drawable_cls] = supported_style
+        return supported_style
+
+_tg_registry = Registry(_tg_builtin_style,{"total":check_total,"path":check_path},{}) # 全局快照，新建的Canvas绑定此时的快照
+_tg_registry_lock = threading.Lock() # 串行化全局快照的替换
+_tg_active_registry = contextvars.ContextVar("pytez_registry",default=None)
+
+def get_registry():
+    '''返回当前使用的注册表快照：use_registry激活的快照(如Canvas绑定的快照)，否则为全局快照'''
+    registry = _tg_active_registry.get()
+    return _tg_registry if registry is None else registry
+
+@contextmanager
+def use_registry(registry):
+    '''在当前线程(上下文)中激活registry，Drawable的样式检查和get_drawable使用它'''
+    token = _tg_active_registry.set(registry)
+    try:
+        yield registry
+    finally:
+        _tg_active_registry.reset(token)
+
+_tg_default_anchors = {'center':None,'north':'90deg','south':'-90deg','west':'180deg','east':'0deg',
+                       'north-east':'45deg','north-west':'135deg','south-west':'-135deg','south-east':'-45deg',
+                       'start':0,'mid':'50%','end':'100%'}
+_tg_compass = ('north','south','west','east','north-east','north-west','south-west','south-east')
+_COMPASS_KEY = ("compass",None) # _anchor_cache中标记方位锚点已经预计算的键
+
+_tg_segment_kinds = {} # 共享相同的segment结构
+
+def pack_segment(segment):
+    '''将segment打包为 (结构,顶点数组)，结构为 ((type,顶点数),...) 的元组，顶点数组为(K,2)'''
+    kinds = tuple((seg[0],len(seg) - 1) for seg in segment)
+    kinds = _tg_segment_kinds.setdefault(kinds,kinds)
+    vertices = np.array([xy for seg in segment for xy in seg[1:]],dtype=float).reshape(-1,2)
+    return kinds,vertices
+
+def unpack_segment(kinds,vertices):
+    '''pack_segment的逆操作，顶点为顶点数组的视图'''
+    segment,i = [],0
+    for kind,n in kinds:
+        segment.append((kind,*vertices[i:i+n]))
+        i += n
+    return segment
 
 class Drawable(ABC):
     '''Base class for Drawables'''
+    __slots__ = ("_kinds","_vertices","_style","_artist")
     drawtype = None
     style_types = None
     def __init__(self,segment,**style) -> None:
         if self.drawtype is None or self.style_types is None : raise ValueError("class attribute: (drawtype,style_types) must be setted")
         # segment 
-        self._segment = []
-        try:
-            for seg in segment:
-                if seg[0] not in ("line","cubic"): raise TypeError(f"{seg[0]}不支持的格式")
-                self._segment.append((seg[0],*[to_xy(xy) for xy in seg[1:]]))
-        except Exception as e: 
-            raise ValueError(f"segment不符合格式要求:{e}")
+        self._segment = check_segment(segment)
         # style
         self._style = self._check_style(**style)
         self._artist = self._get_artist()
-        self._supported_style = set()
-        for k in ("total",*(self.style_types)):
-            self._supported_style |= set(_tg_style[k].keys())
-        
 
+    # segment以打包的数组储存
+    @property
+    def _segment(self):
+        if self._vertices is None: # 不保存segment的drawable(如from_path生成的)，由artist的路径还原
+            path = self._artist.get_path()
+            if len(path.vertices) == 0: return []
+            return check_segment(codes_vects_to_segment(list(path.codes),path.vertices))
+        return unpack_segment(self._kinds,self._vertices)
+    @_segment.setter
+    def _segment(self,segment):
+        self._kinds,self._vertices = pack_segment(segment)
 
     # 自我描述
     def get_description_dict(self):
@@ -205,24 +304,41 @@ class Drawable(ABC):
         return "Drawable:%s %s" % (self.drawtype,self.get_description_dict())
     @property
     def supported_style(self):
-        return self._supported_style
+        return get_registry().supported_style(type(self))
     # check style
     def _check_style(self,**style):
+        '''styleclass为stylesheet.StyleRecord时，与记录中的值为同一对象的键已经检查过，直接使用'''
         _style_types = ("total",*self.style_types)
+        registry = get_registry()
+        record = style.pop("styleclass",None)
         style_dct = {}
         for k in style:
+            if record is not None and record.is_checked(k,style[k]) and k in registry.supported_style(type(self)):
+                style_dct[k] = style[k]
+                continue
             k_type = None
             for _type in _style_types:
-                if k in _tg_style[_type]: k_type = _type
+                if k in registry.style[_type]: k_type = _type
             if k_type is None : raise ValueError("%s is not supported style" % k)
             else:
-                style_dct.update(_tg_style_check[k_type](**{k:style[k]}))
+                style_dct.update(registry.style_check[k_type](**{k:style[k]}))
         return style_dct
 
         
     def get_artist(self):
         '''返回生成的artist'''
         return self._artist
+    # geometry
+    def set_segment(self,segment):
+        '''原地替换segment，并更新artist的路径数据，不重新生成artist'''
+        self._segment = check_segment(segment)
+        self._artist.set_path(self._segment_to_path(self._segment))
+    def transform(self,mat):
+        '''对segment的所有顶点施加仿射变换mat(3,3)，并更新artist的路径数据'''
+        kinds,vertices = pack_segment(self._segment)
+        if len(vertices) == 0: return
+        self._kinds,self._vertices = kinds,get_xys_by_transform(mat,vertices)
+        self._artist.set_path(self._segment_to_path(self._segment))
     # style 
     def set(self,**style):
         style = self._check_style(**style)
@@ -242,13 +358,11 @@ class Drawable(ABC):
         return mpl_kwargs
     # bounding
     def get_datalim(self):
-        '''返回segment中数据的范围:(xmin,ymin),(xmax,ymax)'''
-        verts = []
-        for seg in self._segment:
-            verts.extend(seg[1:])
-        #if not verts: verts = [(0,0)]
-        xs,ys = zip(*verts)
-        return (min(xs),min(ys)),(max(xs),max(ys))
+        '''返回segment中曲线的精确范围:(xmin,ymin),(xmax,ymax)'''
+        if self._vertices is None: # 没有保存segment时直接由artist的路径求范围，不还原segment
+            (xmin,ymin),(xmax,ymax) = self._artist.get_path().get_extents().get_points()
+            return (xmin,ymin),(xmax,ymax)
+        return coefs_to_bbox(segment_to_coefs(self._segment))
     # segment to Path
     def _segment_to_path(self,segment):
         '''由segment生成path对象'''
@@ -279,7 +393,7 @@ class Drawable(ABC):
         pass
     
 class PathDrawable(Drawable):
-
+    __slots__ = ()
     # type , style_types
     drawtype = "path"
     style_types = ("path",)
@@ -289,6 +403,14 @@ class PathDrawable(Drawable):
         path = self._segment_to_path(self._segment)
         kwargs = self._style_to_mpl_kwargs(**self._style)
         return  mpatch.PathPatch(path,**kwargs)    
+    @classmethod
+    def from_path(cls,path,**style):
+        '''由matplotlib的Path直接生成drawable，不保存segment，需要时由artist的路径还原'''
+        self = cls.__new__(cls)
+        self._kinds = self._vertices = None
+        self._style = self._check_style(**style)
+        self._artist = mpatch.PathPatch(path,**self._style_to_mpl_kwargs(**self._style))
+        return self
     # anchor segment
     def get_anchor_segment(self):
         '''返回使用计算的segment'''
@@ -317,33 +439,41 @@ class PathDrawable(Drawable):
                     raise KeyError("%s is not supported by Drawable: %s" %(k,self.drawtype))
         return mpl_kwargs
 
-_tg_drawables = {
-    "path":PathDrawable,
-}
+class InstancePatch(mpatch.PathPatch):
+    '''以仿射变换绘制共享Path的PathPatch，变换作为patch transform，在绘制时与Axes的transData组合'''
+    def __init__(self,path,matrix,**kwargs) -> None:
+        super().__init__(path,**kwargs)
+        self._instance_transform = Affine2D(matrix)
+    def get_patch_transform(self):
+        return self._instance_transform
+    def set_matrix(self,matrix):
+        self._instance_transform.set_matrix(matrix)
+        self.stale = True
 
 def register_style(name,default_style,style_check):
-    if name in ("total","path") or not isinstance(name,str) : raise ValueError("%s 不是合法的name参数" % name)
-    if not isinstance(default_style,dict):
-        raise TypeError("default_style 必需为 dict 类型")
-    if not isinstance(style_check,FunctionType):
-        raise TypeError("style_check 必需为函数")
-    _tg_style.update({name:default_style})
-    _tg_style_check.update({name:style_check})
+    '''在全局快照中注册样式，只影响之后创建的Canvas，只作用于一个Canvas时使用Canvas.register_style'''
+    global _tg_registry
+    with _tg_registry_lock:
+        _tg_registry = _tg_registry.with_style(name,default_style,style_check)
 
 def register_drawable(drawable_cls):
-    '''注册一个drawable实例'''
+    '''在全局快照中注册一个drawable类，只影响之后创建的Canvas'''
+    global _tg_registry
+    with _tg_registry_lock:
+        _tg_registry = _tg_registry.with_drawable(drawable_cls)
 
-    if not issubclass(drawable_cls,Drawable):
-        raise ValueError("%s Not a subclass from %s" % (drawable_cls,Drawable))
-    try:
-        type_ = drawable_cls.drawtype
-    except :
-        raise ValueError("%s not has the type attribute" % (drawable_cls))
-    _tg_drawables.update({type_:drawable_cls})
+register_drawable(PathDrawable)
+
+def set_precompute_compass(enabled=True):
+    '''在全局快照中设置是否在第一次查询方位锚点时批量预计算全部方位锚点，只影响之后创建的Canvas，参见Node.precompute_compass'''
+    global _tg_registry
+    with _tg_registry_lock:
+        _tg_registry = _tg_registry.with_options(precompute_compass=bool(enabled))
 
 def get_drawable(drawtype,segment,**style):
-    if drawtype not in _tg_drawables : raise ValueError("drawable : %s does not exist" % drawtype)
-    return _tg_drawables[drawtype](segment=segment,**style)
+    drawables = get_registry().drawables
+    if drawtype not in drawables : raise ValueError("drawable : %s does not exist" % drawtype)
+    return drawables[drawtype](segment=segment,**style)
 
 ###############################################################
 ##                注册常用Style和Dawable                       ##
@@ -365,7 +495,7 @@ def check_circle(**style):
     style = check_path(**style)
     if r is not None: style["radius"] = r
     return style
-register_style(name="circle",default_style={"radius":(1,1)} | _tg_style["path"] ,style_check= check_circle )
+register_style(name="circle",default_style={"radius":(1,1)} | _tg_registry.style["path"] ,style_check= check_circle )
 # mark style and drawable
 _tg_symbol = {
     ">":"arrow",
@@ -416,20 +546,28 @@ def check_mark(**style):
         mark_dct[k] = v 
     style = check_path(**style)
     return mark_dct | style 
-register_style(name="mark",default_style={"symbol":None,"poses":[(0,0)],"angle":0,"scale":(1,1),"reverse":False} | _tg_style["path"],style_check= check_mark)
+register_style(name="mark",default_style={"symbol":None,"poses":[(0,0)],"angle":0,"scale":(1,1),"reverse":False} | _tg_registry.style["path"],style_check= check_mark)
+def get_line_mark_frames(segment):
+    '''返回line的mark的位置和角度 ((终点,终点处的方向角),(起点,起点处的方向角))，方向均朝向路径之外'''
+    end,start = np.asarray(segment[-1][-1],dtype=float),np.asarray(segment[0][1],dtype=float)
+    return (end,xy_to_angle_radius(end - segment[-1][-2])[0]),(start,xy_to_angle_radius(start - segment[0][2])[0])
+
 class MarkDrawable(PathDrawable):
     '''MarkDrawable 是一类特殊的PathDrawable，其本身不参与锚点计算，但是可以显示图案在指定位置
     
     除了和PathDrawable一样的调用方式之外，还支持通过symbol,poses,angle,scale,reverse值来使用一些预定以的mark。
     '''
+    __slots__ = ("_frame",) # 由单个pose和angle生成时的(位置,角度)，用于路径端点改变后移动mark
     drawtype = "mark"
     style_types = ("mark",)
     
     
     def _get_artist(self):
         '''支持symbol,poses,angle,scale,reverse生成预定以artist,前提为segment == []'''
+        self._frame = None
         if self._segment : return super()._get_artist()
         symbol,poses,angle,scale,reverse = map(self._style.pop,("symbol","poses","angle","scale","reverse"))
+        if len(poses) == 1: self._frame = (np.asarray(poses[0],dtype=float),angle)
         d = self.getMarkbyStyle(symbol=symbol,poses=poses,angle=angle,scale=scale,reverse=reverse,**self._style)
         self._segment = d._segment
         self._style = d._style
@@ -438,6 +576,11 @@ class MarkDrawable(PathDrawable):
     def get_anchor_segment(self):
         '''不参与anchor计算'''
         return []
+    def move_frame(self,pose,angle):
+        '''将由单个pose生成的mark刚体地移动到新的位置pose和角度angle(弧度)'''
+        p0,a0 = self._frame
+        self.transform(get_transform_by_translate(get_transform_by_rad(get_transform_by_translate(np.eye(3),pose),angle - a0),-p0))
+        self._frame = (np.asarray(pose,dtype=float),angle)
     
     @classmethod
     def getUnitMark_CV(cls,symbol):
@@ -507,11 +650,34 @@ class MarkDrawable(PathDrawable):
             _codes.extend(codes)
         segment = codes_vects_to_segment(_codes,_vects)
         return cls(segment,**style)        
+    @classmethod
+    def getMarksbyTangents(cls,symbol,poses,tangents,angle=0,scale=(1,1),reverse=False,**style):
+        '''在poses(N,2)处沿单位切向量tangents(N,2)的方向放置symbol，angle为相对切向的角度
+
+        所有mark的顶点在一次广播中求出，每CHUNK_SIZE个mark共用一个drawable(一条复合路径)，返回drawable的列表。
+        '''
+        mark_dct = check_mark(symbol=symbol,angle=angle,scale=scale,reverse=reverse)
+        symbol,angle,scale,reverse = map(mark_dct.get,("symbol","angle","scale","reverse"))
+        if symbol is None: raise ValueError("symbol is None, can't build a MarkDrawable")
+        codes,vects = cls.getUnitMark_CV(symbol) if isinstance(symbol,str) else segment_to_CV(symbol)
+        mat = get_transform_by_rad(np.eye(3),angle)
+        if reverse:
+            mat = get_transform_by_reverse(mat,1,0,0)
+        vects = get_xys_by_transform(mat,np.asarray(vects,dtype=float) * scale) # (V,2)
+        poses,tangents = np.asarray(poses,dtype=float).reshape(-1,2),np.asarray(tangents,dtype=float).reshape(-1,2)
+        cos,sin = tangents[:,0,None],tangents[:,1,None]
+        vertices = np.stack([cos*vects[:,0] - sin*vects[:,1],sin*vects[:,0] + cos*vects[:,1]],axis=-1) + poses[:,None] # (N,V,2)
+        codes = np.asarray(codes,dtype=Path.code_type)
+        drawables = []
+        for i in range(0,len(vertices),NodeGroup.CHUNK_SIZE):
+            chunk = vertices[i:i + NodeGroup.CHUNK_SIZE]
+            drawables.append(cls.from_path(Path(chunk.reshape(-1,2),np.tile(codes,len(chunk))),**style))
+        return drawables
 register_drawable(MarkDrawable)
 # line style
 def check_line(**style):
     # 在path的基础上增加了mark
-    _defautlt_mark_dct = _tg_style["mark"] | {"start":True,"end":False}
+    _defautlt_mark_dct = get_registry().style["mark"] | {"start":True,"end":False}
     def _check_line_mark(**mstyle):
         # 基于mark，添加start,end (bool),且每次返回都是一个完整的mark字典，因为mark这里作为了一整个值，必需具有这些
         mstyle = _defautlt_mark_dct | mstyle 
@@ -528,7 +694,7 @@ def check_line(**style):
         return path_style | {"mark":mark_dct}
     else:
         return path_style
-register_style("line",default_style=_tg_style["path"] | {"mark":_tg_style["mark"] | {"start":True,"end":False}},style_check=check_line)
+register_style("line",default_style=_tg_registry.style["path"] | {"mark":_tg_registry.style["mark"] | {"start":True,"end":False}},style_check=check_line)
 # arc style
 _tg_arc_mode = ("open","close","pie")
 def check_arc(**style):
@@ -547,11 +713,121 @@ def check_arc(**style):
         style["radius"]  = radius 
     return style
 
-register_style("arc",default_style=_tg_style["line"] | {"radius":1,"mode":"open"},style_check=check_arc)
+register_style("arc",default_style=_tg_registry.style["line"] | {"radius":1,"mode":"open"},style_check=check_arc)
 # rect style
-register_style("rect",default_style=_tg_style["circle"],style_check=check_circle) # as same as circle
+register_style("rect",default_style=dict(_tg_registry.style["circle"]),style_check=check_circle) # as same as circle
 # bezier style
-register_style("bezier",default_style=_tg_style["line"],style_check=check_line) # as same as line
+register_style("bezier",default_style=dict(_tg_registry.style["line"]),style_check=check_line) # as same as line
+# text style and drawable
+def check_text(**style):
+    '''text style: 在path的基础上添加了text,font,size，size为字号(数据单位下的em高度)'''
+    text_dct = {}
+    for k in ("text","font","size"):
+        if k in style: text_dct[k] = style.pop(k)
+    for k,v in text_dct.items():
+        match k:
+            case "text": v = str(v)
+            case "font":
+                if not isinstance(v,str): raise ValueError(f"{v}不是合法的font值,必需为字体名的字符串")
+            case "size":
+                try:
+                    v = float(v)
+                except Exception:
+                    raise ValueError(f"{v}不是合法的size值")
+                if not v > 0: raise ValueError(f"{v}不是合法的size值,必需为正数")
+        text_dct[k] = v
+    return text_dct | check_path(**style)
+register_style("text",default_style={"text":"","font":"sans-serif","size":1} | _tg_registry.style["path"] | {"fill":"black","stroke":{"paint":None}},style_check=check_text)
+
+@functools.lru_cache(maxsize=1024)
+def get_text_glyphs(text,font,size):
+    '''返回文字的 (字形Path,边框(xmin,ymin,xmax,ymax),边框的GeometryTemplate)，原点为基线的起点
+
+    边框为排版的范围(宽度为前进宽度，纵向由基线以下的深度到顶部)，结果按(text,font,size)缓存，相同的文字共享字形路径。
+    '''
+    if not text:
+        path,box = Path(np.zeros((0,2))),(0.,0.,0.,0.)
+    else:
+        prop = FontProperties(family=[font],size=size)
+        path = TextPath((0,0),text,size=size,prop=prop)
+        w,h,d = text_to_path.get_text_width_height_descent(text,prop,ismath=cbook.is_math_text(text))
+        box = (0.,-float(d),float(w),float(h - d))
+    return path,box,GeometryTemplate.from_box(*box)
+register_lru_cache("get_text_glyphs",get_text_glyphs)
+
+_tg_text_anchors = {'center':(0.5,0.5),'north':(0.5,1),'south':(0.5,0),'west':(0,0.5),'east':(1,0.5),
+                    'north-east':(1,1),'north-west':(0,1),'south-west':(0,0),'south-east':(1,0),
+                    'base':(0.5,None),'base-west':(0,None),'base-east':(1,None)} # 边框上的比例位置，None表示基线
+
+def get_text_anchor(box,anchor):
+    '''返回文字锚点在文字自身坐标系下的坐标，不是文字锚点时返回None'''
+    if anchor not in _tg_text_anchors: return None
+    (fx,fy),(xmin,ymin,xmax,ymax) = _tg_text_anchors[anchor],box
+    return np.array([xmin + fx*(xmax - xmin),0. if fy is None else ymin + fy*(ymax - ymin)])
+
+class TextDrawable(PathDrawable):
+    '''文字drawable，artist以patch transform绘制缓存的字形路径，同一文字的所有drawable共享字形和边框
+
+    - matrix : 文字坐标系(原点为基线的起点)到数据坐标的变换
+    _segment为文字坐标系下的边框，锚点segment和范围为变换后的边框。segment参数不使用，只能为空。
+    '''
+    __slots__ = ("_matrix","_glyphs")
+    drawtype = "text"
+    style_types = ("text",)
+    _text_keys = ("text","font","size")
+    def __init__(self,segment=(),matrix=None,**style) -> None:
+        if len(segment): raise ValueError("TextDrawable的路径由文字生成，segment必需为空")
+        self._kinds = self._vertices = None
+        self._matrix = np.eye(3,dtype=float) if matrix is None else check_transform(matrix)
+        self._style = self._check_style(**(get_registry().style["text"] | style))
+        self._artist = self._get_artist()
+
+    @property
+    def _segment(self):
+        return self._glyphs[2].get_segment(np.eye(3))
+    def get_description_dict(self):
+        return {
+            "type":self.drawtype,
+            "transform":self._matrix,
+            "style":self._style
+        }
+    def _get_glyphs(self):
+        return get_text_glyphs(*map(self._style.get,self._text_keys))
+    def _get_artist(self):
+        self._glyphs = self._get_glyphs()
+        return InstancePatch(self._glyphs[0],self._matrix,**self._style_to_mpl_kwargs(**self._style))
+    def _style_to_mpl_kwargs(self,**style):
+        return super()._style_to_mpl_kwargs(**{k:v for k,v in style.items() if k not in self._text_keys})
+    def set(self,**style):
+        super().set(**style)
+        if any(k in style for k in self._text_keys):
+            self._glyphs = self._get_glyphs()
+            self._artist.set_path(self._glyphs[0])
+
+    @property
+    def box(self):
+        '''文字坐标系下的边框 (xmin,ymin,xmax,ymax)'''
+        return self._glyphs[1]
+    @property
+    def template(self):
+        '''(边框的GeometryTemplate,变换)'''
+        return self._glyphs[2],self._matrix
+    def set_matrix(self,matrix):
+        self._matrix = check_transform(matrix)
+        self._artist.set_matrix(self._matrix)
+    def set_segment(self,segment):
+        raise ValueError("文字的路径由文字生成，不能设置segment，请使用set(text=...)")
+    def transform(self,mat):
+        self.set_matrix(check_transform(mat) @ self._matrix)
+
+    def get_local_coefs(self):
+        return transform_coefs(self._glyphs[2].coefs,self._matrix)
+    def get_datalim(self):
+        xys = get_xys_by_transform(self._matrix,self._glyphs[2].vertices) # 仿射变换下矩形的范围由顶点确定
+        return tuple(xys.min(axis=0)),tuple(xys.max(axis=0))
+    def get_anchor_segment(self):
+        return self._glyphs[2].get_segment(self._matrix)
+register_drawable(TextDrawable)
 
 
 
@@ -569,10 +845,15 @@ class Node():
     '''
     生成artist，提供锚点计算和路径计算功能
     '''
+    __slots__ = ("name","drawables","_anchor_dct","_callbacks",
+                 "_iscontinued","_isclosed","_isgroup","_can_get_intersection",
+                 "_coefs","_center","_length","_nodeweight","_length_error","_bbox","_flat_cache","_anchor_cache","_template",
+                 "__weakref__") # 弱引用用于LOD等按node的缓存
+    CONTAINS_BLOCK = 1 << 20 # contains每块最多测试的(点,边)对数
 
-    def __init__(self,drawables,name = None) -> None:                                                                           # drawable用字典可以表示，但是它的值与artist的状态是联动的，但是实际上在生成类之后其实就没有作用了
+    def __init__(self,drawables,name = None,template = None) -> None:                                                                           # drawable用字典可以表示，但是它的值与artist的状态是联动的，但是实际上在生成类之后其实就没有作用了
         if name is not None:                                                                                                    # drawable --|转换层|--> mpl参数
-            if not isinstance(name,str) or not re.fullmatch(RE_node_name,name) : raise ValueError(f"{name}不是支持的Node名")      # 用户 -->drawable--> artist 
+            if not isinstance(name,str) or not PAT_node_name.fullmatch(name) : raise ValueError(f"{name}不是支持的Node名")      # 用户 -->drawable--> artist 
         self.name = name    
         self.drawables = []
         for d in drawables:
@@ -580,9 +861,17 @@ class Node():
                 self.drawables.append(get_drawable(**d))
             else:
                 self.drawables.append(d)
-        self._supported_style = set()
-        for d in self.drawables:
-            self._supported_style |= d.supported_style
+        ## 锚点字典和回调在第一次使用时创建
+        self._anchor_dct = None
+        self._callbacks = None
+        ## (GeometryTemplate,变换矩阵)，锚点segment为模板的仿射像时由模板推导几何数据
+        self._template = template
+        self._build_geometry()
+
+    def _build_geometry(self):
+        '''由drawables的锚点segment计算锚点所需的几何数据'''
+        self._bbox = self._flat_cache = self._anchor_cache = None
+        if self._template is not None: return self._build_geometry_from_template()
         data_segment = []
         for d in self.drawables:
             data_segment.extend(d.get_anchor_segment())
@@ -607,13 +896,81 @@ class Node():
             self._isgroup = False
             self._coefs = segment_to_coefs(data_segment)
             self._can_get_intersection = True if (self._isclosed and not np.isclose(coefs_to_area(self._coefs),0)) else False 
-        ## 设置锚点字典
-        self._anchor_dct = {}
         ## 如果可以获取交点，则具有 _center
-        if self._can_get_intersection:
-            self._center = coefs_to_center(self._coefs)
-        ## 路径计算用的总长度，结点权重
-        self._length,self._nodeweight,self._length_error = coefs_to_length_and_nodeweight(self._coefs)
+        self._center = coefs_to_center(self._coefs) if self._can_get_intersection else None
+        ## 路径计算用的总长度，结点权重，在第一次路径计算时求值
+        self._length = self._nodeweight = self._length_error = None
+
+    def _build_geometry_from_template(self):
+        '''系数和中心随变换映射，面积按行列式放缩，不需要积分'''
+        template,mat = self._template
+        self._iscontinued,self._isclosed,self._isgroup = True,template.isclosed,False
+        self._coefs = transform_coefs(template.coefs,mat)
+        self._can_get_intersection = template.center is not None and not np.isclose(template.area * np.linalg.det(mat[:2,:2]),0)
+        self._center = tuple(get_xys_by_transform(mat,template.center)[0]) if self._can_get_intersection else None
+        self._length = self._nodeweight = self._length_error = None
+
+    def _get_length_and_nodeweight(self):
+        if self._length is None:
+            scale = get_scale_by_transform(self._template[1]) if self._template is not None else None
+            if scale is not None: # 相似变换下由模板的长度按比例放缩
+                length,self._nodeweight,error = self._template[0].get_length_and_nodeweight()
+                self._length,self._length_error = length * scale,error * scale
+            else:
+                self._length,self._nodeweight,self._length_error = coefs_to_length_and_nodeweight(self._coefs)
+        return self._length,self._nodeweight
+
+    # 几何更新
+    def update_geometry(self,*segments,anchors=None):
+        '''原地更新drawables的segment，复用已有的artist。
+
+        - segments : 按顺序对应各drawable的新segment，None表示不变
+        - anchors : 需要同时更新的自定义锚点字典
+        '''
+        if len(segments) > len(self.drawables): raise ValueError(f"segment的数量超过了drawable的数量:{len(self.drawables)}")
+        marks = [d for d in self.drawables if getattr(d,"_frame",None) is not None] # 位于路径端点的mark随端点移动
+        moves = {}
+        for d,seg in zip(self.drawables,segments):
+            if seg is None: continue
+            if marks and not isinstance(d,MarkDrawable) and d._segment and seg:
+                for (p0,a0),frame in zip(get_line_mark_frames(d._segment),get_line_mark_frames(check_segment(seg))):
+                    for m in marks:
+                        if id(m) not in moves and np.allclose(m._frame[0],p0) and np.isclose(m._frame[1],a0):
+                            moves[id(m)] = (m,frame)
+                            break
+            d.set_segment(seg)
+        for m,(pose,angle) in moves.values():
+            m.move_frame(pose,angle)
+        if anchors is not None:
+            for anchor,xy in anchors.items(): self._update_anchor_dct(anchor,xy)
+        self._template = None
+        self._build_geometry()
+        self._notify("geometry")
+    def apply_transform(self,mat):
+        '''对node施加仿射变换mat(3,3)，原地更新artist的路径数据。
+
+        锚点所需的几何数据由变换直接推导：系数和中心随变换映射，相似变换下长度按比例放缩，
+        一般仿射变换下长度在下一次路径计算时重新求值。组的边框需要重新计算。
+        '''
+        mat = check_transform(mat)
+        for d in self.drawables:
+            d.transform(mat)
+        for anchor,xy in (self._anchor_dct or {}).items():
+            self._anchor_dct[anchor] = to_xy(get_xys_by_transform(mat,xy)[0])
+        self._bbox = self._flat_cache = self._anchor_cache = None
+        if self._template is not None: self._template = (self._template[0],mat @ self._template[1])
+        if self._isgroup: 
+            self._build_geometry()
+        else:
+            self._coefs = transform_coefs(self._coefs,mat)
+            if self._center is not None:
+                self._center = tuple(get_xys_by_transform(mat,self._center)[0])
+            scale = get_scale_by_transform(mat)
+            if scale is not None and self._length is not None:
+                self._length = self._length * scale
+            else:
+                self._length = self._nodeweight = self._length_error = None
+        self._notify("geometry")
         
     # 自我描述
     def get_description_dict(self):
@@ -628,7 +985,7 @@ class Node():
         return f"{self.__class__}({self.get_description_dict()})"
     @property
     def supported_style(self):
-        return self._supported_style
+        return frozenset().union(*(d.supported_style for d in self.drawables))
     # artists
     @property
     def artists(self):
@@ -642,29 +999,107 @@ class Node():
         '''
         为Aritists设置style值。
         '''
-        for k,v in style:
+        for k,v in style.items():
             if k not in self.supported_style: raise ValueError("%s is a bad value for set style,support key : %s" %(k,self.supported_style))
             for d in self.drawables:
                 if k in d.supported_style:
                     d.set(**{k:v})
+        self._notify("style")
+    def remove_artists(self):
+        '''将artists从其所在的Axes中移除'''
+        for a in self.iter_artists():
+            if a.axes is not None or a.figure is not None: a.remove()
+    # 回调
+    def add_callback(self,func):
+        '''添加在node几何或样式改变后调用的函数 func(node,event)，event为"geometry"或"style"，返回用于删除的id'''
+        if self._callbacks is None: self._callbacks = {}
+        cid = max(self._callbacks,default=-1) + 1
+        self._callbacks[cid] = func
+        return cid
+    def remove_callback(self,cid):
+        if self._callbacks is not None: self._callbacks.pop(cid,None)
+    def _notify(self,event):
+        if not self._callbacks: return
+        for func in list(self._callbacks.values()):
+            func(self,event)
     # 边框管理
     def _get_bounding_box(self):
-        '''返回Node的边框((xmin,xmax),(ymin,ymax))，用于自动调整画布以及部分锚点计算'''
-        verts = []
-        for d in self.drawables:
-            verts.extend(d.get_datalim())
-        xs,ys = zip(*verts)
-        return (min(xs),min(ys)),(max(xs),max(ys))
+        '''返回Node的精确边框((xmin,ymin),(xmax,ymax))，用于自动调整画布以及部分锚点计算，结果会被缓存'''
+        if self._bbox is None and not self.drawables: # 只有锚点的node，边框为自定义锚点的范围
+            xys = np.array(list((self._anchor_dct or {}).values()),dtype=float).reshape(-1,2)
+            self._bbox = (tuple(xys.min(axis=0)),tuple(xys.max(axis=0))) if len(xys) else ((np.nan,np.nan),(np.nan,np.nan))
+        if self._bbox is None:
+            lims = np.array([np.ravel(d.get_datalim()) for d in self.drawables],dtype=float) # (D,4)
+            xmin,ymin = lims[:,:2].min(axis=0)
+            xmax,ymax = lims[:,2:].max(axis=0)
+            self._bbox = (xmin,ymin),(xmax,ymax)
+        return self._bbox
     def _get_bounding_segment(self):
-        (xmin,xmax),(ymin,ymax) = self._get_bounding_box()
+        (xmin,ymin),(xmax,ymax) = self._get_bounding_box()
         return [("line",(xmin,ymin),(xmax,ymin),(xmax,ymax),(xmin,ymax),(xmin,ymin))]
     def get_datalim(self):
         return self._get_bounding_box()
+    def get_anchor_coefs(self):
+        '''返回锚点segment的系数(N,2,4)，与_coefs不同，不连续的node返回各段本身而不是边框'''
+        if self._iscontinued: return self._coefs
+        segment = []
+        for d in self.drawables:
+            segment.extend(d.get_anchor_segment())
+        return segment_to_coefs(segment)
+    def get_points_at_lengths(self,lengths,tolerance=1e-3):
+        '''返回锚点路径上弧长lengths(M,)处的点(M,2)和单位切向量(M,2)，弧长表按tolerance缓存，参见bezier.coefs_arc_length_table'''
+        if self._flat_cache is None: self._flat_cache = {}
+        key = ("arc_length",tolerance)
+        if key not in self._flat_cache:
+            coefs = self.get_anchor_coefs()
+            self._flat_cache[key] = (coefs,coefs_arc_length_table(coefs,tolerance))
+        coefs,table = self._flat_cache[key]
+        return coefs_points_at_lengths(coefs,table,lengths)
+    def get_arc_length(self,tolerance=1e-3):
+        '''返回由弧长表得到的锚点路径总长度(不连续的node为各段长度之和)'''
+        self.get_points_at_lengths([0],tolerance)
+        return self._flat_cache[("arc_length",tolerance)][1][0][-1]
+    def get_polyline(self,tolerance=1e-3):
+        '''返回锚点路径展开后的折线 (vertices,offsets)，参见bezier.flatten_coefs，结果按tolerance缓存'''
+        if self._flat_cache is None: self._flat_cache = {}
+        if tolerance not in self._flat_cache:
+            self._flat_cache[tolerance] = flatten_coefs(self._coefs,tolerance)
+        return self._flat_cache[tolerance]
+    def _get_ring_edges(self,tolerance):
+        '''返回锚点路径中所有闭合环展开后的边 (starts,ends)，均为(E,2)，结果按tolerance缓存'''
+        if self._flat_cache is None: self._flat_cache = {}
+        key = ("rings",tolerance)
+        if key not in self._flat_cache:
+            rings = [r for r in flatten_to_polylines(self.get_anchor_coefs(),tolerance) if len(r) > 2 and np.allclose(r[0],r[-1])]
+            self._flat_cache[key] = (np.concatenate([r[:-1] for r in rings]),np.concatenate([r[1:] for r in rings])) if rings else None
+        return self._flat_cache[key]
+    def contains(self,points,tolerance=1e-3):
+        '''返回(M,)的布尔数组，表示points(M,2)是否在node的闭合环围成的区域内(偶奇规则)。没有闭合环的node总是返回False
+
+        组和不连续的node(如布尔运算的结果)使用各段本身的所有闭合环，洞和各部分之间的空隙不算在内。
+        先以边框过滤，再对展开后的边(按tolerance缓存)分块做射线测试。
+        '''
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        result = np.zeros(len(points),dtype=bool)
+        if not self._can_get_intersection or len(points) == 0: return result
+        (xmin,ymin),(xmax,ymax) = self._get_bounding_box()
+        idx = np.nonzero((points[:,0] >= xmin) & (points[:,0] <= xmax) & (points[:,1] >= ymin) & (points[:,1] <= ymax))[0]
+        if len(idx) == 0: return result
+        edges = self._get_ring_edges(tolerance)
+        if edges is None: return result
+        starts,ends = edges
+        step = max(self.CONTAINS_BLOCK//len(starts),1)
+        for i in range(0,len(idx),step):
+            sub = idx[i:i + step]
+            result[sub] = points_in_edges(points[sub],starts,ends)
+        return result
     # 锚点
     def _update_anchor_dct(self,anchor,xy):
-        if not re.fullmatch(RE_anchor_name,anchor): raise ValueError("锚点的命名不符合规范")
+        if not PAT_anchor_name.fullmatch(anchor): raise ValueError("锚点的命名不符合规范")
         xy = to_xy(xy)
+        if self._anchor_dct is None: self._anchor_dct = {}
         self._anchor_dct[anchor] = xy
+        if not self.drawables: self._bbox = None
     def add_anchor(self,anchor,xy):
         return self._update_anchor_dct(anchor,xy)
     def _is_segment_continued_and_closed(self,segment):
@@ -681,78 +1116,280 @@ class Node():
         return _continue , (_joint and _continue)
     ## 返回锚点值
     def calculate_anchors(self,anchor=None):
-        '''根据anchor的值返回坐标'''
-        default_anchors = {'center':None,'north':'90deg','south':'-90deg','west':'180deg','east':'0deg','start':0,'mid':'50%','end':'100%'}
-        if anchor in default_anchors: anchor = default_anchors[anchor]
+        '''根据anchor的值返回坐标，长度，百分数和角度锚点的结果按解析后的值缓存，几何改变时失效'''
+        if anchor in _tg_default_anchors: anchor = _tg_default_anchors[anchor]
         if anchor is None: 
             if self._can_get_intersection: return self._center
-            else: return self.get_point('50%')
+            else: anchor = '50%'
         anchor = str(anchor)
-        if re.fullmatch(RE_float,anchor):
-            return self.get_point(float(anchor)) #长度
-        if re.fullmatch(RE_float+"%",anchor):
-            return self.get_point(anchor) # 百分数
-        if self._can_get_intersection:
-            if re.fullmatch(RE_float+'rad',anchor):
-                rad = float(anchor[:-3])
-                rs = self.get_point_by_rad(rad)
-                if len(rs) != 1: raise ValueError(f"由{anchor}锚点所确定的值不唯一，结果为{rs}")
-                return rs[0]
-            if re.fullmatch(RE_float+'deg',anchor):
-                rad = np.radians(float(anchor[:-3]))
-                rs = self.get_point_by_rad(rad)
+        if self._anchor_dct is not None and anchor in self._anchor_dct: return self._anchor_dct[anchor] # 自定义锚点优先，可以是"0"这样的名字
+        kind,value = parse_anchor(anchor)
+        if kind == "name" or (kind == "rad" and not self._can_get_intersection):
+            raise ValueError(f"{anchor}不存在，或者未注册")
+        if self._anchor_cache is not None and (kind,value) in self._anchor_cache:
+            return self._anchor_cache[(kind,value)]
+        match kind:
+            case "length": xy = self.get_point(value) #长度
+            case "percent": xy = self._get_point_by_percent(value) # 百分数
+            case "rad":
+                if get_registry().precompute_compass and (self._anchor_cache is None or _COMPASS_KEY not in self._anchor_cache):
+                    self.precompute_compass()
+                    if ("rad",value) in self._anchor_cache: return self._anchor_cache[("rad",value)]
+                rs = self.get_point_by_rad(value)
                 if len(rs) != 1: raise ValueError(f"由{anchor}锚点所确定的值不唯一，结果为{rs}")
-                return rs[0]
-        if anchor in self._anchor_dct:
-            return self._anchor_dct[anchor]
-        return TypeError(f"{anchor}不存在，或者未注册")
+                xy = rs[0]
+        return self._cache_anchor((kind,value),xy)
+    def _cache_anchor(self,key,xy):
+        xy = np.array(xy,dtype=float)
+        xy.flags.writeable = False # 缓存的值被共享，不允许原地修改
+        if self._anchor_cache is None: self._anchor_cache = {}
+        self._anchor_cache[key] = xy
+        return xy
+    def precompute_compass(self):
+        '''以一次批量的射线求交计算全部方位锚点(north,south,west,east及四个对角方向)并缓存，返回{锚点名:坐标}
+
+        结果不唯一的方向不缓存，查询时仍然报错。
+        '''
+        if self._anchor_cache is None: self._anchor_cache = {}
+        self._anchor_cache[_COMPASS_KEY] = True # 已经预计算过，之前缓存的其他锚点不影响判断
+        if not self._can_get_intersection: return {}
+        keys = [parse_anchor(_tg_default_anchors[a]) for a in _tg_compass]
+        result = {}
+        for a,key,rs in zip(_tg_compass,keys,coefs_ray_intersections(self._coefs,self._center,[k[1] for k in keys])):
+            if len(rs) == 1: result[a] = self._cache_anchor(key,rs[0])
+        return result
     # 路径计算
+    def _get_point_by_percent(self,t):
+        _,nodeweight = self._get_length_and_nodeweight()
+        assert 0<= t <= 1
+        i = min(int(np.searchsorted(nodeweight,t)) + 1,len(nodeweight)) # 在补0后的nodeweight中满足 t <= nodeweight[i] 的第一个i
+        lower = nodeweight[i-2] if i > 1 else 0
+        t = (t - lower)/(nodeweight[i-1] - lower)
+        return get_bezier_point(self._coefs[i-1],t)
     def get_point(self,t):
         '''根据长度或者百分数计算路径上的点'''
-        def _point_by_percent(t):
-            assert 0<= t <= 1
-            nodeweight = self._nodeweight.copy()
-            nodeweight.insert(0,0)
-            for i in range(1,len(nodeweight)):
-                if t <= nodeweight[i] : break
-            t = (t - nodeweight[i-1])/(nodeweight[i] - nodeweight[i-1])
-            return get_bezier_point(self._coefs[i-1],t)
-        if re.fullmatch(RE_float+"%",str(t)):
-            t = float(t[:-1])/100
-            return _point_by_percent(t)
-        if re.fullmatch(RE_float,str(t)):
-            t = float(t)
-            if t < 0 : raise ValueError("长度必须大于0")
-            if t > self._length : raise ValueError("长度超过曲线的长度")
-            t = t/self._length
-            return _point_by_percent(t)
+        kind,value = parse_anchor(t) if isinstance(t,str) else ("length",t)
+        if kind == "percent":
+            return self._get_point_by_percent(value)
+        if kind == "length":
+            length,_ = self._get_length_and_nodeweight()
+            value = float(value)
+            if value < 0 : raise ValueError("长度必须大于0")
+            if value > length : raise ValueError("长度超过曲线的长度")
+            return self._get_point_by_percent(value/length)
         raise TypeError(f"{t}不是支持的参数，支持长度和百分数")
     def get_point_by_rad(self,rad):
+        '''返回由中心出发，方向角为rad的射线与路径的交点(m,2)'''
         if not self._can_get_intersection: raise NotImplemented("由于node的曲线并不连续且封闭，因而不提供根据角度取值")
-        _deg1 = (rad/np.pi)*180 % 360 
-        _deg2 = (_deg1 - 90) % 180
-        flag = 'x' if 45 <= _deg2 <= 125 else 'y'
-        match flag:
-            case 'x': 
-                _sign = True if  np.cos(rad) > 0 else False
-            case 'y':
-                _sign = True if np.sin(rad) > 0 else False
-        points = []
-        line_vect = np.cos(rad) , np.sin(rad)
-        line_point = self._center
-        for coef in self._coefs:
-            result_p = bezier_line_intersection(coef,line_point=line_point,line_vect=line_vect)
-            for p in result_p:
-                if len(points) == 0 or ( not np.array([ p.all() for p in np.isclose(points,p) ]).any()):
-                    # 符号判断
-                    match flag:
-                        case "x": 
-                            if not (((p[0] - line_point[0]) > 0 ) ^ _sign):
-                                points.append(p)
-                        case "y":
-                            if not (((p[1] - line_point[1]) > 0 ) ^ _sign):
-                                points.append(p)
-                    
-        return np.array(points,dtype=float)
-
-assert "total" in _tg_style
\ No newline at end of file
+        return coefs_ray_intersections(self._coefs,self._center,[rad])[0]
+
+class GeometryTemplate():
+    '''单位图形(如单位圆，单位圆弧)的几何数据，其仿射像的几何由变换推导，不需要重新积分
+
+    - segment : 连续的锚点segment
+    闭合路径的面积和中心在创建时求值，长度在第一次使用时求值。
+    '''
+    __slots__ = ("kinds","vertices","coefs","isclosed","area","center","_length")
+    _is_segment_continued_and_closed = Node._is_segment_continued_and_closed
+    def __init__(self,segment) -> None:
+        segment = check_segment(segment)
+        continued,self.isclosed = self._is_segment_continued_and_closed(segment)
+        if not continued: raise ValueError("模板的segment必需连续")
+        self.kinds,self.vertices = pack_segment(segment)
+        self.coefs = segment_to_coefs(segment)
+        self.area = coefs_to_area(self.coefs) if self.isclosed else 0
+        self.center = coefs_to_center(self.coefs) if self.isclosed and not np.isclose(self.area,0) else None
+        self._length = None
+    @classmethod
+    def from_box(cls,xmin,ymin,xmax,ymax):
+        '''矩形的模板，面积和中心直接求出'''
+        self = cls.__new__(cls)
+        segment = [("line",(xmin,ymin),(xmax,ymin),(xmax,ymax),(xmin,ymax),(xmin,ymin))]
+        self.isclosed = True
+        self.kinds,self.vertices = pack_segment(segment)
+        self.coefs = segment_to_coefs(segment)
+        self.area = (xmax - xmin) * (ymax - ymin)
+        self.center = ((xmin + xmax)/2,(ymin + ymax)/2) if not np.isclose(self.area,0) else None
+        self._length = None
+        return self
+    def get_length_and_nodeweight(self):
+        '''返回 (长度,结点权重,误差)'''
+        if self._length is None: self._length = coefs_to_length_and_nodeweight(self.coefs)
+        return self._length
+    def get_segment(self,mat):
+        '''返回模板在变换mat(3,3)下的segment'''
+        return unpack_segment(self.kinds,get_xys_by_transform(mat,self.vertices))
+
+class TextNode(Node):
+    '''Canvas.text生成的文字node，几何为文字边框的模板(参见get_text_glyphs)
+
+    方位锚点(north,south-east等)为边框上的对应点，另有基线上的锚点base,base-west,base-east。
+    修改text,font,size样式时几何随之更新。
+    '''
+    __slots__ = ()
+    def __init__(self,drawable,name=None) -> None:
+        if not isinstance(drawable,TextDrawable): raise TypeError(f"{drawable}不是TextDrawable")
+        super().__init__([drawable],name=name,template=drawable.template)
+    @property
+    def text(self):
+        return self.drawables[0]._style["text"]
+    def set(self,**style):
+        super().set(**style)
+        if any(k in style for k in TextDrawable._text_keys):
+            self._template = self.drawables[0].template
+            self._build_geometry()
+            self._notify("geometry")
+    def update_geometry(self,*segments,anchors=None):
+        raise ValueError("文字的几何由文字生成，不支持按segment更新，请使用apply_transform或set(text=...)")
+    def calculate_anchors(self,anchor=None):
+        '''自定义锚点优先，其次为文字锚点，其余锚点按边框路径计算'''
+        if anchor is None: anchor = "center"
+        if isinstance(anchor,str) and anchor in _tg_text_anchors and (self._anchor_dct is None or anchor not in self._anchor_dct):
+            d = self.drawables[0]
+            return get_xys_by_transform(d._matrix,get_text_anchor(d.box,anchor))[0]
+        return super().calculate_anchors(anchor)
+
+class NodeGroup(Node):
+    '''批量绘图函数生成的node组，各项的顶点按数组保存，每CHUNK_SIZE项共用一个drawable(一条复合路径)
+
+    Agg不能绘制过大的填充路径，因此路径按块切分。
+
+    - item_vertices : (N,V,2)，每项路径的顶点(与item_codes对应)
+    - item_codes : (V,)，每项路径的Path codes
+    - item_kinds,item_index : 每项segment的结构以及由路径顶点取出segment顶点的下标，参见pack_segment
+    - names : 可选的各项名字，对应的Node在第一次使用时生成
+
+    组的锚点与其他组相同，由边框计算。
+    '''
+    __slots__ = ("_item_vertices","_item_codes","_item_kinds","_item_index","_item_names","_items")
+    CHUNK_SIZE = 2048
+    def __init__(self,item_vertices,item_codes,item_kinds,item_index,name=None,names=None,**style) -> None:
+        self._item_vertices = np.asarray(item_vertices,dtype=float)
+        self._item_codes = np.asarray(item_codes,dtype=Path.code_type)
+        self._item_kinds = _tg_segment_kinds.setdefault(tuple(item_kinds),tuple(item_kinds))
+        self._item_index = np.asarray(item_index,dtype=int)
+        if len(self._item_vertices) == 0: raise ValueError("NodeGroup至少需要一项")
+        if names is not None:
+            names = list(names)
+            if len(names) != len(self._item_vertices): raise ValueError(f"names的长度{len(names)}与项数{len(self._item_vertices)}不一致")
+            for n in names:
+                if not isinstance(n,str) or not PAT_node_name.fullmatch(n): raise ValueError(f"{n}不是支持的Node名")
+            names = dict(zip(names,range(len(names))))
+        self._item_names = names
+        super().__init__([PathDrawable.from_path(path,**style) for path in self._get_paths()],name=name)
+    def __len__(self):
+        return len(self._item_vertices)
+    def _get_paths(self):
+        '''按块返回各项的复合路径，顶点为item_vertices的视图'''
+        paths = []
+        for i in range(0,len(self._item_vertices),self.CHUNK_SIZE):
+            chunk = self._item_vertices[i:i + self.CHUNK_SIZE]
+            paths.append(Path(chunk.reshape(-1,2),np.tile(self._item_codes,len(chunk))))
+        return paths
+    def _get_item_coefs(self):
+        vertices = self._item_vertices[:,self._item_index]
+        coefs,i = [],0
+        for kind,n in self._item_kinds:
+            P = vertices[:,i:i+n]
+            if kind == "line": P = np.stack([P[:,:-1],P[:,1:]],axis=2)
+            coefs.append(ctrls_to_coefs(P.reshape(-1,P.shape[-2],2)))
+            i += n
+        return np.concatenate(coefs)
+    def _build_geometry(self):
+        self._bbox = self._flat_cache = self._anchor_cache = self._items = None
+        self._bbox = coefs_to_bbox(self._get_item_coefs())
+        self._iscontinued,self._isclosed = False,False
+        self._isgroup = self._can_get_intersection = True
+        self._coefs = segment_to_coefs(self._get_bounding_segment()) # 路径为边框
+        self._center = coefs_to_center(self._coefs)
+        self._length = self._nodeweight = self._length_error = None
+    def _get_item_edges(self,tolerance):
+        '''返回闭合项展开后的边 starts,ends(K,E,2)和各项的边框(K,2,2)，各项按边框的xmin排序，结果按tolerance缓存
+
+        所有项使用相同的等分数(各段所需的最大值)，展开在一次广播中完成。首尾不相接的项不闭合，不参与contains。
+        '''
+        if self._flat_cache is None: self._flat_cache = {}
+        key = ("item_edges",tolerance)
+        if key not in self._flat_cache:
+            N = len(self._item_vertices)
+            blocks = np.split(self._get_item_coefs(),np.cumsum([N*(n - 1 if kind == "line" else 1) for kind,n in self._item_kinds])[:-1])
+            coefs = np.concatenate([b.reshape(N,-1,2,4) for b in blocks],axis=1) # (N,S,2,4)，项内按segment的顺序
+            c = int(get_flatten_counts(coefs,tolerance).max())
+            t = np.linspace(0,1,c + 1)[:,None]
+            xys = coefs[...,None,:,0] + t*(coefs[...,None,:,1] + t*(coefs[...,None,:,2] + t*coefs[...,None,:,3])) # (N,S,c+1,2)
+            xys = xys.reshape(N,-1,2)
+            closed = np.all(np.isclose(xys[:,0],xys[:,-1]),axis=1)
+            xys = xys[closed]
+            bbox = np.stack([xys.min(axis=1),xys.max(axis=1)],axis=1)
+            order = np.argsort(bbox[:,0,0],kind="stable")
+            xys,bbox = xys[order],bbox[order]
+            starts,ends = np.delete(xys,np.s_[c::c + 1],axis=1),np.delete(xys,np.s_[::c + 1],axis=1) # 各segment的边，不含segment之间的零长度边
+            self._flat_cache[key] = (starts,ends,bbox)
+        return self._flat_cache[key]
+    def contains(self,points,tolerance=1e-3):
+        '''points是否在任意一个闭合项内
+
+        各项按xmin排序，由最大宽度二分查找每个点的候选项，再以项的边框过滤得到(点,项)对，对各对分块做射线测试。
+        '''
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        result = np.zeros(len(points),dtype=bool)
+        if len(points) == 0: return result
+        (xmin,ymin),(xmax,ymax) = self._get_bounding_box()
+        idx = np.nonzero((points[:,0] >= xmin) & (points[:,0] <= xmax) & (points[:,1] >= ymin) & (points[:,1] <= ymax))[0]
+        starts,ends,bbox = self._get_item_edges(tolerance)
+        if len(idx) == 0 or len(bbox) == 0: return result
+        xs = points[idx,0]
+        lo = np.searchsorted(bbox[:,0,0],xs - (bbox[:,1,0] - bbox[:,0,0]).max(),"left")
+        counts = np.searchsorted(bbox[:,0,0],xs,"right") - lo
+        bounds = np.cumsum(counts)
+        step = max(self.CONTAINS_BLOCK//starts.shape[1],1) # 每块最多CONTAINS_BLOCK个(点,边)对
+        i = 0
+        while i < len(idx):
+            j = max(int(np.searchsorted(bounds,bounds[i] - counts[i] + step,"right")),i + 1)
+            n = counts[i:j]
+            p = np.repeat(np.arange(i,j),n)
+            k = np.repeat(lo[i:j] - np.cumsum(n) + n,n) + np.arange(n.sum()) # 候选的(点,项)对
+            P = points[idx[p]]
+            keep = np.all((P >= bbox[k,0]) & (P <= bbox[k,1]),axis=1)
+            p,k = p[keep],k[keep]
+            result[idx[p[points_in_edges(P[keep],starts[k],ends[k])]]] = True
+            i = j
+        return result
+    def update_geometry(self,*segments,anchors=None):
+        raise ValueError("NodeGroup不支持按segment更新，请使用set_items")
+    def set_items(self,item_vertices):
+        '''以相同结构的顶点数组(N,V,2)原地替换所有项，复用artist'''
+        item_vertices = np.asarray(item_vertices,dtype=float)
+        if item_vertices.shape[1:] != self._item_vertices.shape[1:]: raise ValueError(f"顶点数组的形状{item_vertices.shape}与原有的结构{self._item_vertices.shape}不一致")
+        if len(item_vertices) != len(self._item_vertices): raise ValueError("NodeGroup不能改变项数")
+        self._item_vertices = item_vertices
+        for d,path in zip(self.drawables,self._get_paths()):
+            d.get_artist().set_path(path)
+        self._build_geometry()
+        self._notify("geometry")
+    def apply_transform(self,mat):
+        mat = check_transform(mat)
+        for anchor,xy in (self._anchor_dct or {}).items():
+            self._anchor_dct[anchor] = to_xy(get_xys_by_transform(mat,xy)[0])
+        shape = self._item_vertices.shape
+        self.set_items(get_xys_by_transform(mat,self._item_vertices.reshape(-1,2)).reshape(shape))
+
+    # 各项
+    @property
+    def item_names(self):
+        return list(self._item_names or ())
+    def get_item_segment(self,i):
+        return unpack_segment(self._item_kinds,self._item_vertices[i][self._item_index])
+    def get_item(self,i):
+        '''返回第i项(或名为i的项)的Node，该Node不含artist的注册，只用于锚点计算，结果会被缓存'''
+        if isinstance(i,str):
+            if self._item_names is None or i not in self._item_names: raise KeyError(f"{i}不是组中的项")
+            name,i = i,self._item_names[i]
+        else:
+            name = None
+        if self._items is None: self._items = {}
+        if i not in self._items:
+            self._items[i] = Node([get_drawable("path",segment=self.get_item_segment(i),**self.drawables[0]._style)],name=name)
+        return self._items[i]
+
+assert "total" in _tg_registry.style
\ No newline at end of file
@@ -0,0 +1,91 @@
+'''此模块提供函数图像的自适应采样，用于Canvas.plot。
+
+f以NumPy数组调用，返回y(函数图像 y=f(x))或(x,y)(参数曲线)，所有的求值都是批量的：
+先在定义域上均匀取samples个区间，之后每一轮一次求出所有待检查区间两个三等分点的值，
+三等分点到弦的距离超过tolerance的区间被三等分(不浪费已求的值)，新的区间在下一轮继续检查，直到没有需要细分的区间或达到max_depth轮。
+值不是有限数的点处路径断开。采样结果按(f,domain,samples,tolerance,max_depth)缓存，f按对象身份区分。
+
+采样点可以由catmull_rom_to_cubic转换为C1连续的三阶贝塞尔曲线，切向按参数间距加权，对非均匀的采样同样适用。
+'''
+import functools
+
+import numpy as np
+
+from profiler import register_lru_cache
+
+
+def _evaluate(f,t):
+    '''返回f在t(N,)处的点(N,2)'''
+    values = np.asarray(f(t),dtype=float)
+    if values.ndim == 0 or values.shape == t.shape:
+        return np.stack([t,np.broadcast_to(values,t.shape)],axis=1)
+    if values.shape == (2,) + t.shape:
+        return values.T.copy()
+    raise ValueError(f"f的返回值形状{values.shape}不合法,必需为{t.shape}(y)或{(2,) + t.shape}(x,y)")
+
+def _chord_distance(points,a,b):
+    '''points(N,2)到线段a,b(N,2)的距离'''
+    ab = b - a
+    length2 = np.einsum("ij,ij->i",ab,ab)
+    u = np.einsum("ij,ij->i",points - a,ab) / np.where(length2 > 0,length2,1)
+    foot = a + np.clip(u,0,1)[:,None] * ab
+    return np.hypot(*(points - foot).T)
+
+@functools.lru_cache(maxsize=256)
+def sample_function(f,domain,samples=64,tolerance=None,max_depth=8):
+    '''自适应采样，返回只读的 (参数t(N,),点(N,2))
+
+    - domain : (a,b)，参数的范围
+    - tolerance : 中点到弦的最大距离，None时取初始采样范围的1e-3
+    两端点与三等分点中只有部分为有限数的区间总是被细分，以确定断开的位置。
+    '''
+    a,b = map(float,domain)
+    if not a < b: raise ValueError(f"{domain}不是合法的domain,必需满足a < b")
+    if int(samples) < 1: raise ValueError(f"{samples}不是合法的samples值,必需为正整数")
+    t = np.linspace(a,b,int(samples) + 1)
+    points = _evaluate(f,t)
+    if tolerance is None:
+        finite = points[np.isfinite(points).all(axis=1)]
+        tolerance = 1e-3 * np.ptp(finite,axis=0).max() if len(finite) else 0.
+    check = np.ones(len(t) - 1,dtype=bool) # 需要检查的区间
+    for _ in range(int(max_depth)):
+        index = np.flatnonzero(check)
+        if not len(index): break
+        t0,t1 = t[index],t[index + 1]
+        tm = np.stack([(2*t0 + t1)/3,(t0 + 2*t1)/3],axis=1) # 每个区间的两个三等分点
+        pm = _evaluate(f,tm.ravel()).reshape(-1,2,2)
+        p0,p1 = points[index],points[index + 1]
+        finite = np.stack([np.isfinite(p).all(axis=-1) for p in (p0,pm[:,0],pm[:,1],p1)])
+        with np.errstate(invalid="ignore"):
+            error = np.maximum(_chord_distance(pm[:,0],p0,p1),_chord_distance(pm[:,1],p0,p1))
+            split = np.where(finite.all(axis=0),error > tolerance,finite.any(axis=0))
+        index = index[split]
+        t = np.insert(t,np.repeat(index + 1,2),tm[split].ravel())
+        points = np.insert(points,np.repeat(index + 1,2),pm[split].reshape(-1,2),axis=0)
+        check = np.zeros(len(check),dtype=bool)
+        check[index] = True
+        check = np.repeat(check,np.where(check,3,1)) # 细分的区间变为三个待检查的区间
+    t.flags.writeable = points.flags.writeable = False # 结果被缓存共享
+    return t,points
+register_lru_cache("sample_function",sample_function)
+
+def split_finite(t,points):
+    '''按非有限的点将采样切分为连续的段，返回[(t,points),...]，只有一个点的段被舍弃'''
+    finite = np.isfinite(points).all(axis=1)
+    edges = np.flatnonzero(np.diff(np.concatenate([[0],finite.astype(np.int8),[0]])))
+    return [(t[i:j],points[i:j]) for i,j in zip(edges[::2],edges[1::2]) if j - i > 1]
+
+def catmull_rom_to_cubic(t,points):
+    '''返回经过points(N,2)的三阶贝塞尔曲线的控制点 (p0,c1,c2,p1)，各为(N-1,2)
+
+    内部点的切向为两侧差商按参数间距的加权平均(对二次曲线精确，均匀采样时即Catmull-Rom)，端点的切向由抛物线外推。
+    '''
+    h = np.diff(t)[:,None]
+    d = np.diff(points,axis=0) / h # 各区间的差商
+    m = np.empty_like(points)
+    if len(points) == 2:
+        m[:] = d[0]
+    else:
+        m[1:-1] = (h[1:]*d[:-1] + h[:-1]*d[1:]) / (h[:-1] + h[1:])
+        m[0],m[-1] = 2*d[0] - m[1],2*d[-1] - m[-2]
+    return points[:-1],points[:-1] + m[:-1]*h/3,points[1:] - m[1:]*h/3,points[1:]
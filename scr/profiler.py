@@ -0,0 +1,140 @@
+'''此模块提供绘图热点的计时工具。
+
+Profiler在进入时将各阶段的函数替换为计时包装，退出时恢复原函数，因而关闭时没有任何额外开销。
+记录的阶段有:
+
+- to_abs_pos : 坐标解析
+- style : 样式加载与检查
+- geometry : Node锚点几何的预计算(积分等)
+- artist : artist的生成
+- autoscale : 画布的自动放缩
+
+每个阶段同时按所在的绘图函数(Canvas.PRIMITIVES)分别统计墙钟时间和调用次数，
+另外汇总通过register_cache_stats注册的缓存命中率。注意计时包装是进程全局的，不要在多个线程中同时使用。
+'''
+import time
+import json
+import functools
+
+
+_tg_cache_stats = {}
+
+def register_cache_stats(name,func):
+    '''注册缓存统计函数func() -> {"hits":int,"misses":int}，Profiler导出时汇总其在计时期间的增量'''
+    _tg_cache_stats[name] = func
+
+def register_lru_cache(name,func):
+    '''注册functools.lru_cache包装的函数的命中统计'''
+    def _stats():
+        info = func.cache_info()
+        return {"hits":info.hits,"misses":info.misses}
+    register_cache_stats(name,_stats)
+
+def _get_stage_targets():
+    '''返回 (owner,attr,stage) 的序列'''
+    from canvas import Canvas,CTX
+    from node import Node,Drawable,get_registry
+    targets = [
+        (Canvas,"to_abs_pos","to_abs_pos"),
+        (CTX,"load_style","style"),
+        (CTX,"check_style","style"),
+        (Drawable,"_check_style","style"),
+        (Node,"_build_geometry","geometry"),
+        (Canvas,"_autoscale","autoscale"),
+    ]
+    for cls in get_registry().drawables.values():
+        for c in cls.__mro__:
+            if "_get_artist" in c.__dict__ and (c,"_get_artist","artist") not in targets:
+                targets.append((c,"_get_artist","artist"))
+    for name in Canvas.PRIMITIVES:
+        targets.append((Canvas,name,None))
+    return targets
+
+
+class Profiler():
+    '''绘图的分阶段计时，作为上下文管理器使用
+
+    >>> with cv.profile() as prof:
+    ...     cv.circle((0,0))
+    >>> prof.to_dict()
+    '''
+    def __init__(self,caches=None) -> None:
+        self._caches = dict(caches or {}) # 除全局注册之外的缓存统计函数
+        self._records = {} # (primitive,stage) -> [calls,time]
+        self._active = set() # 正在计时的阶段，用于跳过递归调用的计时
+        self._primitive = None
+        self._originals = []
+        self._cache_start = self._cache_end = {}
+
+    def _record(self,primitive,stage,dt):
+        rec = self._records.setdefault((primitive,stage),[0,0.0])
+        rec[0] += 1
+        rec[1] += dt
+
+    def _wrap_stage(self,func,stage):
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if stage in self._active: # 递归调用只计次数
+                self._record(self._primitive,stage,0.0)
+                return func(*args,**kwargs)
+            self._active.add(stage)
+            t = time.perf_counter()
+            try:
+                return func(*args,**kwargs)
+            finally:
+                self._active.discard(stage)
+                self._record(self._primitive,stage,time.perf_counter() - t)
+        return wrapper
+    def _wrap_primitive(self,func,name):
+        @functools.wraps(func)
+        def wrapper(*args,**kwargs):
+            if self._primitive is not None: return func(*args,**kwargs) # 只统计最外层的绘图函数
+            self._primitive = name
+            t = time.perf_counter()
+            try:
+                return func(*args,**kwargs)
+            finally:
+                self._primitive = None
+                self._record(name,"total",time.perf_counter() - t)
+        return wrapper
+
+    def __enter__(self):
+        if self._originals: raise RuntimeError("Profiler不能重复进入")
+        for owner,attr,stage in _get_stage_targets():
+            func = owner.__dict__[attr]
+            self._originals.append((owner,attr,func))
+            wrapper = self._wrap_primitive(func,attr) if stage is None else self._wrap_stage(func,stage)
+            setattr(owner,attr,wrapper)
+        self._cache_start = self._collect_cache_stats()
+        return self
+    def __exit__(self,*exc):
+        for owner,attr,func in reversed(self._originals):
+            setattr(owner,attr,func)
+        self._originals = []
+        self._cache_end = self._collect_cache_stats()
+        return False
+
+    def _collect_cache_stats(self):
+        return {name:dict(func()) for name,func in (_tg_cache_stats | self._caches).items()}
+    def _get_cache_stats(self):
+        end = self._cache_end if not self._originals else self._collect_cache_stats()
+        stats = {}
+        for name,e in end.items():
+            s = self._cache_start.get(name,{"hits":0,"misses":0})
+            hits,misses = e["hits"] - s["hits"],e["misses"] - s["misses"]
+            stats[name] = {"hits":hits,"misses":misses,"hit_rate":hits / (hits + misses) if hits + misses else 0.0}
+        return stats
+
+    def to_dict(self):
+        '''导出为字典: {"stages":{stage:{calls,time}},"primitives":{primitive:{stage:{calls,time}}},"caches":{name:{hits,misses,hit_rate}}}'''
+        stages,primitives = {},{}
+        for (primitive,stage),(calls,t) in self._records.items():
+            if stage != "total":
+                s = stages.setdefault(stage,{"calls":0,"time":0.0})
+                s["calls"] += calls
+                s["time"] += t
+            if primitive is not None:
+                primitives.setdefault(primitive,{})[stage] = {"calls":calls,"time":t}
+        return {"stages":stages,"primitives":primitives,"caches":self._get_cache_stats()}
+    def to_json(self,**kwargs):
+        return json.dumps(self.to_dict(),**kwargs)
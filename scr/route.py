@@ -0,0 +1,210 @@
+'''此模块提供node之间连线的路由。
+
+GridRouter维护一个均匀的占用网格：闭合的node和组(可以求交点的node)按边框登记为障碍，
+网格随Canvas的注册和删除增量更新，不需要在每次连线时重建。
+
+正交路由在以(格子,方向)为状态的图上运行A*，每步代价为1，转弯额外付出bend_penalty，
+启发函数为曼哈顿距离(两端不共线时加上一次转弯)。搜索先限制在两端边框外扩margin格的窗口中，
+失败时扩大到整个网格，仍然失败时退化为直线。
+连线的两端位于node的中心时，由bezier.coefs_ray_intersections求出路径离开(进入)node的点并裁剪。
+'''
+import heapq
+
+import numpy as np
+
+from bezier import coefs_ray_intersections
+
+_tg_dirs = ((1,0),(0,1),(-1,0),(0,-1)) # 方向的编号即下标
+
+
+class GridRouter():
+    '''Canvas的连线路由器，一般通过Canvas.get_router()创建
+
+    - cell : 格子的边长，None时取已注册障碍的边框短边的中位数的一半
+    - bend_penalty : 每次转弯的额外代价，以格子数计
+    - margin : 搜索窗口在两端边框外扩的格子数
+
+    node的几何改变后占用不会自动更新，可以调用rebuild。
+    '''
+    def __init__(self,canvas,cell=None,bend_penalty=2.0,margin=8) -> None:
+        self._canvas = canvas
+        nodes = [n for n in canvas.iter_nodes() if self._is_obstacle(n)]
+        if cell is None:
+            sizes = [min(np.ptp(n.get_datalim(),axis=0)) for n in nodes]
+            sizes = [s for s in sizes if s > 0]
+            cell = np.median(sizes) / 2 if sizes else 0.5
+        if not float(cell) > 0: raise ValueError(f"{cell}不是合法的cell值,必需为正数")
+        self.cell = float(cell)
+        self.bend_penalty = float(bend_penalty)
+        self.margin = int(margin)
+        self._counts = np.zeros((0,0),dtype=np.int32) # 每个格子被障碍覆盖的次数
+        self._offset = np.zeros(2,dtype=np.int64) # _counts[0,0]对应的格子编号(ix,iy)
+        self._cells = {} # node -> 登记时的格子范围 (ix0,iy0,ix1,iy1)
+        for n in nodes: self._add(n)
+        self._registry_cid = canvas.add_callback(self._on_registry)
+
+    # 占用网格
+    @staticmethod
+    def _is_obstacle(node):
+        return bool(node.drawables) and node._can_get_intersection
+    def _to_cell(self,xy):
+        return np.floor(np.asarray(xy,dtype=float) / self.cell).astype(np.int64)
+    def _ensure(self,ix0,iy0,ix1,iy1):
+        '''扩展网格使其包含格子范围，向需要扩展的一侧多扩展一半以均摊复制的开销'''
+        (ox,oy),(ny,nx) = self._offset,self._counts.shape
+        if nx and ny and ox <= ix0 and oy <= iy0 and ix1 < ox + nx and iy1 < oy + ny: return
+        if not (nx and ny): ox,oy,nx,ny = ix0,iy0,1,1
+        x0,y0 = min(ox,ix0),min(oy,iy0)
+        x1,y1 = max(ox + nx,ix1 + 1),max(oy + ny,iy1 + 1)
+        padx,pady = (x1 - x0) // 2,(y1 - y0) // 2
+        if x0 < ox: x0 -= padx
+        if x1 > ox + nx: x1 += padx
+        if y0 < oy: y0 -= pady
+        if y1 > oy + ny: y1 += pady
+        counts = np.zeros((y1 - y0,x1 - x0),dtype=np.int32)
+        if self._counts.size:
+            counts[oy - y0:oy - y0 + ny,ox - x0:ox - x0 + nx] = self._counts
+        self._counts,self._offset = counts,np.array([x0,y0],dtype=np.int64)
+    def _add(self,node):
+        (ix0,iy0),(ix1,iy1) = self._to_cell(node.get_datalim())
+        self._ensure(ix0,iy0,ix1,iy1)
+        ox,oy = self._offset
+        self._counts[iy0 - oy:iy1 - oy + 1,ix0 - ox:ix1 - ox + 1] += 1
+        self._cells[node] = (ix0,iy0,ix1,iy1)
+    def _discard(self,node):
+        cells = self._cells.pop(node,None)
+        if cells is None: return
+        ix0,iy0,ix1,iy1 = cells
+        ox,oy = self._offset
+        self._counts[iy0 - oy:iy1 - oy + 1,ix0 - ox:ix1 - ox + 1] -= 1
+    def _on_registry(self,event,node):
+        if event == "register" and self._is_obstacle(node): self._add(node)
+        elif event == "remove": self._discard(node)
+    def rebuild(self):
+        '''按当前的几何重新登记所有障碍'''
+        self._counts = np.zeros((0,0),dtype=np.int32)
+        self._cells = {}
+        for n in self._canvas.iter_nodes():
+            if self._is_obstacle(n): self._add(n)
+    def disconnect(self):
+        self._canvas.remove_callback(self._registry_cid)
+    def get_blocked(self,ix0,iy0,ix1,iy1):
+        '''返回格子范围内的占用(iy1-iy0+1,ix1-ix0+1)，网格之外为空'''
+        blocked = np.zeros((iy1 - iy0 + 1,ix1 - ix0 + 1),dtype=bool)
+        (ox,oy),(ny,nx) = self._offset,self._counts.shape
+        x0,y0,x1,y1 = max(ix0,ox),max(iy0,oy),min(ix1,ox + nx - 1),min(iy1,oy + ny - 1)
+        if x0 <= x1 and y0 <= y1:
+            blocked[y0 - iy0:y1 - iy0 + 1,x0 - ix0:x1 - ix0 + 1] = self._counts[y0 - oy:y1 - oy + 1,x0 - ox:x1 - ox + 1] > 0
+        return blocked
+
+    # 路由
+    def route(self,start,end,router="orthogonal",ignore=()):
+        '''返回由start到end的路径顶点(K,2)，ignore中的node不作为障碍(一般为两端的node)'''
+        start,end = np.asarray(start,dtype=float),np.asarray(end,dtype=float)
+        if router == "straight": return np.array([start,end])
+        if router != "orthogonal": raise ValueError(f"{router}不是支持的router,支持orthogonal和straight")
+        s,e = self._to_cell(start),self._to_cell(end)
+        if np.all(s == e): return np.array([start,end])
+        m = self.margin
+        windows = [(*(np.minimum(s,e) - m),*(np.maximum(s,e) + m))]
+        if self._counts.size: # 整个网格
+            (ox,oy),(ny,nx) = self._offset,self._counts.shape
+            windows.append((min(ox,windows[0][0]) - 1,min(oy,windows[0][1]) - 1,max(ox + nx,windows[0][2]),max(oy + ny,windows[0][3])))
+        for ix0,iy0,ix1,iy1 in windows:
+            blocked = self.get_blocked(ix0,iy0,ix1,iy1)
+            for n in ignore:
+                if n in self._cells:
+                    cx0,cy0,cx1,cy1 = self._cells[n]
+                    blocked[max(cy0 - iy0,0):max(cy1 - iy0 + 1,0),max(cx0 - ix0,0):max(cx1 - ix0 + 1,0)] = False
+            blocked[s[1] - iy0,s[0] - ix0] = blocked[e[1] - iy0,e[0] - ix0] = False
+            cells = astar(blocked,(s[0] - ix0,s[1] - iy0),(e[0] - ix0,e[1] - iy0),self.bend_penalty)
+            if cells is not None:
+                return self._cells_to_points(cells + (ix0,iy0),start,end)
+        return np.array([start,end])
+    def _cells_to_points(self,cells,start,end):
+        '''由拐点的格子编号生成正交的路径，两端对齐到start和end'''
+        points = (cells + 0.5) * self.cell
+        if len(points) == 2: # 直线，两端不对齐时改为Z形
+            axis = 0 if cells[0,1] == cells[1,1] else 1
+            if np.isclose(start[1 - axis],end[1 - axis]): return np.array([start,end])
+            mid = (start[axis] + end[axis]) / 2
+            a,b = start.copy(),end.copy()
+            a[axis] = b[axis] = mid
+            return np.array([start,a,b,end])
+        for i,j,xy in ((0,1,start),(-1,-2,end)):
+            axis = 0 if cells[i,1] == cells[j,1] else 1 # 端点所在段的方向
+            points[i] = xy
+            points[j,1 - axis] = xy[1 - axis]
+        return points
+
+def astar(blocked,start,goal,bend_penalty):
+    '''在占用网格blocked(H,W)上由start到goal(格子编号(x,y))的A*搜索，状态为(格子,方向)
+
+    返回拐点(包括两端)的格子编号(K,2)，无法到达时返回None。
+    '''
+    h,w = blocked.shape
+    free = (~blocked).ravel().tolist()
+    gx,gy = map(int,goal)
+    def heuristic(x,y):
+        dx,dy = abs(x - gx),abs(y - gy)
+        return dx + dy + (bend_penalty if dx and dy else 0)
+    inf = float("inf")
+    cost = {}
+    parent = {}
+    heap = []
+    sx,sy = map(int,start)
+    for d in range(4):
+        state = (sy*w + sx)*4 + d
+        cost[state] = 0.0
+        parent[state] = -1
+        heap.append((heuristic(sx,sy),-0.0,state))
+    heapq.heapify(heap)
+    goal_index = gy*w + gx
+    found = None
+    while heap:
+        f,g,state = heapq.heappop(heap)
+        g = -g # f相同时优先展开更深的状态
+        if g > cost.get(state,inf): continue
+        index,d = divmod(state,4)
+        if index == goal_index:
+            found = state
+            break
+        y,x = divmod(index,w)
+        for nd,(dx,dy) in enumerate(_tg_dirs):
+            if nd == (d + 2) % 4: continue # 不允许掉头
+            nx,ny = x + dx,y + dy
+            if not (0 <= nx < w and 0 <= ny < h) or not free[ny*w + nx]: continue
+            ng = g + 1.0 + (bend_penalty if nd != d and parent[state] != -1 else 0.0)
+            nstate = (ny*w + nx)*4 + nd
+            if ng < cost.get(nstate,inf):
+                cost[nstate] = ng
+                parent[nstate] = state
+                heapq.heappush(heap,(ng + heuristic(nx,ny),-ng,nstate))
+    if found is None: return None
+    states = []
+    while found != -1:
+        states.append(found)
+        found = parent[found]
+    states.reverse()
+    corners = [states[0] // 4]
+    for a,b in zip(states[1:-1],states[2:]):
+        if a % 4 != b % 4: corners.append(a // 4) # 在a处转弯
+    corners.append(states[-1] // 4)
+    corners = np.array(corners)
+    return np.stack([corners % w,corners // w],axis=1)
+
+def trim_to_outline(points,node):
+    '''将由node内部出发的路径裁剪到其离开node的点，points:(K,2)
+
+    沿路径依次以每段的起点和方向求射线与node锚点路径的交点，第一个落在段内的交点即为离开的点。
+    '''
+    for k in range(len(points) - 1):
+        p,q = points[k],points[k + 1]
+        length = np.hypot(*(q - p))
+        if length == 0: continue
+        hits = coefs_ray_intersections(node._coefs,p,[np.arctan2(*(q - p)[::-1])])[0]
+        if len(hits):
+            dist = np.hypot(*(hits - p).T)
+            i = int(np.argmin(dist))
+            if dist[i] <= length: return np.concatenate([[hits[i]],points[k + 1:]])
+    return points
@@ -0,0 +1,152 @@
+'''此模块提供样式表(.pytez_style.json)的加载和预编译。
+
+样式表是一个JSON对象：
+
+- 顶层的样式键为默认样式，与Canvas.set_style(**style)相同，键作用于所有含有该键的样式类型
+- "classes" : {类名:{样式键:值}}，命名的样式类，在默认样式的基础上覆盖
+
+加载时样式表只检查一次：默认样式和每个样式类被编译为只读的StyleRecord，其中每种样式类型的样式都是检查后的完整样式，
+并预先求出path和total键对应的mpl参数。各样式类型中相等的值共用同一个对象，
+Drawable检查样式时跳过与记录中的值为同一对象的键，因此以styleclass绘图几乎没有检查的开销。
+加载的样式表按(路径,修改时间,注册表快照)缓存，多个Canvas共享；StyleRecord可以pickle，传递给其他进程。
+'''
+import os
+import json
+from types import MappingProxyType
+
+from node import get_registry,PathDrawable
+
+STYLESHEET_NAME = ".pytez_style.json"
+
+_converter = PathDrawable.__new__(PathDrawable) # 只用于样式到mpl参数的转换
+
+def _same(a,b):
+    return type(a) is type(b) and repr(a) == repr(b)
+
+def _freeze(v):
+    '''将字典和列表递归地转换为只读的MappingProxyType和元组'''
+    if isinstance(v,(dict,MappingProxyType)): return MappingProxyType({k:_freeze(x) for k,x in v.items()})
+    if isinstance(v,(list,tuple)): return tuple(_freeze(x) for x in v)
+    return v
+
+def _thaw(v):
+    '''_freeze的逆操作，MappingProxyType转换为新的字典，其他值原样返回'''
+    if isinstance(v,MappingProxyType): return {k:_thaw(x) for k,x in v.items()}
+    return v
+
+def _is_immutable(v):
+    return v is None or isinstance(v,(bool,int,float,str)) or (isinstance(v,tuple) and all(_is_immutable(x) for x in v))
+
+def merge_style(base,style):
+    '''以style覆盖base，两者都是字典的值(如stroke)按键合并'''
+    merged = dict(base)
+    for k,v in style.items():
+        merged[k] = merged[k] | v if isinstance(v,dict) and isinstance(merged.get(k),dict) else v
+    return merged
+
+def resolve_style(raw):
+    '''将{样式键:值}在当前注册表快照的默认样式的基础上检查，返回{样式类型:检查后的完整样式}，非total类型的样式包含total的键'''
+    if not isinstance(raw,dict): raise TypeError(f"{raw}不是字典，样式必需为{{样式键:值}}")
+    registry = get_registry()
+    unknown = set(raw).difference(*(st.keys() for st in registry.style.values()))
+    if unknown: raise ValueError(f"{unknown}不是支持的样式键")
+    total = registry.style_check["total"](**{k:raw.get(k,v) for k,v in registry.style["total"].items()})
+    styles = {"total":total}
+    for st,default in registry.style.items():
+        if st == "total": continue
+        styles[st] = registry.style_check[st](**{k:raw.get(k,v) for k,v in default.items()}) | total
+    # 相等的值共用同一个对象
+    canon = {}
+    for style in styles.values():
+        for k,v in style.items():
+            for c in canon.setdefault(k,[]):
+                if _same(c,v):
+                    style[k] = c
+                    break
+            else:
+                canon[k].append(v)
+    return styles
+
+class StyleRecord():
+    '''预编译的样式类，只读
+
+    - name : 类名，默认样式为None
+    - styles : {样式类型:检查后的完整样式}，嵌套的字典和列表也被冻结为MappingProxyType和元组
+    - mpl_kwargs : {样式类型:其中path和total键对应的mpl参数}
+    使用get_style获得可以修改的副本。只有不可变的值参与is_checked的同一对象判断，字典等值总是重新检查。
+    '''
+    __slots__ = ("name","styles","mpl_kwargs","_checked")
+    def __init__(self,name,styles) -> None:
+        _set = super().__setattr__
+        _set("name",name)
+        _set("styles",_freeze(styles))
+        _path_keys = get_registry().style["path"].keys() | get_registry().style["total"].keys()
+        _set("mpl_kwargs",_freeze({st:_converter._style_to_mpl_kwargs(**{k:_thaw(v) for k,v in style.items() if k in _path_keys})
+                                   for st,style in self.styles.items()}))
+        _set("_checked",frozenset((k,id(v)) for style in self.styles.values() for k,v in style.items() if _is_immutable(v)))
+    def __setattr__(self,name,value):
+        raise AttributeError("StyleRecord是只读的")
+    def __reduce__(self):
+        return (StyleRecord,(self.name,_thaw(self.styles)))
+    def __repr__(self):
+        return f"StyleRecord({self.name!r})"
+    def get_style(self,style_type):
+        '''返回style_type样式的副本，字典值为新的字典，不可变的值与记录共用'''
+        return _thaw(self.styles[style_type])
+    def is_checked(self,key,value):
+        '''value是否为记录中key的检查后的不可变值(同一对象)'''
+        return _is_immutable(value) and (key,id(value)) in self._checked
+
+class StyleSheet():
+    '''编译后的样式表，一般通过load_stylesheet获得
+
+    - defaults : 默认样式的StyleRecord
+    - classes : {类名:StyleRecord}
+    '''
+    __slots__ = ("path","defaults","classes")
+    def __init__(self,sheet,path=None) -> None:
+        if not isinstance(sheet,dict): raise TypeError("样式表必需为JSON对象")
+        sheet = dict(sheet)
+        classes = sheet.pop("classes",{})
+        if not isinstance(classes,dict): raise TypeError("classes必需为{类名:样式}的对象")
+        self.path = path
+        self.defaults = StyleRecord(None,resolve_style(sheet))
+        self.classes = {}
+        for name,style in classes.items():
+            try:
+                self.classes[name] = StyleRecord(name,resolve_style(merge_style(sheet,style)))
+            except (ValueError,TypeError) as e:
+                raise ValueError(f"样式类{name}不合法: {e}")
+    def __repr__(self):
+        return f"StyleSheet({self.path!r},classes={list(self.classes)})"
+    def get(self,name):
+        if name not in self.classes: raise ValueError(f"样式类{name}不存在,已有的样式类:{tuple(self.classes)}")
+        return self.classes[name]
+
+_tg_stylesheets = {} # 绝对路径 -> (修改时间,注册表快照,StyleSheet)
+
+def find_stylesheet():
+    '''依次在当前目录和项目根目录中查找.pytez_style.json，没有时返回None'''
+    for d in (os.getcwd(),os.path.join(os.path.dirname(os.path.abspath(__file__)),os.pardir)):
+        path = os.path.join(d,STYLESHEET_NAME)
+        if os.path.isfile(path): return os.path.abspath(path)
+    return None
+
+def load_stylesheet(path=None):
+    '''加载并编译样式表，path为None时使用find_stylesheet，结果按(路径,修改时间,注册表快照)缓存'''
+    if path is None:
+        path = find_stylesheet()
+        if path is None: raise FileNotFoundError(f"没有找到{STYLESHEET_NAME}")
+    path = os.path.abspath(path)
+    mtime = os.stat(path).st_mtime_ns
+    registry = get_registry() # 样式表按编译时的注册表快照缓存
+    cached = _tg_stylesheets.get(path)
+    if cached is not None and cached[0] == mtime and cached[1] is registry: return cached[2]
+    with open(path,encoding="utf-8") as f:
+        try:
+            sheet = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"{path}不是合法的JSON: {e}")
+    sheet = StyleSheet(sheet,path=path)
+    _tg_stylesheets[path] = (mtime,registry,sheet)
+    return sheet
@@ -0,0 +1,206 @@
+'''此模块提供符号(symbol)的定义和放置，类似SVG的<defs>和<use>。
+
+在Canvas.symbol的with块中调用的绘图函数只记录到符号定义中，不加入Axes。
+Canvas.place将符号以仿射变换放置为SymbolInstance：实例的artist共享定义中的Path对象，
+变换作为patch transform在绘制时与transData组合；实例的锚点由定义中node已缓存的锚点按变换映射得到。
+放置时不重新调用绘图函数，也不复制路径和锚点数据，每个实例只保存自身的变换和artist。
+'''
+import numpy as np
+
+from node import Node,Drawable,TextDrawable,InstancePatch,PAT_node_name,_tg_default_anchors
+from bezier import segment_to_coefs,coefs_to_bbox,transform_coefs
+from matrix import check_transform,get_xys_by_transform
+from utilities import to_xy
+
+
+class Symbol():
+    '''由Canvas.symbol记录的符号定义
+
+    - nodes : 定义中的node，按创建顺序，坐标为符号自身的坐标系
+    定义中命名的node称为部件，可以通过实例的 "部件名" 或 "部件名-锚点" 锚点引用。
+    '''
+    def __init__(self,name) -> None:
+        if not isinstance(name,str) or not PAT_node_name.fullmatch(name): raise ValueError(f"{name}不是支持的符号名")
+        self.name = name
+        self.nodes = []
+        self._parts = {}
+        self._coefs = None
+    def __len__(self):
+        return len(self.nodes)
+    def __repr__(self):
+        return f"Symbol({self.name!r},{len(self.nodes)} nodes)"
+    def add(self,node):
+        if node.name is not None:
+            if node.name in self._parts: raise ValueError(f"{node.name}在符号{self.name}中重复定义")
+            self._parts[node.name] = node
+        self.nodes.append(node)
+        self._coefs = None
+        return node
+    @property
+    def part_names(self):
+        return list(self._parts)
+    def get_part(self,name):
+        '''返回名为name的部件，不存在时返回None'''
+        return self._parts.get(name)
+    def iter_drawables(self):
+        for n in self.nodes:
+            yield from n.drawables
+    def get_coefs(self):
+        '''返回定义中所有路径(包括mark)的系数，用于实例的边框，结果会被缓存'''
+        if self._coefs is None:
+            coefs = [d.get_local_coefs() if isinstance(d,(InstanceDrawable,TextDrawable)) else segment_to_coefs(d._segment) for d in self.iter_drawables()]
+            self._coefs = np.concatenate(coefs) if coefs else np.zeros((0,2,4))
+        return self._coefs
+
+
+class InstanceDrawable(Drawable):
+    '''SymbolInstance的drawable，与定义中的drawable共享路径和样式，只保存自身的变换
+
+    _segment为定义坐标系下的segment(与artist的路径一致)，锚点segment和范围为变换后的值。
+    样式在第一次set时复制。
+    '''
+    __slots__ = ("_source","_matrix")
+    drawtype = "instance"
+    style_types = ()
+    def __init__(self,source,matrix) -> None:
+        if isinstance(source,InstanceDrawable): # 嵌套的符号，变换合并
+            source,matrix = source._source,matrix @ source._matrix
+        elif isinstance(source,TextDrawable): # 文字的字形路径在文字坐标系下
+            matrix = matrix @ source._matrix
+        self._source = source
+        self._matrix = matrix
+        self._kinds = self._vertices = None
+        self._style = source._style
+        self._artist = self._get_artist()
+
+    @property
+    def _segment(self):
+        return self._source._segment
+    def get_description_dict(self):
+        return {
+            "type":self.drawtype,
+            "source":self._source.get_description_dict(),
+            "transform":self._matrix,
+            "style":self._style
+        }
+    @property
+    def supported_style(self):
+        return self._source.supported_style
+    def _check_style(self,**style):
+        return self._source._check_style(**style)
+    def _style_to_mpl_kwargs(self,**style):
+        return self._source._style_to_mpl_kwargs(**style)
+    def set(self,**style):
+        if self._style is self._source._style: self._style = dict(self._style)
+        return super().set(**style)
+
+    def _get_artist(self):
+        src = self._source.get_artist()
+        artist = InstancePatch(src.get_path(),self._matrix)
+        artist.update_from(src)
+        artist.set_zorder(src.get_zorder())
+        return artist
+    def set_matrix(self,matrix):
+        self._matrix = matrix
+        self._artist.set_matrix(matrix)
+    def set_segment(self,segment):
+        raise ValueError("符号实例的路径与定义共享，不能单独设置segment")
+    def transform(self,mat):
+        self.set_matrix(check_transform(mat) @ self._matrix)
+
+    def get_local_coefs(self):
+        return transform_coefs(segment_to_coefs(self._source._segment),self._matrix)
+    def get_datalim(self):
+        return coefs_to_bbox(self.get_local_coefs())
+    def get_anchor_segment(self):
+        segment = []
+        local = self._source._segment if isinstance(self._source,TextDrawable) else self._source.get_anchor_segment()
+        for kind,*xys in local:
+            segment.append((kind,*get_xys_by_transform(self._matrix,xys)))
+        return segment
+
+
+class SymbolInstance(Node):
+    '''Canvas.place生成的符号实例
+
+    实例的几何与组相同(边框)，另外支持部件锚点：
+    "部件名"为部件的默认锚点，"部件名-锚点"为部件的对应锚点，均在定义坐标系下求值(结果缓存在定义中，所有实例共享)后按实例的变换映射。
+    '''
+    __slots__ = ("symbol","_matrix")
+    def __init__(self,symbol,matrix,name=None) -> None:
+        if not len(symbol): raise ValueError(f"符号{symbol.name}中没有node")
+        self.symbol = symbol
+        self._matrix = check_transform(matrix)
+        super().__init__([InstanceDrawable(d,self._matrix) for d in symbol.iter_drawables()],name=name)
+    @property
+    def matrix(self):
+        return self._matrix.copy()
+    def get_description_dict(self):
+        return {
+            "name":self.name,
+            "symbol":self.symbol.name,
+            "drawables":[d.get_description_dict() for d in self.drawables]
+        }
+
+    def _build_geometry(self):
+        self._bbox = self._flat_cache = self._anchor_cache = None
+        mat = self._matrix
+        if mat[0,1] == 0 and mat[1,0] == 0: # 没有旋转和错切时，由定义的边框直接映射
+            (xmin,ymin),(xmax,ymax) = coefs_to_bbox(self.symbol.get_coefs())
+            xys = get_xys_by_transform(mat,[(xmin,ymin),(xmax,ymax)])
+            self._bbox = tuple(xys.min(axis=0)),tuple(xys.max(axis=0))
+        else:
+            self._bbox = coefs_to_bbox(transform_coefs(self.symbol.get_coefs(),mat))
+        self._iscontinued,self._isclosed = False,False
+        self._isgroup = self._can_get_intersection = True
+        self._coefs = segment_to_coefs(self._get_bounding_segment()) # 路径为边框
+        (xmin,ymin),(xmax,ymax) = self._bbox
+        self._center = ((xmin + xmax)/2,(ymin + ymax)/2) # 矩形的中心，不需要积分
+        self._length = self._nodeweight = self._length_error = None
+    def contains(self,points,tolerance=1e-3):
+        '''以逆变换将points映射到定义坐标系，在任意一个定义中的node内即为True，tolerance按变换的缩放折算'''
+        points = np.asarray(points,dtype=float).reshape(-1,2)
+        result = np.zeros(len(points),dtype=bool)
+        if len(points) == 0: return result
+        (xmin,ymin),(xmax,ymax) = self._get_bounding_box()
+        idx = np.nonzero((points[:,0] >= xmin) & (points[:,0] <= xmax) & (points[:,1] >= ymin) & (points[:,1] <= ymax))[0]
+        if len(idx) == 0: return result
+        local = get_xys_by_transform(np.linalg.inv(self._matrix),points[idx])
+        tolerance = tolerance/max(np.sqrt(abs(np.linalg.det(self._matrix[:2,:2]))),1e-12)
+        inside = np.zeros(len(idx),dtype=bool)
+        for node in self.symbol.nodes:
+            if node.drawables: inside |= node.contains(local,tolerance)
+        result[idx] = inside
+        return result
+    def update_geometry(self,*segments,anchors=None):
+        raise ValueError("SymbolInstance与定义共享路径，不支持按segment更新，请使用apply_transform")
+    def apply_transform(self,mat):
+        mat = check_transform(mat)
+        self._matrix = mat @ self._matrix
+        for d in self.drawables:
+            d.set_matrix(self._matrix)
+        for anchor,xy in (self._anchor_dct or {}).items():
+            self._anchor_dct[anchor] = to_xy(get_xys_by_transform(mat,xy)[0])
+        self._build_geometry()
+        self._notify("geometry")
+
+    # 锚点
+    def _split_part_anchor(self,anchor):
+        '''将 "部件名" 或 "部件名-锚点" 拆分为 (部件,锚点)，不是部件锚点时返回None'''
+        part = self.symbol.get_part(anchor)
+        if part is not None: return part,None
+        i = anchor.rfind("-")
+        while i > 0:
+            part = self.symbol.get_part(anchor[:i])
+            if part is not None: return part,anchor[i+1:]
+            i = anchor.rfind("-",0,i)
+        return None
+    def calculate_anchors(self,anchor=None):
+        '''实例自身的默认锚点和自定义锚点优先，其次为部件锚点'''
+        if isinstance(anchor,str) and anchor not in _tg_default_anchors and (self._anchor_dct is None or anchor not in self._anchor_dct):
+            found = self._split_part_anchor(anchor)
+            if found is not None:
+                part,sub = found
+                xy = part.calculate_anchors(sub)
+                return self._matrix[:2,:2] @ np.asarray(xy,dtype=float) + self._matrix[:2,2]
+        return super().calculate_anchors(anchor)
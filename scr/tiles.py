@@ -0,0 +1,104 @@
+'''此模块提供超大画布的瓦片金字塔渲染。
+
+画布的范围被扩展为正方形，第z层被切分为 2^z x 2^z 块瓦片，按照常见的 z/x/y 目录结构输出，
+y从上往下计数。每块瓦片单独渲染，只包含边框与瓦片相交的node，避免一次渲染整幅巨大的栅格图。
+相邻的瓦片按块分组为进程池的任务，每个任务只携带与该块相交的node，子进程的内存不随整个场景增长。
+
+进程之间传递的是各artist的路径数据和mpl参数，而不是artist本身，子进程不需要重新检查样式。
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.path import Path
+import matplotlib.patches as mpatch
+
+
+def _node_to_specs(node):
+    '''返回node各artist的 (vertices,codes,mpl_kwargs,linewidth)'''
+    specs = []
+    for d in node.drawables:
+        artist = d.get_artist()
+        path = artist.get_patch_transform().transform_path(artist.get_path()) # 符号实例的变换在patch transform中
+        kwargs = d._style_to_mpl_kwargs(**d._style)
+        specs.append((np.asarray(path.vertices,dtype=float),path.codes,kwargs,artist.get_linewidth()))
+    return specs
+
+def get_tile_extent(extent,z,x,y):
+    '''返回第z层(x,y)瓦片的数据范围 (xmin,ymin,xmax,ymax)，extent为正方形的整体范围'''
+    x0,y0,x1,y1 = extent
+    size = (x1 - x0) / 2**z
+    return x0 + x*size, y1 - (y+1)*size, x0 + (x+1)*size, y1 - y*size
+
+def _intersects(bboxes,pad,extent):
+    '''边框(N,4)按pad(N,)扩展后与extent (xmin,ymin,xmax,ymax)相交的掩码'''
+    x0,y0,x1,y1 = extent
+    return ((bboxes[:,0] - pad <= x1) & (bboxes[:,2] + pad >= x0)
+            & (bboxes[:,1] - pad <= y1) & (bboxes[:,3] + pad >= y0))
+
+def _render_tile(path,tile_extent,specs,tile_px,dpi):
+    '''渲染一块瓦片，specs为与瓦片相交的node的artist数据'''
+    fig = Figure(figsize=(tile_px/dpi,tile_px/dpi),dpi=dpi)
+    FigureCanvasAgg(fig)
+    ax = fig.add_axes((0,0,1,1))
+    ax.set_axis_off()
+    ax.set_xlim(tile_extent[0],tile_extent[2])
+    ax.set_ylim(tile_extent[1],tile_extent[3])
+    for node_specs in specs:
+        for vertices,codes,kwargs,_ in node_specs:
+            ax.add_patch(mpatch.PathPatch(Path(vertices,codes),**kwargs))
+    os.makedirs(os.path.dirname(path),exist_ok=True)
+    fig.savefig(path,dpi=dpi,transparent=True)
+    return path
+
+def _render_block(job):
+    '''子进程中渲染一块相邻的瓦片，job只携带与该块相交的node'''
+    tiles,specs,tile_px,dpi = job
+    return [_render_tile(path,tile_extent,[specs[i] for i in indices],tile_px,dpi) for path,tile_extent,indices in tiles]
+
+def render_tiles(canvas,outdir,zoom_levels,tile_px=256,*,processes=None,fmt="png",dpi=72,skip_empty=True,bucket=8):
+    '''将canvas渲染为 outdir/z/x/y.fmt 的瓦片金字塔，返回写入的文件路径列表
+
+    - zoom_levels : int 表示 0..zoom_levels 层，也可以是层号的序列
+    - tile_px : 瓦片的像素边长
+    - processes : 进程池的进程数，默认为cpu数
+    - skip_empty : 不输出没有node的瓦片
+    - bucket : 每个任务渲染 bucket x bucket 块相邻的瓦片，任务只携带与这些瓦片相交的node的数据
+    '''
+    if isinstance(zoom_levels,int): zoom_levels = range(zoom_levels + 1)
+    zoom_levels = list(zoom_levels)
+    if any(int(z) != z or z < 0 for z in zoom_levels): raise ValueError(f"{zoom_levels}不是合法的zoom_levels值,必需为非负整数")
+    if int(bucket) < 1: raise ValueError(f"{bucket}不是合法的bucket值,必需为正整数")
+    nodes = [n for n in canvas.iter_nodes() if n.drawables]
+    specs = [_node_to_specs(n) for n in nodes]
+    # node的边框与最大线宽(像素)
+    bboxes = np.array([np.ravel(n.get_datalim()) for n in nodes],dtype=float).reshape(-1,4)
+    linewidths = np.array([max((s[3] for s in sp),default=0) for sp in specs],dtype=float) * dpi / 72
+    # 正方形的整体范围
+    (x0,x1),(y0,y1) = canvas.ax.get_xlim(),canvas.ax.get_ylim()
+    side = max(x1 - x0,y1 - y0)
+    cx,cy = (x0 + x1)/2,(y0 + y1)/2
+    extent = (cx - side/2,cy - side/2,cx + side/2,cy + side/2)
+    jobs = []
+    for z in zoom_levels:
+        n = 2**z
+        b = min(int(bucket),n)
+        pad = linewidths * (side / n) / tile_px # 线宽在该层的数据长度
+        for bx in range(0,n,b):
+            for by in range(0,n,b):
+                xs,ys = range(bx,min(bx + b,n)),range(by,min(by + b,n))
+                bx0,_,_,by1 = get_tile_extent(extent,z,xs[0],ys[0])
+                _,by0,bx1,_ = get_tile_extent(extent,z,xs[-1],ys[-1])
+                block = np.flatnonzero(_intersects(bboxes,pad,(bx0,by0,bx1,by1)))
+                tiles = []
+                for x in xs:
+                    for y in ys:
+                        tile_extent = get_tile_extent(extent,z,x,y)
+                        indices = np.flatnonzero(_intersects(bboxes[block],pad[block],tile_extent)).tolist() # 块内的序号
+                        if skip_empty and not indices: continue
+                        tiles.append((os.path.join(outdir,str(z),str(x),f"{y}.{fmt}"),tile_extent,indices))
+                if tiles: jobs.append((tiles,[specs[i] for i in block],tile_px,dpi))
+    with ProcessPoolExecutor(max_workers=processes) as pool:
+        return [path for paths in pool.map(_render_block,jobs) for path in paths]
@@ -1,10 +1,16 @@
 
 import numpy as np
 import re
+import functools
 from collections.abc import Iterable
 from matplotlib.path import Path
 
 RE_float = r"-?(\d+(\.\d+)?|\.\d+)"
+## 预编译的正则，供各模块共享
+PAT_float = re.compile(RE_float)
+PAT_percent = re.compile(RE_float + r"%")
+PAT_deg = re.compile(RE_float + r"deg")
+PAT_rad = re.compile(RE_float + r"rad")
 
 
 
@@ -169,17 +175,30 @@ def to_xy(xy):
         raise TypeError(f"{xy} if a bad value for (x,y)")
     return xy 
 
+@functools.lru_cache(maxsize=4096)
+def parse_anchor(anchor):
+    '''将锚点字符串解析为 (kind,value)，结果会被缓存
+
+    - "length" : 长度，如 "15"
+    - "percent" : 百分数，value为0到1的比例，如 "20%"
+    - "rad" : 角度，"30deg"和"0.5rad"都解析为弧度
+    - "name" : 其他字符串，value为原字符串
+    '''
+    if PAT_float.fullmatch(anchor): return "length",float(anchor)
+    if PAT_percent.fullmatch(anchor): return "percent",float(anchor[:-1])/100
+    if PAT_deg.fullmatch(anchor): return "rad",float(np.radians(float(anchor[:-3])))
+    if PAT_rad.fullmatch(anchor): return "rad",float(anchor[:-3])
+    return "name",anchor
+
 def to_rad(angle):
     if isinstance(angle,str):
-        _angle = angle
-        if re.fullmatch(RE_float+r"deg",angle):
-            angle =  np.radians(float(angle[:-3]))
-        elif re.fullmatch(RE_float+r"rad",angle):
-            angle = float(angle[:-3])
+        kind,value = parse_anchor(angle)
+        if kind not in ("rad","length"): raise ValueError(f"{angle}不是合法的angle值")
+        return value
     try:
         angle = float(angle)
     except : 
-        raise ValueError(f"{_angle}不是合法的angle值")
+        raise ValueError(f"{angle}不是合法的angle值")
     return angle
 
 